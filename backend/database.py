@@ -1,5 +1,6 @@
 """Shared database connection module to avoid multiple MongoDB clients"""
 from pymongo import MongoClient
+from motor.motor_asyncio import AsyncIOMotorClient
 import os
 from pathlib import Path
 from dotenv import load_dotenv
@@ -41,3 +42,21 @@ client = MongoClient(
 
 db = client[DATABASE_NAME]
 
+# Non-blocking client for request handlers: awaiting a query yields the event
+# loop to other requests instead of freezing the worker. The blocking client
+# above stays for background threads, startup tasks and CLI tools.
+# Its pool is sized separately (MONGO_ASYNC_POOL_SIZE) because concurrent
+# handlers now genuinely overlap their queries.
+async_client = AsyncIOMotorClient(
+    MONGO_URI,
+    serverSelectionTimeoutMS=5000,
+    connectTimeoutMS=10000,
+    socketTimeoutMS=30000,
+    maxPoolSize=int(os.getenv("MONGO_ASYNC_POOL_SIZE", "10")),
+    minPoolSize=1,
+    retryWrites=True,
+    retryReads=True
+)
+
+async_db = async_client[DATABASE_NAME]
+
@@ -1,22 +1,33 @@
 from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Body, Request
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from starlette.middleware.base import BaseHTTPMiddleware
-from pymongo import MongoClient
+from starlette.background import BackgroundTask
+from starlette.concurrency import run_in_threadpool
+from pymongo import ASCENDING, MongoClient
 from contextlib import asynccontextmanager
 from typing import Optional
 from pathlib import Path
-from datetime import datetime
-import cloudinary
-import cloudinary.uploader
+from datetime import datetime, timedelta
 import torch
-import pickle
-import base64
+import httpx
 import numpy as np
 from facenet_pytorch import MTCNN, InceptionResnetV1
 from PIL import Image
 from dotenv import load_dotenv
 import os
 import gc
+import re
+import json
+import base64
+import hashlib
+import tempfile
+import time
+import asyncio
+import threading
+import secrets
+import socket
+import uuid
 
 # Resolve backend/.env explicitly so we don't pick up the frontend root file
 # Load environment variables BEFORE importing routes that depend on them
@@ -35,7 +46,8 @@ except Exception as e:
 
 # Now import routes after .env is loaded
 from routes.assets import router as assets_router
-from routes.sketches import router as sketches_router
+from routes.sketches import router as sketches_router, ensure_indexes as ensure_sketch_indexes
+from routes.media import router as media_router
 
 # Import auth router with error handling
 print("🔍 Attempting to import auth router...")
@@ -60,9 +72,6 @@ except Exception as e:
 # Validate required environment variables
 REQUIRED_ENV_VARS = [
     "MONGO_URI",
-    "CLOUDINARY_CLOUD_NAME",
-    "CLOUDINARY_API_KEY",
-    "CLOUDINARY_API_SECRET",
     "MOJOAUTH_API_KEY",
     "MOJOAUTH_API_SECRET",
     "MOJOAUTH_BASE_URL",
@@ -71,6 +80,9 @@ REQUIRED_ENV_VARS = [
     "RESEND_TEST_EMAIL",
 ]
 
+if os.getenv("MEDIA_STORAGE", "cloudinary").strip().lower() == "cloudinary":
+    REQUIRED_ENV_VARS += ["CLOUDINARY_CLOUD_NAME", "CLOUDINARY_API_KEY", "CLOUDINARY_API_SECRET"]
+
 missing_env = [var for var in REQUIRED_ENV_VARS if not os.getenv(var)]
 if missing_env:
     missing_str = ", ".join(missing_env)
@@ -96,24 +108,205 @@ def _float_env(key: str, default: float) -> float:
         raise RuntimeError(f"Environment variable {key} must be a float. Got: {value}") from exc
 
 
+def _int_env(key: str, default: int) -> int:
+    """Return integer environment variables with validation."""
+    value = os.getenv(key)
+    if value is None:
+        return int(default)
+    try:
+        return int(value)
+    except ValueError as exc:
+        raise RuntimeError(f"Environment variable {key} must be an integer. Got: {value}") from exc
+
+
 # ---------------- MongoDB ---------------- 
 # Use shared database connection from database.py to avoid multiple connection pools
-from database import client, db
+from database import client, db, async_client, async_db
+from bson import ObjectId
+# Request handlers use the motor (async_*) handles so a slow query never blocks
+# the event loop; the blocking handles serve background threads (change-feed
+# tailer, index rebuilds, shared-gallery writer) and startup migrations.
 collection = db["faces"]
+async_collection = async_db["faces"]
+# One document per enrolled image (see services/face_embeddings.py)
+embeddings_collection = db["face_embeddings"]
+async_embeddings_collection = async_db["face_embeddings"]
+from services import face_embeddings
+
+# ---------------- Embedding Store ----------------
+# Face embeddings live in a memory-mapped file synchronised from the faces
+# collection so the gallery does not have to sit in RAM next to the models.
+from services.embedding_store import EmbeddingStore, StoreLocked
+embedding_store = EmbeddingStore(
+    os.getenv("EMBEDDING_STORE_DIR", str(BASE_DIR / "data" / "embedding_store")),
+    chunk_rows=_int_env("EMBEDDING_SEARCH_CHUNK_ROWS", 4096),
+    compact_ratio=_float_env("EMBEDDING_COMPACT_RATIO", 0.25),
+    compact_min_tombstones=_int_env("EMBEDDING_COMPACT_MIN_TOMBSTONES", 1024),
+)
 
-# ---------------- Cloudinary ---------------- 
-cloudinary.config(
-    cloud_name=os.getenv("CLOUDINARY_CLOUD_NAME"),
-    api_key=os.getenv("CLOUDINARY_API_KEY"),
-    api_secret=os.getenv("CLOUDINARY_API_SECRET"),
-    secure=True,
+# A new node with an empty store loads EMBEDDING_SNAPSHOT_SOURCE (a snapshot file
+# or a peer's /export/snapshot URL) instead of decoding every embedding document.
+from services import snapshot
+embedding_snapshot_source = os.getenv("EMBEDDING_SNAPSHOT_SOURCE", "").strip()
+embedding_snapshot_verify = _bool_env("EMBEDDING_SNAPSHOT_VERIFY", "true")
+
+# With several web workers, GALLERY_INDEX_MODE=shared keeps a single copy of the
+# gallery in shared memory: one elected worker applies changes, all of them search it.
+gallery_index_mode = os.getenv("GALLERY_INDEX_MODE", "local").strip().lower()
+shared_gallery = None
+if gallery_index_mode == "shared":
+    from services.shared_gallery import SharedGallery
+    shared_gallery = SharedGallery(
+        os.getenv("SHARED_GALLERY_NAME", "eyedentify-gallery"),
+        lock_path=Path(embedding_store.directory).parent / "shared_gallery.lock",
+        ring_slots=_int_env("SHARED_GALLERY_RING_SLOTS", 1024),
+        refresh_interval=_float_env("SHARED_GALLERY_REFRESH_SECONDS", 0.5),
+        chunk_rows=embedding_store.chunk_rows,
+    )
+elif gallery_index_mode != "local":
+    raise RuntimeError(f"GALLERY_INDEX_MODE must be 'local' or 'shared'. Got: {gallery_index_mode}")
+
+# Large galleries can be scanned by a pool of SEARCH_PARTITIONS worker processes,
+# each scoring one slice of the on-disk store. Below SEARCH_PARTITION_MIN_ROWS the
+# in-process scan is cheaper than the fan-out.
+search_partitions = _int_env("SEARCH_PARTITIONS", 1)
+search_partition_min_rows = _int_env("SEARCH_PARTITION_MIN_ROWS", 50000)
+partitioned_searcher = None
+if search_partitions > 1:
+    from services.parallel_search import PartitionedSearcher
+    partitioned_searcher = PartitionedSearcher(search_partitions, chunk_rows=embedding_store.chunk_rows)
+
+# ---------------- Change Feed ----------------
+# Every faces mutation is also logged to face_changes with a monotonically
+# increasing seq; each replica tails it from the resume token kept in its store.
+from services.change_feed import (
+    ChangeFeed, ChangeFeedTailer, OP_APPEND, OP_CLEAR, OP_DELETE, OP_REMOVE_EMBEDDING, OP_REPLACE_EMBEDDING,
+    OP_UPDATE, OP_UPSERT,
+)
+# Records written by this process carry its origin; its own tailer skips them
+change_feed = ChangeFeed(
+    db, retention_days=_float_env("CHANGE_FEED_RETENTION_DAYS", 7), async_db=async_db,
+    origin=f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}",
 )
+change_feed_poll_seconds = _float_env("CHANGE_FEED_POLL_SECONDS", 1.0)
+
+# ---------------- Cluster ----------------
+# CLUSTER_ROLE=shard: index only the faces hashing to SHARD_INDEX of SHARD_COUNT.
+# CLUSTER_ROLE=coordinator: keep no local index, scatter queries to SHARD_URLS.
+# Shards follow enrollment changes through the change feed, not coordinator pushes.
+from services.cluster import ClusterCoordinator, SHARD_TOKEN_HEADER, decode_vector, shard_for
+cluster_role = os.getenv("CLUSTER_ROLE", "standalone").strip().lower()
+shard_index = _int_env("SHARD_INDEX", 0)
+shard_count = _int_env("SHARD_COUNT", 1)
+shard_token = os.getenv("SHARD_TOKEN")
+if cluster_role in ("shard", "coordinator") and not shard_token:
+    # /internal/shard/* would otherwise answer anyone who can reach the node
+    raise RuntimeError(f"CLUSTER_ROLE={cluster_role} requires SHARD_TOKEN")
+cluster_coordinator: Optional[ClusterCoordinator] = None
+if cluster_role == "coordinator":
+    cluster_coordinator = ClusterCoordinator(
+        [url.strip() for url in os.getenv("SHARD_URLS", "").split(",") if url.strip()],
+        timeout=_float_env("SHARD_TIMEOUT_SECONDS", 2.0),
+        token=shard_token,
+    )
+elif cluster_role == "shard":
+    if not 0 <= shard_index < shard_count:
+        raise RuntimeError(f"SHARD_INDEX must be between 0 and SHARD_COUNT-1. Got: {shard_index}/{shard_count}")
+elif cluster_role != "standalone":
+    raise RuntimeError(f"CLUSTER_ROLE must be 'standalone', 'shard' or 'coordinator'. Got: {cluster_role}")
+
+
+def _owns_face(face_id: str) -> bool:
+    """Whether this node indexes the given face (always true outside shard mode)"""
+    return cluster_role != "shard" or shard_for(face_id, shard_count) == shard_index
+
+# ---------------- Media storage ---------------- 
+# MEDIA_STORAGE=cloudinary: uploads are spooled and pushed by background workers,
+# documents hold a /media/pending placeholder until the upload lands.
+# MEDIA_STORAGE=local: written straight to the content-addressed store.
+from services.media_storage import UnsupportedMediaType, media_storage
+from services.upload_queue import upload_queue, url_target
+from services.thumbnails import thumbnails
+
+FACE_IMAGE_TARGETS = [url_target("faces", "image_urls", array=True), url_target("face_embeddings", "image_url")]
+
+
+async def _stage_face_upload(request: Request, file: UploadFile, public_id: str):
+    """Spool an enrollment photo for background upload; store ``job.placeholder`` as its URL"""
+    file.file.seek(0)
+    data = await run_in_threadpool(file.file.read)
+    try:
+        return await run_in_threadpool(
+            upload_queue.stage, data, "faces", public_id, FACE_IMAGE_TARGETS, base_url=str(request.base_url),
+        )
+    except UnsupportedMediaType as e:
+        raise HTTPException(status_code=415, detail=str(e))
 
 # ---------------- FaceNet ---------------- 
 # Global variables for ML models (loaded at startup)
 device: Optional[torch.device] = None
+from services.face_detection import CoarseToFineDetector
+from services.inference import FaceNetRunner
 mtcnn: Optional[MTCNN] = None
+face_detector: Optional[CoarseToFineDetector] = None
 facenet: Optional[InceptionResnetV1] = None
+facenet_runner: Optional[FaceNetRunner] = None
+# Channels-last helps FaceNet's convolutions on some CPUs only; measure with
+# tools/bench_facenet_inference.py before enabling
+facenet_channels_last = _bool_env("FACENET_CHANNELS_LAST", "false")
+
+# ---------------- Inference executor ----------------
+# inline: one inference slot with a single torch thread (small tiers)
+# pool:   the CPU budget (affinity and cgroup quota) is split into
+#         INFERENCE_SLOTS concurrent slots of INFERENCE_THREADS_PER_SLOT
+#         threads each (0 = choose automatically, e.g. 16 CPUs -> 4 x 4)
+from services.inference_pool import InferenceExecutor, detect_cpu_budget, plan_slots
+inference_executor_mode = os.getenv("INFERENCE_EXECUTOR", "inline").strip().lower()
+if inference_executor_mode not in {"inline", "pool"}:
+    raise RuntimeError(f"INFERENCE_EXECUTOR must be 'inline' or 'pool'. Got: {inference_executor_mode}")
+inference_threads = 1
+if inference_executor_mode == "pool":
+    cpu_budget = detect_cpu_budget()
+    inference_slots, inference_threads = plan_slots(
+        cpu_budget,
+        _int_env("INFERENCE_SLOTS", 0),
+        _int_env("INFERENCE_THREADS_PER_SLOT", 0),
+    )
+    inference_executor = InferenceExecutor(inference_slots, inference_threads)
+    print(f"🧵 Inference pool: {inference_slots} slots x {inference_threads} threads ({cpu_budget} CPUs available)")
+else:
+    # Still off the event loop: a model call made inline would block every other
+    # request from even reaching admission, so nothing would ever queue or be shed
+    inference_executor = InferenceExecutor(1, inference_threads)
+_model_lock = threading.Lock()
+
+# ---------------- Memory governor ----------------
+# Garbage collection runs only when RSS crosses MEMORY_SOFT_LIMIT_MB /
+# MEMORY_HARD_LIMIT_MB (defaults: 75% / 90% of the container limit).
+from services.memory_governor import governor as memory_governor
+
+# ---------------- Admission control ----------------
+# Inference requests beyond the available slots wait in bounded per-class
+# queues; when a queue is full or a request waits longer than
+# INFERENCE_QUEUE_TIMEOUT_SECONDS it is shed with 503 + Retry-After.
+# INFERENCE_RESERVED_INTERACTIVE slots are kept free of enrollment work.
+from services.admission import AdmissionController, BULK, INTERACTIVE, Overloaded
+admission = AdmissionController(
+    capacity=inference_executor.slots,
+    reserved_interactive=_int_env("INFERENCE_RESERVED_INTERACTIVE", 1),
+    max_queue=_int_env("INFERENCE_QUEUE_DEPTH", 8),
+    max_bulk_queue=_int_env("INFERENCE_BULK_QUEUE_DEPTH", 4),
+    deadline=_float_env("INFERENCE_QUEUE_TIMEOUT_SECONDS", 10.0),
+)
+if admission.bulk_limit >= admission.capacity and _int_env("INFERENCE_RESERVED_INTERACTIVE", 1) > 0:
+    print("⚠️ One inference slot: nothing can be reserved for recognition; it is only dequeued ahead of enrollment")
+# Coarse-to-fine detection: MTCNN runs on a proxy whose longest side is
+# DETECT_PROXY_SIDE px, the face is cropped from the image downscaled to at
+# most DETECT_FULL_MAX_SIDE px. The no-face fallback also runs at that size, so
+# the default matches the old 800px single pass rather than exceeding it.
+detect_proxy_side = _int_env("DETECT_PROXY_SIDE", 400)
+detect_min_face_fraction = _float_env("DETECT_MIN_FACE_FRACTION", 0.06)
+detect_full_max_side = _int_env("DETECT_FULL_MAX_SIDE", 800)
 models_ready = False
 recognition_threshold = _float_env("RECOGNITION_THRESHOLD", 0.50)
 rejection_threshold = _float_env("REJECTION_THRESHOLD", 0.30)
@@ -122,31 +315,80 @@ rejection_threshold = _float_env("REJECTION_THRESHOLD", 0.30)
 # Default to lazy loading unless explicitly overridden via MODEL_AUTO_LOAD.
 model_auto_load = _bool_env("MODEL_AUTO_LOAD", "false")
 
-# ---------------- Utils ----------------
-def _fixed_image_standardization(x):
-    return (x - 0.5) / 0.5
-
+# ---------------- Enrollment quality ----------------
+# Uploads scoring below ENROLL_MIN_QUALITY (no face found, tiny, blurry or
+# profile) are rejected; each identity keeps at most MAX_EMBEDDINGS_PER_FACE
+# embeddings, chosen for quality and diversity (0 = unlimited).
+from services import face_quality
+from services import gallery_export
+enroll_min_quality = _float_env("ENROLL_MIN_QUALITY", 0.05)
+max_embeddings_per_face = _int_env("MAX_EMBEDDINGS_PER_FACE", 10)
+# Enrollments of one identity are serialized by a lease on its faces document
+# so concurrent uploads cannot both pass the cap; a crashed holder's lease expires
+ENROLL_LEASE_SECONDS = 30
+enroll_lease_wait_seconds = _float_env("ENROLL_LEASE_WAIT_SECONDS", 10)
+
+# Aligned 160x160 crops of enrolled faces, kept so the gallery can be
+# re-embedded offline without refetching originals (tools/reembed_from_crops.py)
+from services.crop_store import CropStore, crop_from_tensor
+crop_store = CropStore(os.getenv("CROP_STORE_DIR", str(BASE_DIR / "data" / "face_crops")))
+
+# ---------------- Idle model unloading ----------------
+# With MODEL_IDLE_UNLOAD_SECONDS > 0 the models are dropped after that long
+# without inference and reloaded on the next request from frozen weights in
+# MODEL_CACHE_DIR. MODEL_MIN_RESIDENT_SECONDS is the hysteresis: a freshly
+# (re)loaded model stays resident at least that long so bursty traffic does
+# not thrash between loading and unloading.
+from services.model_cache import load_facenet
+model_cache_dir = os.getenv("MODEL_CACHE_DIR", str(BASE_DIR / "data" / "models"))
+model_idle_unload_seconds = _float_env("MODEL_IDLE_UNLOAD_SECONDS", 0)
+model_min_resident_seconds = _float_env("MODEL_MIN_RESIDENT_SECONDS", 600)
+_models_in_use = 0
+_model_stats = {
+    "loads": 0,
+    "unloads": 0,
+    "last_load_seconds": None,
+    "last_load_source": None,
+    "loaded_at": None,
+    "last_used": None,
+}
+_model_idle_stop = threading.Event()
+_model_idle_thread: Optional[threading.Thread] = None
 
+# ---------------- Utils ----------------
 def _load_models():
     """Load ML models synchronously with memory optimisations."""
-    global device, mtcnn, facenet, models_ready
-
     if models_ready and mtcnn is not None and facenet is not None:
         return
 
+    with _model_lock:
+        # Another inference slot may have finished loading while we waited
+        if models_ready and mtcnn is not None and facenet is not None:
+            return
+        _load_models_locked()
+
+
+def _load_models_locked():
+    global device, mtcnn, face_detector, facenet, facenet_runner, models_ready
+
     print("📦 Initialising ML models...")
+    started = time.perf_counter()
 
     try:
         device = torch.device("cpu")
         print(f"🔧 Using device: {device}")
 
-        torch.set_num_threads(1)
+        torch.set_num_threads(inference_threads)
         if hasattr(torch, "set_num_interop_threads"):
-            torch.set_num_interop_threads(1)
+            try:
+                torch.set_num_interop_threads(1)
+            except RuntimeError:
+                # Can only be set once per process; already done by an earlier load
+                pass
 
         os.environ["PYTORCH_CUDA_ALLOC_CONF"] = "max_split_size_mb:128"
 
-        gc.collect()
+        memory_governor.collect()
         if torch.cuda.is_available():
             torch.cuda.empty_cache()
 
@@ -161,18 +403,29 @@ def _load_models():
         )
         print("✓ MTCNN model loaded")
 
-        gc.collect()
+        memory_governor.collect()
 
         print("📥 Loading FaceNet model...")
-        facenet_local = InceptionResnetV1(pretrained="vggface2").eval()
-        facenet_local = facenet_local.to(device)
+        facenet_local, source = load_facenet(model_cache_dir, "vggface2", device)
         facenet_local.requires_grad_(False)
-        print("✓ FaceNet model loaded")
+        print(f"✓ FaceNet model loaded ({source})")
 
         mtcnn = mtcnn_local
+        face_detector = CoarseToFineDetector(mtcnn_local, detect_proxy_side, detect_min_face_fraction)
         facenet = facenet_local
+        facenet_runner = FaceNetRunner(facenet_local, device, channels_last=facenet_channels_last)
         models_ready = True
-        print("✅ ML models initialised successfully")
+        # Long-lived model objects no longer need to be traversed by every collection
+        memory_governor.freeze()
+        now = time.monotonic()
+        _model_stats.update(
+            loads=_model_stats["loads"] + 1,
+            last_load_seconds=round(time.perf_counter() - started, 3),
+            last_load_source=source,
+            loaded_at=now,
+            last_used=now,
+        )
+        print(f"✅ ML models initialised successfully in {_model_stats['last_load_seconds']}s")
 
     except MemoryError as e:
         print(f"❌ Out of memory while loading ML models: {e}")
@@ -180,55 +433,145 @@ def _load_models():
         import traceback
         traceback.print_exc()
         mtcnn = None
+        face_detector = None
         facenet = None
+        facenet_runner = None
         models_ready = False
     except Exception as e:
         print(f"❌ Error loading ML models: {e}")
         import traceback
         traceback.print_exc()
         mtcnn = None
+        face_detector = None
         facenet = None
+        facenet_runner = None
         models_ready = False
 
 
-def get_embedding(file: UploadFile):
-    """Get face embedding from uploaded image with memory cleanup and optimized image processing"""
-    if mtcnn is None or facenet is None or not models_ready:
-        _load_models()
-    if mtcnn is None or facenet is None or not models_ready:
-        raise HTTPException(status_code=503, detail="ML models not loaded yet. Please wait and try again.")
+def _acquire_models():
+    """Load the models if needed and pin them for one inference call"""
+    global _models_in_use
+    with _model_lock:
+        if not (models_ready and mtcnn is not None and facenet is not None):
+            _load_models_locked()
+        if not (models_ready and mtcnn is not None and facenet is not None):
+            raise HTTPException(status_code=503, detail="ML models not loaded yet. Please wait and try again.")
+        _models_in_use += 1
+        _model_stats["last_used"] = time.monotonic()
+
+
+def _release_models():
+    global _models_in_use
+    with _model_lock:
+        _models_in_use -= 1
+        _model_stats["last_used"] = time.monotonic()
+
+
+def _unload_models_locked():
+    global mtcnn, face_detector, facenet, facenet_runner, models_ready
+    mtcnn = None
+    face_detector = None
+    facenet = None
+    facenet_runner = None
+    models_ready = False
+    _model_stats["unloads"] += 1
+    _model_stats["loaded_at"] = None
+    # The models were frozen out of the collector at load time
+    memory_governor.unfreeze()
+    memory_governor.collect()
+
+
+def _models_idle_for() -> Optional[float]:
+    """Seconds since the last inference, or None if the models are not loaded"""
+    if not models_ready or _model_stats["last_used"] is None:
+        return None
+    return time.monotonic() - _model_stats["last_used"]
+
+
+def _model_idle_watcher():
+    interval = max(1.0, min(30.0, model_idle_unload_seconds / 4))
+    while not _model_idle_stop.wait(interval):
+        with _model_lock:
+            idle = _models_idle_for()
+            if idle is None or _models_in_use or idle < model_idle_unload_seconds:
+                continue
+            if time.monotonic() - _model_stats["loaded_at"] < model_min_resident_seconds:
+                continue
+            print(f"💤 Unloading ML models after {idle:.0f}s without inference")
+            _unload_models_locked()
+
+
+def _model_metrics() -> dict:
+    idle = _models_idle_for()
+    loaded_at = _model_stats["loaded_at"]
+    return {
+        "loaded": models_ready,
+        "in_use": _models_in_use,
+        "idle_seconds": round(idle, 1) if idle is not None else None,
+        "resident_seconds": round(time.monotonic() - loaded_at, 1) if loaded_at is not None else None,
+        "idle_unload_seconds": model_idle_unload_seconds,
+        "min_resident_seconds": model_min_resident_seconds,
+        "loads": _model_stats["loads"],
+        "unloads": _model_stats["unloads"],
+        "last_load_seconds": _model_stats["last_load_seconds"],
+        "last_load_source": _model_stats["last_load_source"],
+    }
+
+
+def _detect_face(img: Image.Image, timings: Optional[dict] = None):
+    """Detect on a downscaled proxy, then return (aligned crop from img or None, face quality)"""
+    box, prob, points = face_detector.detect(img, timings)
+    if box is None:
+        return None, face_quality.NO_FACE
+    quality = face_quality.score_face(img, box, prob, points)
+    return face_detector.crop(img, box, timings), quality
+
+
+def get_embedding_with_quality(file: UploadFile, timings: Optional[dict] = None):
+    """Get face embedding, the enrollment quality of the detected face and its aligned uint8 crop.
+
+    The crop is None when no face was detected. ``timings``, if given,
+    receives per-stage durations in seconds.
+    """
+    _acquire_models()
     
     img = None
     face = None
     emb = None
     try:
+        started = time.perf_counter()
         file.file.seek(0)
-        img = Image.open(file.file).convert("RGB")
+        img = Image.open(file.file)
+        # Let JPEG decoding skip straight to a reduced scale when the original is far larger than we crop from
+        img.draft("RGB", (detect_full_max_side, detect_full_max_side))
+        img = img.convert("RGB")
         
-        # Optimize: Resize large images early to reduce memory and processing time
-        # FaceNet works on 160x160, so we can safely resize to max 800x800 before processing
+        # Detection runs on a small proxy, so the original only needs to be big
+        # enough to crop a sharp 160x160 face from
         max_dimension = max(img.width, img.height)
-        if max_dimension > 800:
-            ratio = 800 / max_dimension
+        if max_dimension > detect_full_max_side:
+            ratio = detect_full_max_side / max_dimension
             new_width = int(img.width * ratio)
             new_height = int(img.height * ratio)
             img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
+        if timings is not None:
+            timings["decode"] = time.perf_counter() - started
         
-        with torch.no_grad():
-            face = mtcnn(img)
+        with torch.inference_mode():
+            face, quality = _detect_face(img, timings)
+            crop = crop_from_tensor(face) if face is not None else None
+            started = time.perf_counter()
             if face is None:
                 # If MTCNN fails, resize to 160x160 for direct processing
                 img_resized = img.resize((160, 160), Image.Resampling.LANCZOS)
-                face = torch.from_numpy(np.array(img_resized)).permute(2,0,1).float()/255.0
-                face = _fixed_image_standardization(face)
-            if face.ndim == 3:
-                face = face.unsqueeze(0)
-            face = face.to(device)
-            emb = facenet(face)
-            emb = emb.squeeze(0).cpu().numpy().astype("float32")
-            emb = emb / (np.linalg.norm(emb)+1e-10)
-            result = emb.copy()  # Create a copy to return
-            return result
+                emb = facenet_runner.embed_pixels(np.asarray(img_resized))
+                img_resized.close()
+            else:
+                # Copied into this thread's preallocated input buffer
+                emb = facenet_runner.embed(face)[0]
+            if timings is not None:
+                timings["embed"] = time.perf_counter() - started
+            return emb, quality, crop
     finally:
         # Explicit memory cleanup
         if img is not None:
@@ -237,14 +580,49 @@ def get_embedding(file: UploadFile):
             del face
         if emb is not None:
             del emb
-        # Force garbage collection after image processing
-        gc.collect()
+        _release_models()
+        # Collect only if the image pushed RSS over a watermark
+        memory_governor.maybe_collect()
 
-def _encode_embedding(embedding: np.ndarray) -> str:
-    return base64.b64encode(pickle.dumps(embedding.astype("float32"))).decode("utf-8")
 
-def _decode_embedding(b64: str) -> np.ndarray:
-    return pickle.loads(base64.b64decode(b64.encode("utf-8"))).astype("float32")
+def _store_crop(crop: Optional[np.ndarray]) -> Optional[str]:
+    """Persist an aligned crop; a full disk must not fail the enrollment itself"""
+    if crop is None:
+        return None
+    try:
+        return crop_store.put(crop)
+    except Exception as e:
+        print(f"⚠️ Could not cache aligned face crop: {e}")
+        return None
+
+
+async def _run_inference(fn, *args, priority: str = BULK):
+    """Run a blocking model call on an inference slot once admitted (never on the event loop)"""
+    try:
+        async with admission.admit(priority):
+            return await inference_executor.run(fn, *args)
+    except Overloaded as e:
+        raise HTTPException(
+            status_code=503,
+            detail=f"Server busy: {e.reason}. Please retry shortly.",
+            headers={"Retry-After": str(e.retry_after)},
+        )
+
+
+def get_embedding(file: UploadFile):
+    """Get face embedding from uploaded image with memory cleanup and optimized image processing"""
+    return get_embedding_with_quality(file)[0]
+
+
+def _check_enroll_quality(quality: "face_quality.FaceQuality"):
+    """Reject uploads whose face is missing or too poor to be worth a gallery row"""
+    if quality.score < enroll_min_quality:
+        reason = "No face detected" if quality.detection == 0 else "Face quality too low"
+        raise HTTPException(
+            status_code=422,
+            detail=f"{reason} (quality {quality.score:.2f} < {enroll_min_quality:.2f}); "
+                   "upload a sharper, closer, frontal photo",
+        )
 
 def cos_sim(a, b):
     """Optimized cosine similarity using vectorized operations"""
@@ -261,33 +639,311 @@ def cos_sim_batch(query_emb: np.ndarray, embeddings: np.ndarray) -> np.ndarray:
     # Normalize embeddings if needed (they should already be normalized)
     return np.dot(embeddings, query_emb).astype("float32")
 
+def _iter_face_embeddings():
+    """Stream (face_id, embedding_id, embedding) rows from the face_embeddings collection"""
+    for face_id, embedding_id, embedding in face_embeddings.iter_embeddings(embeddings_collection):
+        if _owns_face(face_id):
+            yield face_id, embedding_id, embedding
+
+
+def _rebuild_embedding_store():
+    """Rebuild the on-disk embedding store from the face_embeddings collection"""
+    # Take the change-feed position first: anything logged while we stream is replayed afterwards
+    change_seq = change_feed.latest_seq()
+    embedding_store.rebuild(
+        _iter_face_embeddings(),
+        expected_rows=embeddings_collection.estimated_document_count(),
+        change_seq=change_seq,
+    )
+
+
+def _owned_rows(ids: np.ndarray) -> np.ndarray:
+    """Snapshot row filter: keep only the rows this shard indexes"""
+    return np.fromiter((_owns_face(face_id.decode("ascii")) for face_id in ids["face_id"]), dtype=bool, count=len(ids))
+
+
+def _bootstrap_from_snapshot() -> bool:
+    """Load the store from EMBEDDING_SNAPSHOT_SOURCE (a file path or http(s) URL), if set"""
+    if not embedding_snapshot_source:
+        return False
+    started = time.perf_counter()
+    downloaded = None
+    try:
+        path = embedding_snapshot_source
+        if path.startswith(("http://", "https://")):
+            embedding_store.directory.mkdir(parents=True, exist_ok=True)
+            fd, downloaded = tempfile.mkstemp(dir=embedding_store.directory, suffix=".snap.download")
+            with os.fdopen(fd, "wb") as fh, httpx.stream("GET", path, timeout=60.0, follow_redirects=True) as response:
+                response.raise_for_status()
+                for block in response.iter_bytes(8 * 1024 * 1024):
+                    fh.write(block)
+            path = downloaded
+        info = snapshot.restore_snapshot(
+            embedding_store, path,
+            verify=embedding_snapshot_verify,
+            row_filter=_owned_rows if cluster_role == "shard" else None,
+        )
+    except Exception as e:
+        print(f"⚠️ Could not bootstrap from snapshot {embedding_snapshot_source}: {e}")
+        return False
+    finally:
+        if downloaded and os.path.exists(downloaded):
+            os.unlink(downloaded)
+    print(f"✓ Embedding store loaded from snapshot in {time.perf_counter() - started:.1f}s "
+          f"({embedding_store.live_count} of {info.rows} embeddings, change seq {info.change_seq})")
+    return True
+
+
+def _ensure_embedding_store() -> EmbeddingStore:
+    """Reopen the on-disk embedding store; bootstrap it from a snapshot or MongoDB if it is missing"""
+    if embedding_store.is_open:
+        return embedding_store
+    if embedding_store.open():
+        print(f"✓ Embedding store reopened ({embedding_store.live_count} embeddings)")
+        return embedding_store
+    if _bootstrap_from_snapshot():
+        return embedding_store
+    print("📥 Building embedding store from MongoDB...")
+    _rebuild_embedding_store()
+    print(f"✓ Embedding store built ({embedding_store.live_count} embeddings)")
+    return embedding_store
+
+
+def _gallery_append(face_id: str, embedding_id: str, embedding: np.ndarray):
+    """Add one embedding to the search index (a no-op rewrite if it is already there)"""
+    if cluster_coordinator is not None:
+        # No local index: shards apply the change from the face_changes feed
+        return
+    if not _owns_face(face_id):
+        return
+    # Keyed by embedding_id so a change-feed replay never adds a second row
+    if shared_gallery is not None:
+        shared_gallery.submit_replace_embedding(face_id, embedding_id, embedding)
+    else:
+        _ensure_embedding_store().replace_embedding(face_id, embedding_id, embedding)
+
+
+def _gallery_remove_face(face_id: str):
+    """Remove every embedding of a face from the search index"""
+    if cluster_coordinator is not None:
+        return
+    if not _owns_face(face_id):
+        return
+    if shared_gallery is not None:
+        shared_gallery.submit_remove_face(face_id)
+    else:
+        _ensure_embedding_store().remove_face(face_id)
+
+
+def _gallery_remove_embedding(face_id: str, embedding_id: str):
+    """Remove a single enrolled image from the search index in place"""
+    if cluster_coordinator is not None:
+        return
+    if not _owns_face(face_id):
+        return
+    if shared_gallery is not None:
+        shared_gallery.submit_remove_embedding(embedding_id)
+    else:
+        _ensure_embedding_store().remove_embedding(embedding_id)
+
+
+def _gallery_replace_embedding(face_id: str, embedding_id: str, embedding: np.ndarray):
+    """Overwrite the vector of a single enrolled image in the search index"""
+    if cluster_coordinator is not None:
+        return
+    if not _owns_face(face_id):
+        return
+    if shared_gallery is not None:
+        shared_gallery.submit_replace_embedding(face_id, embedding_id, embedding)
+    else:
+        _ensure_embedding_store().replace_embedding(face_id, embedding_id, embedding)
+
+
+def _gallery_clear():
+    """Empty the search index"""
+    if cluster_coordinator is not None:
+        return
+    if shared_gallery is not None:
+        shared_gallery.submit_clear()
+    else:
+        embedding_store.clear()
+
+
+def _sync_embedding(face_id: str, embedding_id: str):
+    """Make one index row match its face_embeddings document (removing it if the document is gone)"""
+    doc = embeddings_collection.find_one({"_id": ObjectId(embedding_id)}, {"embedding": 1})
+    if doc is None:
+        _gallery_remove_embedding(face_id, embedding_id)
+    else:
+        _gallery_replace_embedding(face_id, embedding_id, face_embeddings.decode_vector(doc["embedding"]))
+
+
+def _sync_face(face_id: str):
+    """Make a face's index rows match its face_embeddings documents, rewriting rows in place"""
+    current = set()
+    for _, embedding_id, embedding in face_embeddings.iter_embeddings(embeddings_collection, ObjectId(face_id)):
+        _gallery_replace_embedding(face_id, embedding_id, embedding)
+        current.add(embedding_id)
+    if _owns_face(face_id):
+        for embedding_id in _ensure_embedding_store().embedding_ids(face_id):
+            if embedding_id not in current:
+                _gallery_remove_embedding(face_id, embedding_id)
+
+
+def _apply_face_change(change: dict):
+    """Apply one face_changes record to the local search index"""
+    if change.get("origin") == change_feed.origin and shared_gallery is None:
+        # The request that wrote it already applied it to this store
+        return
+    op = change.get("op")
+    face_id = change.get("face_id")
+    embedding_id = change.get("embedding_id")
+    if op == OP_CLEAR:
+        _gallery_clear()
+    elif op == OP_DELETE:
+        _gallery_remove_face(face_id)
+    elif op in (OP_APPEND, OP_REPLACE_EMBEDDING):
+        _sync_embedding(face_id, embedding_id)
+    elif op == OP_REMOVE_EMBEDDING:
+        _gallery_remove_embedding(face_id, embedding_id)
+    elif op == OP_UPSERT:
+        _sync_face(face_id)
+
+
+change_feed_tailer = ChangeFeedTailer(
+    change_feed,
+    apply_change=_apply_face_change,
+    load_token=lambda: _ensure_embedding_store().change_seq,
+    save_token=embedding_store.set_change_seq,
+    rebuild=(shared_gallery.request_resync if shared_gallery is not None else _rebuild_embedding_store),
+    interval=change_feed_poll_seconds,
+)
+
+
+_readonly_store: Optional[EmbeddingStore] = None
+
+
+def _search_store() -> EmbeddingStore:
+    """The store this worker may search: its own, or in shared mode (unless it is the
+    writer) a read-only mapping of the writer's files. Never builds one."""
+    global _readonly_store
+    if shared_gallery is None or shared_gallery.is_writer:
+        return _ensure_embedding_store()
+    store = _readonly_store
+    if store is not None and store.is_open:
+        try:
+            current = (os.stat(store.embeddings_path).st_ino, os.stat(store.ids_path).st_ino)
+        except OSError:
+            current = None
+        if current == store.file_key:
+            return store
+    store = EmbeddingStore(embedding_store.directory, dim=embedding_store.dim, chunk_rows=embedding_store.chunk_rows,
+                           read_only=True)
+    if not store.open():
+        raise HTTPException(status_code=503, detail="Gallery index is not ready yet. Please retry shortly.",
+                            headers={"Retry-After": "2"})
+    _readonly_store = store
+    return store
+
+
+def _gallery_search(embedding: np.ndarray, k: int = 1):
+    """Top-k search, served from shared memory when a writer has published the gallery"""
+    if shared_gallery is not None:
+        hits = shared_gallery.search(embedding, k)
+        if hits is not None:
+            return hits
+    store = _search_store()
+    if partitioned_searcher is not None and store.count >= search_partition_min_rows:
+        return partitioned_searcher.search(store, embedding, k)
+    return store.search(embedding, k)
+
 # ---------------- Application Lifespan ---------------- 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Load ML models at startup with memory optimization"""
-    global device, mtcnn, facenet, models_ready
+    global device, mtcnn, face_detector, facenet, facenet_runner, models_ready, _model_idle_thread
     
     print("🚀 Starting application...")
+    if shared_gallery is None and cluster_coordinator is None:
+        # Each local-mode worker writes the store itself: two of them on one directory
+        # would corrupt it, so refuse to start if another process already holds it.
+        try:
+            embedding_store.lock()
+        except StoreLocked as e:
+            raise RuntimeError(
+                f"{e}. With several workers set GALLERY_INDEX_MODE=shared, "
+                "or give each worker its own EMBEDDING_STORE_DIR."
+            ) from e
+    upload_queue.start()
+    if partitioned_searcher is not None and cluster_coordinator is None:
+        # Spawn the search workers now rather than inside the first large query
+        partitioned_searcher.start()
+        print(f"✓ {partitioned_searcher.partitions} search partition workers started")
     if model_auto_load:
         print("📦 Loading ML models at startup (MODEL_AUTO_LOAD=true)...")
         _load_models()
     else:
         print("⏳ MODEL_AUTO_LOAD=false. Models will be loaded on first request.")
+    if model_idle_unload_seconds > 0:
+        _model_idle_stop.clear()
+        _model_idle_thread = threading.Thread(target=_model_idle_watcher, name="model-idle", daemon=True)
+        _model_idle_thread.start()
+        print(f"✓ Models unload after {model_idle_unload_seconds:g}s idle (min resident {model_min_resident_seconds:g}s)")
+
+    try:
+        change_feed.ensure_indexes()
+        thumbnails.ensure_indexes()
+        _ensure_gallery_indexes()
+        await ensure_sketch_indexes()
+        face_embeddings.ensure_indexes(embeddings_collection)
+        migrated = face_embeddings.migrate_legacy_faces(collection, embeddings_collection, change_feed)
+        if migrated:
+            print(f"✓ Migrated {migrated} faces to per-image embedding documents")
+        if cluster_coordinator is not None:
+            print(f"✓ Coordinator mode: scattering queries to {cluster_coordinator.shard_count} shards")
+        elif shared_gallery is not None:
+            shared_gallery.start(
+                _ensure_embedding_store,
+                _rebuild_embedding_store,
+                poll_changes=change_feed_tailer.poll,
+                commit_changes=change_feed_tailer.commit,
+            )
+            print("✓ Shared gallery attached")
+        else:
+            _ensure_embedding_store()
+            change_feed_tailer.start()
+            print(f"✓ Tailing face change feed from seq {embedding_store.change_seq}")
+    except Exception as e:
+        print(f"⚠️ Embedding store not ready at startup: {e}")
     
     print("✅ Application startup complete!")
     
     yield
     
     print("🛑 Shutting down application...")
+    _model_idle_stop.set()
     # Cleanup models on shutdown
     if mtcnn is not None:
         del mtcnn
     if facenet is not None:
         del facenet
     mtcnn = None
+    face_detector = None
     facenet = None
+    facenet_runner = None
     device = None
     models_ready = False
+    change_feed_tailer.stop()
+    if shared_gallery is not None:
+        shared_gallery.stop()
+    if partitioned_searcher is not None:
+        partitioned_searcher.stop()
+    if cluster_coordinator is not None:
+        await cluster_coordinator.close()
+    inference_executor.stop()
+    upload_queue.stop()
+    thumbnails.stop()
+    embedding_store.close()
     gc.collect()
     print("✅ Cleanup complete")
 
@@ -396,11 +1052,12 @@ app.add_middleware(CORSLoggingMiddleware)
 
 # Add memory cleanup middleware to prevent memory leaks
 from middleware.memory import MemoryCleanupMiddleware
-app.add_middleware(MemoryCleanupMiddleware, gc_interval=10)  # Run GC every 10 requests
+app.add_middleware(MemoryCleanupMiddleware, governor=memory_governor)  # Collect only above the RSS watermarks
 
 # Include routes
 app.include_router(assets_router)
 app.include_router(sketches_router)
+app.include_router(media_router)
 
 # Include auth router if it was successfully imported
 print(f"🔍 Checking if auth router exists: {auth_router is not None}")
@@ -426,8 +1083,63 @@ else:
     print("⚠️  Check the import error above to see why the router wasn't imported")
 
 # ---------------- Routes ----------------
+async def _acquire_enroll_lease(face_oid: ObjectId) -> str:
+    """Take the face's enrollment lease with a conditional update; returns its token"""
+    token = uuid.uuid4().hex
+    deadline = time.monotonic() + enroll_lease_wait_seconds
+    while True:
+        now = datetime.utcnow()
+        result = await async_collection.update_one(
+            {"_id": face_oid, "$or": [{"enroll_lease": {"$exists": False}}, {"enroll_lease.expires": {"$lt": now}}]},
+            {"$set": {"enroll_lease": {"token": token, "expires": now + timedelta(seconds=ENROLL_LEASE_SECONDS)}}},
+        )
+        if result.modified_count:
+            return token
+        if time.monotonic() >= deadline:
+            raise HTTPException(status_code=503, detail="Another image is being enrolled for this face. Please retry shortly.",
+                                headers={"Retry-After": "1"})
+        await asyncio.sleep(0.05)
+
+
+async def _release_enroll_lease(face_oid: ObjectId, token: Optional[str]):
+    if token:
+        await async_collection.update_one({"_id": face_oid, "enroll_lease.token": token}, {"$unset": {"enroll_lease": ""}})
+
+
+async def _drop_unreferenced_crops(digests):
+    """Delete cached crops that no embedding document references any more"""
+    for digest in set(filter(None, digests)):
+        if not await async_embeddings_collection.find_one({"crop_sha256": digest}, {"_id": 1}):
+            crop_store.delete(digest)
+
+
+async def _embeddings_to_evict(face_oid: ObjectId, emb: np.ndarray, quality: float):
+    """Apply the per-identity cap to the face's embeddings plus a candidate.
+
+    Returns the stored embedding docs to drop to make room, or None when the
+    candidate itself is not worth keeping.
+    """
+    cursor = async_embeddings_collection.find(
+        {"face_id": face_oid}, {"embedding": 1, "quality": 1, "image_url": 1, "crop_sha256": 1}
+    ).sort("_id", 1)
+    existing = await cursor.to_list(length=None)
+    if len(existing) < max_embeddings_per_face:
+        return []
+
+    vectors = np.stack([face_embeddings.decode_vector(d["embedding"]) for d in existing] + [emb])
+    qualities = [d.get("quality", face_quality.LEGACY_QUALITY) for d in existing] + [quality]
+    keep = set(face_quality.select_diverse(vectors, qualities, max_embeddings_per_face))
+    if len(existing) not in keep:
+        return None
+    return [
+        {"_id": d["_id"], "image_url": d.get("image_url"), "crop_sha256": d.get("crop_sha256")}
+        for i, d in enumerate(existing) if i not in keep
+    ]
+
+
 @app.post("/add_face")
 async def add_face(
+    request: Request,
     name: str = Form(...),
     age: Optional[str] = Form(None),
     crime: Optional[str] = Form(None),
@@ -444,24 +1156,43 @@ async def add_face(
     description = description or ""
     
     emb = None
+    upload_job = None
+    placeholder_saved = False
+    doc = None
+    lease = None
     try:
-        emb = get_embedding(file)
-        file.file.seek(0)
-
-        # Upload image to Cloudinary
-        upload_res = cloudinary.uploader.upload(file.file, folder="faces", public_id=name)
-        image_url = upload_res["secure_url"]
+        emb, quality, crop = await _run_inference(get_embedding_with_quality, file)
+        _check_enroll_quality(quality)
+
+        doc = await async_collection.find_one({"name": name}, {"_id": 1})
+        evicted = []
+        if doc and max_embeddings_per_face > 0:
+            # Held until the new row is written, so the cap is checked against what is stored
+            lease = await _acquire_enroll_lease(doc["_id"])
+            evicted = await _embeddings_to_evict(doc["_id"], emb, quality.score)
+            if evicted is None:
+                # The identity already holds better, more varied images than this one
+                await async_collection.update_one(
+                    {"_id": doc["_id"]},
+                    {"$set": {"age": age, "crime": crime, "description": description}}
+                )
+                return {
+                    "status": "ok",
+                    "message": f"Details updated for {name}; image not stored "
+                               f"(the {max_embeddings_per_face} kept images are higher quality or more varied)",
+                    "stored": False,
+                    "quality": quality.as_dict(),
+                }
+
+        # Upload to Cloudinary happens in the background
+        upload_job = await _stage_face_upload(request, file, name)
+        image_url = upload_job.placeholder
 
-        encoded_emb = _encode_embedding(emb)
-        emb = None  # Clean up embedding after encoding (set to None instead of deleting)
-        
-        doc = collection.find_one({"name": name})
         if doc:
             # update existing
-            collection.update_one(
+            await async_collection.update_one(
                 {"_id": doc["_id"]},
                 {"$push":{
-                    "embeddings": encoded_emb,
                     "image_urls": image_url
                 },
                  "$set":{
@@ -470,144 +1201,314 @@ async def add_face(
                      "description": description
                  }}
             )
+            face_oid = doc["_id"]
         else:
             # insert new
-            collection.insert_one({
+            result = await async_collection.insert_one({
                 "name": name,
                 "age": age,
                 "crime": crime,
                 "description": description,
-                "embeddings": [encoded_emb],
                 "image_urls": [image_url]
             })
+            face_oid = result.inserted_id
+        placeholder_saved = True
 
-        return {"status":"ok","message":f"Face registered for {name}","image_url":image_url}
+        # The embedding gets its own document instead of growing the face document
+        emb_result = await async_embeddings_collection.insert_one(
+            face_embeddings.make_embedding_doc(face_oid, emb, image_url, quality.score, _store_crop(crop))
+        )
+        face_id = str(face_oid)
+        # Only rows this request removed count; an image deleted meanwhile is already gone.
+        # Their media is left to tools/gc_media.py once no document references it
+        evicted = [old for old in evicted
+                   if (await async_embeddings_collection.delete_one({"_id": old["_id"]})).deleted_count]
+        for old in evicted:
+            if old.get("image_url"):
+                await async_collection.update_one({"_id": face_oid}, {"$pull": {"image_urls": old["image_url"]}})
+        await _drop_unreferenced_crops(old.get("crop_sha256") for old in evicted)
+        # Index first, then log: the record is only skipped by this process once it is applied
+        _gallery_append(face_id, str(emb_result.inserted_id), emb)
+        for old in evicted:
+            _gallery_remove_embedding(face_id, str(old["_id"]))
+        await change_feed.record_async(OP_APPEND, face_id, str(emb_result.inserted_id))
+        for old in evicted:
+            await change_feed.record_async(OP_REMOVE_EMBEDDING, face_id, str(old["_id"]))
+        emb = None  # Clean up embedding once it is in the store (set to None instead of deleting)
+
+        return {
+            "status":"ok",
+            "message":f"Face registered for {name}",
+            "image_url":image_url,
+            "stored": True,
+            "quality": quality.as_dict(),
+            "evicted": len(evicted),
+        }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
     finally:
-        # Cleanup and force garbage collection
+        if doc:
+            await _release_enroll_lease(doc["_id"], lease)
+        # Submitted only now, so the upload cannot finish before the documents hold its placeholder;
+        # dropped if the request failed before any document did
+        upload_queue.settle(upload_job, placeholder_saved)
+        # Cleanup; the memory governor collects if RSS is high
         if emb is not None:
             del emb
-        gc.collect()
+        memory_governor.maybe_collect()
+
+async def _recognition_result(hits) -> dict:
+    """Turn the best search hit into the /recognize_face response body"""
+    if not hits:
+        return {"status":"not_recognized","best_score":-1}
+
+    best = hits[0]
+    best_score = best.score
+    if best_score < recognition_threshold:
+        return {"status":"not_recognized","best_score":best_score}
+
+    doc = await async_collection.find_one(
+        {"_id": ObjectId(best.face_id)},
+        {"name": 1, "age": 1, "crime": 1, "description": 1, "image_urls": 1}
+    )
+    if not doc:
+        return {"status":"not_recognized","best_score":best_score}
+
+    # Show the enrolled photo that actually matched
+    image_urls_list = doc.get("image_urls", [])
+    emb_doc = await async_embeddings_collection.find_one({"_id": ObjectId(best.embedding_id)}, {"image_url": 1})
+    best_face = {
+        "name": doc["name"],
+        "age": doc.get("age",""),
+        "crime": doc.get("crime",""),
+        "description": doc.get("description",""),
+        "image_url": emb_doc.get("image_url") if emb_doc and emb_doc.get("image_url") else (image_urls_list[0] if image_urls_list else "")
+    }
+    return {"status":"recognized","similarity":best_score, **best_face}
 
 @app.post("/recognize_face")
 async def recognize_face(file: UploadFile = File(...)):
     """
-    Optimized face recognition with:
-    - Early exit on high-confidence matches (>0.90)
-    - Batch processing for embeddings from same person
-    - Vectorized similarity calculations
-    - Memory-efficient cursor iteration
+    Face recognition against the memory-mapped embedding store:
+    - Chunked streaming search with a running top-k (constant peak memory)
+    - Vectorized similarity calculations per chunk
+    - Only the winning face document is fetched from MongoDB
+    - In coordinator mode the query is scattered to every shard and the
+      response carries a "shards" report (partial results are flagged)
     """
     emb = None
     try:
-        emb = get_embedding(file)
-        
-        # High confidence threshold for early exit (very confident matches)
-        HIGH_CONFIDENCE_THRESHOLD = 0.90
-        
-        # Use cursor iteration instead of loading all faces into memory
-        cursor = collection.find({}, {"name": 1, "age": 1, "crime": 1, "description": 1, "embeddings": 1, "image_urls": 1})
-        
-        best_score = -1
-        best_face = None
-        
-        # Process one document at a time to minimize memory usage
-        for doc in cursor:
-            embeddings_list = doc.get("embeddings", [])
-            image_urls_list = doc.get("image_urls", [])
-            
-            # Optimize: Batch process embeddings for same person when possible
-            if len(embeddings_list) > 1:
-                # Decode all embeddings for this person at once
-                decoded_embs = np.array([_decode_embedding(emb_b64) for emb_b64 in embeddings_list])
-                
-                # Vectorized batch similarity calculation (much faster)
-                similarities = cos_sim_batch(emb, decoded_embs)
-                
-                # Find best match for this person
-                best_idx = int(np.argmax(similarities))
-                max_sim = float(similarities[best_idx])
-                
-                if max_sim > best_score:
-                    best_score = max_sim
-                    best_face = {
-                        "name": doc["name"],
-                        "age": doc.get("age",""),
-                        "crime": doc.get("crime",""),
-                        "description": doc.get("description",""),
-                        "image_url": image_urls_list[best_idx] if best_idx < len(image_urls_list) else image_urls_list[0]
-                    }
-                
-                # Clean up
-                del decoded_embs, similarities
-                
-                # Early exit: If we found a very high confidence match, return immediately
-                if best_score >= HIGH_CONFIDENCE_THRESHOLD:
-                    cursor.close()
-                    return {"status":"recognized","similarity":best_score, **best_face}
-            else:
-                # Single embedding - use optimized single comparison
-                if embeddings_list:
-                    decoded_emb = _decode_embedding(embeddings_list[0])
-                    sim = cos_sim(emb, decoded_emb)
-                    del decoded_emb
-                    
-                    if sim > best_score:
-                        best_score = sim
-                        best_face = {
-                            "name": doc["name"],
-                            "age": doc.get("age",""),
-                            "crime": doc.get("crime",""),
-                            "description": doc.get("description",""),
-                            "image_url": image_urls_list[0] if image_urls_list else ""
-                        }
-                    
-                    # Early exit for high confidence
-                    if best_score >= HIGH_CONFIDENCE_THRESHOLD:
-                        cursor.close()
-                        return {"status":"recognized","similarity":best_score, **best_face}
-            
-            # Clean up document data after processing
-            del embeddings_list, image_urls_list
-        
-        # Clean up cursor
-        cursor.close()
-        
-        if best_score >= recognition_threshold:
-            return {"status":"recognized","similarity":best_score, **best_face}
-        else:
-            return {"status":"not_recognized","best_score":best_score}
+        emb = await _run_inference(get_embedding, file, priority=INTERACTIVE)
+
+        if cluster_coordinator is not None:
+            hits, shard_report = await cluster_coordinator.search(emb, k=1)
+            result = await _recognition_result(hits)
+            return {**result, "shards": shard_report}
+        # The scan (or the partition fan-out) blocks; keep it off the event loop
+        hits = await run_in_threadpool(_gallery_search, emb, 1)
+        return await _recognition_result(hits)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
     finally:
-        # Cleanup embedding and force garbage collection
+        # Cleanup embedding; the memory governor collects if RSS is high
         if emb is not None:
             del emb
-        gc.collect()
+        memory_governor.maybe_collect()
+
+# ---------------- Gallery ----------------
+GALLERY_FIELDS = ("name", "age", "crime", "description", "image_urls", "thumbnails")
+GALLERY_DEFAULT_PAGE = 50
+GALLERY_MAX_PAGE = 500
+# Legacy (unpaged) responses are streamed in batches of this many faces
+GALLERY_STREAM_BATCH = 500
+
+
+def _ensure_gallery_indexes():
+    # Keyset order (name, _id); the crime filter keeps the same order within a crime
+    collection.create_index([("name", ASCENDING), ("_id", ASCENDING)])
+    collection.create_index([("crime", ASCENDING), ("name", ASCENDING), ("_id", ASCENDING)])
+
+
+def _encode_gallery_cursor(doc) -> str:
+    raw = json.dumps([doc.get("name"), str(doc["_id"])], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _decode_gallery_cursor(token: str):
+    try:
+        name, oid = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+        return name, ObjectId(oid)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid gallery cursor")
+
+
+def _gallery_fields(fields: Optional[str]) -> tuple:
+    if not fields:
+        return GALLERY_FIELDS
+    selected = tuple(f.strip() for f in fields.split(",") if f.strip())
+    unknown = [f for f in selected if f not in GALLERY_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown gallery fields: {', '.join(unknown)}")
+    return selected
+
+
+async def _gallery_page(docs, fields: tuple) -> list:
+    """Shape face documents for the response, attaching thumbnails if requested"""
+    thumbs = {}
+    if "thumbnails" in fields:
+        thumbs = await thumbnails.lookup(url for doc in docs for url in doc.get("image_urls", []))
+    defaults = {"name": "Unknown", "age": "", "crime": "", "description": ""}
+    faces = []
+    for doc in docs:
+        face = {f: doc.get(f, defaults[f]) for f in fields if f in defaults}
+        if "image_urls" in fields:
+            face["image_urls"] = doc.get("image_urls", [])
+        if "thumbnails" in fields:
+            # Aligned with image_urls; None until generated
+            face["thumbnails"] = [thumbs.get(url) for url in doc.get("image_urls", [])]
+        faces.append(face)
+    return faces
+
 
 @app.get("/gallery")
-async def gallery():
-    """Get gallery with projection to exclude large embeddings field"""
-    faces_list = []
-    # Use projection to exclude embeddings (large field) to save memory
-    cursor = collection.find({}, {"name": 1, "age": 1, "crime": 1, "description": 1, "image_urls": 1})
+async def gallery(
+    request: Request,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    name_prefix: Optional[str] = None,
+    crime: Optional[str] = None,
+):
+    """List enrolled faces in (name, _id) order.
+
+    Pass ``limit`` (and then the returned ``next_cursor``) to page through
+    the gallery; without either, every face is streamed in one response.
+    ``fields`` selects response fields, ``name_prefix`` (case-sensitive) and
+    ``crime`` (exact) filter. The ETag follows the change-feed sequence, so an
+    unchanged page answers ``If-None-Match`` with 304.
+    """
+    selected = _gallery_fields(fields)
+    paged = limit is not None or cursor is not None
+    if paged:
+        limit = max(1, min(int(limit or GALLERY_DEFAULT_PAGE), GALLERY_MAX_PAGE))
+
+    version = await change_feed.version_async()
+    params = json.dumps([limit, cursor, selected, name_prefix, crime])
+    etag = f'W/"{version}-{hashlib.sha1(params.encode()).hexdigest()[:12]}"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag in [tag.strip() for tag in request.headers.get("if-none-match", "").split(",")]:
+        return Response(status_code=304, headers=headers)
+
+    query = {}
+    if name_prefix:
+        query["name"] = {"$regex": "^" + re.escape(name_prefix)}
+    if crime is not None:
+        query["crime"] = crime
+    if cursor:
+        after_name, after_id = _decode_gallery_cursor(cursor)
+        keyset = {"$or": [{"name": {"$gt": after_name}}, {"name": after_name, "_id": {"$gt": after_id}}]}
+        query = {"$and": [query, keyset]} if query else keyset
+
+    # Only the fields the response needs; never the legacy embeddings arrays
+    projection = {f: 1 for f in selected if f != "thumbnails"}
+    projection["name"] = 1  # cursor key
+    if "thumbnails" in selected:
+        projection["image_urls"] = 1
+    sort = [("name", ASCENDING), ("_id", ASCENDING)]
+
+    if paged:
+        docs = await async_collection.find(query, projection).sort(sort).limit(limit + 1).to_list(length=limit + 1)
+        has_more = len(docs) > limit
+        docs = docs[:limit]
+        return JSONResponse(
+            {
+                "faces": await _gallery_page(docs, selected),
+                "next_cursor": _encode_gallery_cursor(docs[-1]) if has_more else None,
+                "limit": limit,
+            },
+            headers=headers,
+        )
+
+    async def stream():
+        db_cursor = async_collection.find(query, projection).sort(sort).batch_size(GALLERY_STREAM_BATCH)
+        try:
+            yield '{"faces":['
+            first = True
+            batch = []
+            async for doc in db_cursor:
+                batch.append(doc)
+                if len(batch) < GALLERY_STREAM_BATCH:
+                    continue
+                for face in await _gallery_page(batch, selected):
+                    yield ("" if first else ",") + json.dumps(face)
+                    first = False
+                batch = []
+            for face in await _gallery_page(batch, selected):
+                yield ("" if first else ",") + json.dumps(face)
+                first = False
+            yield "]}"
+        finally:
+            await db_cursor.close()
+
+    return StreamingResponse(stream(), media_type="application/json", headers=headers)
+
+@app.get("/export/faces")
+async def export_faces(format: str = "ndjson", embeddings: bool = False):
+    """Stream every face (optionally with base64 float32 embeddings) as NDJSON or chunked JSON"""
+    if format not in gallery_export.FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of: {', '.join(gallery_export.FORMATS)}")
+    filename = f"faces-{datetime.utcnow().strftime('%Y%m%dT%H%M%S')}.{format}"
+    return StreamingResponse(
+        gallery_export.export_faces(async_collection, async_embeddings_collection, format, embeddings),
+        media_type=gallery_export.FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+def _write_gallery_snapshot(path: str, source: str) -> "snapshot.SnapshotInfo":
+    if source == "store":
+        chunks, change_seq = snapshot.store_chunks(_search_store())
+    else:
+        # Position first: changes made while streaming are replayed by the importer
+        change_seq = change_feed.latest_seq()
+        chunks = snapshot.row_chunks(_iter_face_embeddings())
+    return snapshot.write_snapshot(path, chunks, change_seq, dim=embedding_store.dim, source=source)
+
+@app.get("/export/snapshot")
+async def export_snapshot(source: Optional[str] = None):
+    """Binary gallery snapshot (see services/snapshot.py) for bootstrapping another node"""
+    if source is None:
+        source = "mongo" if cluster_coordinator is not None else "store"
+    if source not in ("store", "mongo"):
+        raise HTTPException(status_code=400, detail="source must be 'store' or 'mongo'")
+    if source == "store" and cluster_coordinator is not None:
+        raise HTTPException(status_code=400, detail="Coordinators keep no local store; use source=mongo")
+    embedding_store.directory.mkdir(parents=True, exist_ok=True)
+    fd, path = tempfile.mkstemp(dir=embedding_store.directory, suffix=".snap.export")
+    os.close(fd)
     try:
-        for doc in cursor:
-            faces_list.append({
-                "name": doc.get("name","Unknown"),
-                "age": doc.get("age",""),
-                "crime": doc.get("crime",""),
-                "description": doc.get("description",""),
-                "image_urls": doc.get("image_urls", [])
-            })
-    finally:
-        cursor.close()
-    return {"faces": faces_list}
+        info = await run_in_threadpool(_write_gallery_snapshot, path, source)
+    except Exception:
+        os.unlink(path)
+        raise
+    filename = f"gallery-{datetime.utcnow().strftime('%Y%m%dT%H%M%S')}.snap"
+    return FileResponse(
+        path,
+        media_type=snapshot.MEDIA_TYPE,
+        filename=filename,
+        headers={"X-Snapshot-Rows": str(info.rows), "X-Snapshot-Change-Seq": str(info.change_seq)},
+        background=BackgroundTask(os.unlink, path),
+    )
 
 @app.post("/clear_db")
 async def clear_db():
-    collection.delete_many({})
+    await async_collection.delete_many({})
+    await async_embeddings_collection.delete_many({})
+    _gallery_clear()
+    await change_feed.record_async(OP_CLEAR)
     return {"status": "ok", "message": "Database cleared"}
 
 # ---------------- CRUD for faces ----------------
@@ -619,9 +1520,10 @@ async def update_face(name: str, payload: dict = Body(...)):
         if not update_fields:
             raise HTTPException(status_code=400, detail="No valid fields to update")
 
-        result = collection.update_one({"name": name}, {"$set": update_fields})
-        if result.matched_count == 0:
+        updated = await async_collection.find_one_and_update({"name": name}, {"$set": update_fields}, projection={"_id": 1})
+        if updated is None:
             raise HTTPException(status_code=404, detail="Face not found")
+        await change_feed.record_async(OP_UPDATE, str(updated["_id"]))
         return {"status": "ok", "message": "Face updated"}
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -630,39 +1532,211 @@ async def update_face(name: str, payload: dict = Body(...)):
 @app.delete("/face/{name}")
 async def delete_face(name: str):
     try:
-        result = collection.delete_one({"name": name})
-        if result.deleted_count == 0:
+        deleted = await async_collection.find_one_and_delete({"name": name}, projection={"_id": 1})
+        if deleted is None:
             raise HTTPException(status_code=404, detail="Face not found")
+        await async_embeddings_collection.delete_many({"face_id": deleted["_id"]})
+        _gallery_remove_face(str(deleted["_id"]))
+        await change_feed.record_async(OP_DELETE, str(deleted["_id"]))
         return {"status": "ok", "message": "Face deleted"}
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 
+async def _find_face_image(name: str, embedding_id: str):
+    """Look up a face and one of its enrolled images, raising 400/404 as appropriate"""
+    if not ObjectId.is_valid(embedding_id):
+        raise HTTPException(status_code=400, detail="Invalid image ID format")
+    doc = await async_collection.find_one({"name": name}, {"_id": 1})
+    if not doc:
+        raise HTTPException(status_code=404, detail="Face not found")
+    emb_doc = await async_embeddings_collection.find_one(
+        {"_id": ObjectId(embedding_id), "face_id": doc["_id"]}, {"image_url": 1}
+    )
+    if not emb_doc:
+        raise HTTPException(status_code=404, detail="Image not found")
+    return doc, emb_doc
+
+
+async def _replace_image_embedding(
+    face_oid: ObjectId,
+    emb_doc: dict,
+    emb: np.ndarray,
+    image_url: str,
+    quality: float,
+    crop: Optional[np.ndarray],
+):
+    """Swap one enrolled image for a new photo: its URL, its embedding and its index row"""
+    crop_sha256 = _store_crop(crop)
+    update = {"$set": {
+        "embedding": face_embeddings.encode_vector(emb),
+        "image_url": image_url,
+        "quality": float(quality),
+        "updated_at": datetime.utcnow(),
+    }}
+    if crop_sha256:
+        update["$set"]["crop_sha256"] = crop_sha256
+    else:
+        update["$unset"] = {"crop_sha256": ""}
+    await async_embeddings_collection.update_one({"_id": emb_doc["_id"]}, update)
+    old_url = emb_doc.get("image_url")
+    if old_url:
+        await async_collection.update_one({"_id": face_oid, "image_urls": old_url}, {"$set": {"image_urls.$": image_url}})
+    _gallery_replace_embedding(str(face_oid), str(emb_doc["_id"]), emb)
+    await change_feed.record_async(OP_REPLACE_EMBEDDING, str(face_oid), str(emb_doc["_id"]))
+
+
 @app.post("/face/{name}/image")
-async def replace_primary_image(name: str, file: UploadFile = File(...)):
+async def replace_primary_image(request: Request, name: str, file: UploadFile = File(...)):
+    """Replace the primary (first enrolled) image and its embedding"""
+    emb = None
+    upload_job = None
+    placeholder_saved = False
+    doc = None
+    lease = None
     try:
-        # Upload image to Cloudinary
-        upload_res = cloudinary.uploader.upload(file.file, folder="faces", public_id=name)
-        image_url = upload_res["secure_url"]
-
-        doc = collection.find_one({"name": name})
+        doc = await async_collection.find_one({"name": name}, {"_id": 1, "image_urls": 1})
         if not doc:
             raise HTTPException(status_code=404, detail="Face not found")
 
-        # Replace primary image (index 0)
-        if doc.get("image_urls"):
-            collection.update_one({"_id": doc["_id"]}, {"$set": {"image_urls.0": image_url}})
+        emb, quality, crop = await _run_inference(get_embedding_with_quality, file)
+        _check_enroll_quality(quality)
+
+        upload_job = await _stage_face_upload(request, file, name)
+        image_url = upload_job.placeholder
+
+        if max_embeddings_per_face > 0:
+            # A face without images gets a new row here, which must not race add_face past the cap
+            lease = await _acquire_enroll_lease(doc["_id"])
+        # Replace primary image (index 0) together with the embedding search matches against
+        primary = await async_embeddings_collection.find_one({"face_id": doc["_id"]}, {"image_url": 1}, sort=[("_id", 1)])
+        if primary:
+            # Also swaps the old URL for the new one in image_urls, wherever it sits
+            await _replace_image_embedding(doc["_id"], primary, emb, image_url, quality.score, crop)
+            placeholder_saved = True
         else:
-            collection.update_one({"_id": doc["_id"]}, {"$set": {"image_urls": [image_url]}})
+            emb_result = await async_embeddings_collection.insert_one(face_embeddings.make_embedding_doc(doc["_id"], emb, image_url, quality.score, _store_crop(crop)))
+            placeholder_saved = True
+            _gallery_append(str(doc["_id"]), str(emb_result.inserted_id), emb)
+            await change_feed.record_async(OP_APPEND, str(doc["_id"]), str(emb_result.inserted_id))
+            if doc.get("image_urls"):
+                await async_collection.update_one({"_id": doc["_id"]}, {"$set": {"image_urls.0": image_url}})
+            else:
+                await async_collection.update_one({"_id": doc["_id"]}, {"$set": {"image_urls": [image_url]}})
 
         return {"status": "ok", "image_url": image_url}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    finally:
+        if doc:
+            await _release_enroll_lease(doc["_id"], lease)
+        upload_queue.settle(upload_job, placeholder_saved)
+        # Cleanup file handle; the memory governor collects if RSS is high
+        if emb is not None:
+            del emb
+        if hasattr(file, 'file'):
+            file.file.close()
+        memory_governor.maybe_collect()
+
+
+@app.get("/face/{name}/images")
+async def list_face_images(name: str):
+    """List the enrolled images of a face with the IDs used by the per-image endpoints"""
+    doc = await async_collection.find_one({"name": name}, {"_id": 1})
+    if not doc:
+        raise HTTPException(status_code=404, detail="Face not found")
+    cursor = async_embeddings_collection.find({"face_id": doc["_id"]}, {"image_url": 1, "created_at": 1}).sort("_id", 1)
+    try:
+        images = [
+            {
+                "image_id": str(emb_doc["_id"]),
+                "image_url": emb_doc.get("image_url", ""),
+                "created_at": emb_doc["created_at"].isoformat() if emb_doc.get("created_at") else None,
+            }
+            async for emb_doc in cursor
+        ]
+    finally:
+        await cursor.close()
+    return {"name": name, "images": images}
+
+
+@app.delete("/face/{name}/images/{image_id}")
+async def delete_face_image(name: str, image_id: str):
+    """Remove one enrolled image and exactly its embedding"""
+    try:
+        doc, emb_doc = await _find_face_image(name, image_id)
+        await async_embeddings_collection.delete_one({"_id": emb_doc["_id"]})
+        if emb_doc.get("image_url"):
+            await async_collection.update_one({"_id": doc["_id"]}, {"$pull": {"image_urls": emb_doc["image_url"]}})
+        _gallery_remove_embedding(str(doc["_id"]), image_id)
+        await change_feed.record_async(OP_REMOVE_EMBEDDING, str(doc["_id"]), image_id)
+        return {"status": "ok", "message": "Image deleted"}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.put("/face/{name}/images/{image_id}")
+async def replace_face_image(request: Request, name: str, image_id: str, file: UploadFile = File(...)):
+    """Replace one enrolled image with a new photo and recompute its embedding"""
+    emb = None
+    upload_job = None
+    placeholder_saved = False
+    try:
+        doc, emb_doc = await _find_face_image(name, image_id)
+
+        emb, quality, crop = await _run_inference(get_embedding_with_quality, file)
+        _check_enroll_quality(quality)
+
+        upload_job = await _stage_face_upload(request, file, f"{name}_{image_id}")
+        image_url = upload_job.placeholder
+
+        await _replace_image_embedding(doc["_id"], emb_doc, emb, image_url, quality.score, crop)
+        placeholder_saved = True
+        return {"status": "ok", "image_id": image_id, "image_url": image_url}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
     finally:
-        # Cleanup file handle and force garbage collection
+        upload_queue.settle(upload_job, placeholder_saved)
+        if emb is not None:
+            del emb
         if hasattr(file, 'file'):
             file.file.close()
-        gc.collect()
+        memory_governor.maybe_collect()
+
+# ---------------- Shard endpoints ----------------
+# Only mounted on CLUSTER_ROLE=shard nodes; called by the coordinator.
+def _check_shard_token(request: Request):
+    if not secrets.compare_digest(request.headers.get(SHARD_TOKEN_HEADER, "").encode(), shard_token.encode()):
+        raise HTTPException(status_code=403, detail="Invalid shard token")
+
+
+if cluster_role == "shard":
+    @app.post("/internal/shard/search")
+    async def shard_search(request: Request, payload: dict = Body(...)):
+        _check_shard_token(request)
+        try:
+            query = decode_vector(payload["embedding"])
+            k = int(payload.get("k", 1))
+        except (KeyError, ValueError, TypeError) as e:
+            raise HTTPException(status_code=400, detail=f"Invalid search payload: {e}")
+        hits = await run_in_threadpool(_gallery_search, query, k)
+        return {
+            "shard": shard_index,
+            "hits": [{"score": hit.score, "face_id": hit.face_id, "embedding_id": hit.embedding_id} for hit in hits],
+        }
+
+    @app.post("/internal/shard/reload")
+    async def shard_reload(request: Request):
+        _check_shard_token(request)
+        # Full collection scan on the blocking client: keep it off the event loop
+        await run_in_threadpool(_rebuild_embedding_store)
+        return {"status": "ok", "embeddings": embedding_store.live_count}
 
 @app.get("/")
 async def root():
@@ -678,7 +1752,7 @@ async def health():
     """Health check endpoint with MongoDB connection verification"""
     try:
         # Verify MongoDB connection
-        client.admin.command('ping')
+        await async_client.admin.command('ping')
         db_status = "connected"
     except Exception as e:
         db_status = f"error: {str(e)}"
@@ -686,9 +1760,28 @@ async def health():
     return {
         "status": "healthy" if db_status == "connected" else "degraded",
         "database": db_status,
+        "inference": {
+            "executor": inference_executor_mode,
+            **inference_executor.describe(),
+        },
         "timestamp": datetime.utcnow().isoformat()
     }
 
+@app.get("/metrics")
+async def metrics():
+    """Runtime metrics for dashboards and autoscaling (JSON)"""
+    return {
+        "inference": {
+            "executor": inference_executor_mode,
+            "admission": admission.metrics(),
+        },
+        "memory": memory_governor.metrics(),
+        "models": _model_metrics(),
+        "uploads": {"storage": media_storage.name, **upload_queue.metrics()},
+        "thumbnails": thumbnails.metrics(),
+        "timestamp": datetime.utcnow().isoformat(),
+    }
+
 @app.get("/debug/routes")
 async def debug_routes():
     """Debug endpoint to list all registered routes"""
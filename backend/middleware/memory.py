@@ -1,32 +1,27 @@
 """Memory cleanup middleware to prevent memory leaks"""
 from starlette.middleware.base import BaseHTTPMiddleware
 from starlette.requests import Request
-import gc
+
+from services.memory_governor import MemoryGovernor
+
 
 class MemoryCleanupMiddleware(BaseHTTPMiddleware):
-    """Middleware to run garbage collection periodically to prevent memory leaks"""
+    """Middleware that lets the memory governor collect garbage when RSS is high"""
     
-    def __init__(self, app, gc_interval: int = 10):
+    def __init__(self, app, governor: MemoryGovernor):
         """
         Args:
             app: FastAPI application
-            gc_interval: Run garbage collection every N requests (default: 10)
+            governor: Samples RSS and decides whether a collection is worth it
         """
         super().__init__(app)
-        self.gc_interval = gc_interval
-        self.request_count = 0
+        self.governor = governor
     
     async def dispatch(self, request: Request, call_next):
-        """Process request and run GC periodically"""
+        """Process request, then give the governor a chance to collect"""
         try:
             response = await call_next(request)
             return response
         finally:
-            # Increment request counter
-            self.request_count += 1
-            
-            # Run garbage collection periodically to prevent memory accumulation
-            # Running GC on every request would be too expensive, so we do it every N requests
-            if self.request_count % self.gc_interval == 0:
-                gc.collect()
-
+            # Sampling RSS is cheap; a full collection only runs above the watermarks
+            self.governor.maybe_collect()
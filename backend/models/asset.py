@@ -40,3 +40,5 @@ class AssetResponse(BaseModel):
     upload_date: datetime
     usage_count: int
     metadata: AssetMetadata
+    # {"160": {"webp": url, "jpeg": url}, ...}; None until generated
+    thumbnails: Optional[Dict[str, Dict[str, str]]] = None
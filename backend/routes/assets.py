@@ -1,12 +1,16 @@
-from fastapi import APIRouter, HTTPException, UploadFile, File, Form
+from fastapi import APIRouter, HTTPException, UploadFile, File, Form, Request
 from typing import List, Optional
 from models.asset import AssetResponse, AssetMetadata
-from services.cloudinary_service import CloudinaryService
+from services.media_storage import UnsupportedMediaType, media_storage
+from services.upload_queue import upload_queue, url_target
+from services.thumbnails import thumbnails
+from starlette.concurrency import run_in_threadpool
+from PIL import Image
+import io
 from datetime import datetime
 from bson import ObjectId
 import json
 import os
-import gc
 from pymongo import MongoClient
 from dotenv import load_dotenv
 from pathlib import Path
@@ -20,15 +24,46 @@ else:
     load_dotenv()
 
 
-# Database connection - use shared client from database.py to avoid multiple connection pools
-# This reduces memory usage by reusing a single connection pool
-from database import client, db
+# Database connection - use the shared motor client from database.py so queries
+# do not block the event loop and all routers reuse a single connection pool
+from database import async_db
+from services.memory_governor import governor as memory_governor
 
 router = APIRouter(prefix="/assets", tags=["assets"])
-cloudinary_service = CloudinaryService()
+
+ASSET_IMAGE_TARGETS = [url_target("assets", "cloudinary_url", extra={"cloudinary_public_id": "public_id"})]
+
+
+async def _store_asset(request: Request, file, category: str, name: str) -> dict:
+    """Hand an asset to media storage and describe it from the local bytes.
+
+    For queued backends ``url`` is a placeholder and ``public_id`` is unset
+    until the upload lands; ``job`` must be submitted once the asset document
+    is stored.
+    """
+    data = await run_in_threadpool(file.read)
+    with Image.open(io.BytesIO(data)) as img:
+        width, height = img.size
+        image_format = (img.format or "").lower().replace("jpeg", "jpg")
+    job = await run_in_threadpool(
+        upload_queue.stage, data, f"forensic-assets/{category}", f"{name.lower().replace(' ', '-')}",
+        ASSET_IMAGE_TARGETS,
+        options={"resource_type": "image", "transformation": [{"quality": "auto"}, {"fetch_format": "auto"}]},
+        base_url=str(request.base_url),
+    )
+    return {
+        "url": job.placeholder,
+        "public_id": job.stored_public_id,
+        "width": width,
+        "height": height,
+        "format": image_format,
+        "file_size": len(data),
+        "job": job,
+    }
 
 @router.post("/upload", response_model=AssetResponse)
 async def upload_asset(
+    request: Request,
     name: str = Form(...),
     type: str = Form(...),
     description: str = Form(None),
@@ -53,18 +88,13 @@ async def upload_asset(
         if not file.content_type or file.content_type not in allowed_file_types:
             raise HTTPException(status_code=400, detail="Invalid file type. Allowed types: PNG, JPEG, JPG, GIF, WebP")
         
+        stored = {}
+        placeholder_saved = False
         try:
-            # Upload to Cloudinary
-            cloudinary_result = await cloudinary_service.upload_asset(file.file, type, name)
-            
-            # Validate Cloudinary response has required fields
-            required_fields = ["url", "public_id", "width", "height", "file_size", "format"]
-            missing_fields = [field for field in required_fields if field not in cloudinary_result]
-            if missing_fields:
-                raise HTTPException(
-                    status_code=500, 
-                    detail=f"Cloudinary upload incomplete. Missing fields: {', '.join(missing_fields)}"
-                )
+            try:
+                stored = await _store_asset(request, file.file, type, name)
+            except (Image.UnidentifiedImageError, Image.DecompressionBombError, UnsupportedMediaType) as e:
+                raise HTTPException(status_code=400, detail=f"Could not read image: {e}")
             
             # Parse tags with error handling
             try:
@@ -79,23 +109,24 @@ async def upload_asset(
                 "name": name.strip() if name else "",
                 "type": type,
                 "category": type,  # Same as type for simplicity
-                "cloudinary_url": cloudinary_result["url"],
-                "cloudinary_public_id": cloudinary_result["public_id"],
+                "cloudinary_url": stored["url"],
+                "cloudinary_public_id": stored["public_id"],
                 "tags": tags_list,
                 "description": description.strip() if description else None,
                 "upload_date": datetime.utcnow(),
                 "is_active": True,
                 "usage_count": 0,
                 "metadata": {
-                    "width": int(cloudinary_result["width"]),
-                    "height": int(cloudinary_result["height"]),
-                    "file_size": int(cloudinary_result["file_size"]),
-                    "format": str(cloudinary_result["format"])
+                    "width": int(stored["width"]),
+                    "height": int(stored["height"]),
+                    "file_size": int(stored["file_size"]),
+                    "format": str(stored["format"])
                 }
             }
             
             # Save to MongoDB
-            result = db.assets.insert_one(asset_data)
+            result = await async_db.assets.insert_one(asset_data)
+            placeholder_saved = True
             
             # Prepare response data (exclude fields not in AssetResponse model)
             response_data = {
@@ -113,10 +144,12 @@ async def upload_asset(
             
             return AssetResponse(**response_data)
         finally:
-            # Cleanup file handle and force garbage collection
+            # Upload only once the document holds the placeholder URL; drop it if the insert never happened
+            upload_queue.settle(stored.get("job"), placeholder_saved)
+            # Cleanup file handle; the memory governor collects if RSS is high
             if hasattr(file, 'file'):
                 file.file.close()
-            gc.collect()
+            memory_governor.maybe_collect()
         
     except HTTPException:
         # Re-raise HTTP exceptions (validation errors, etc.)
@@ -134,7 +167,8 @@ async def get_assets(type: Optional[str] = None):
         if type:
             query["type"] = type
             
-        assets = list(db.assets.find(query))
+        assets = await async_db.assets.find(query).to_list(length=None)
+        thumbs = await thumbnails.lookup(asset.get("cloudinary_url") for asset in assets)
         result = []
         for asset in assets:
             # Filter out fields not in AssetResponse model with safe access
@@ -149,7 +183,8 @@ async def get_assets(type: Optional[str] = None):
                     "description": asset.get("description"),
                     "upload_date": asset.get("upload_date", datetime.utcnow()),
                     "usage_count": asset.get("usage_count", 0),
-                    "metadata": AssetMetadata(**asset.get("metadata", {}))
+                    "metadata": AssetMetadata(**asset.get("metadata", {})),
+                    "thumbnails": thumbs.get(asset.get("cloudinary_url")),
                 }
                 result.append(AssetResponse(**response_data))
             except Exception as e:
@@ -167,7 +202,7 @@ async def get_asset(asset_id: str):
         if not ObjectId.is_valid(asset_id):
             raise HTTPException(status_code=400, detail="Invalid asset ID format")
         
-        asset = db.assets.find_one({"_id": ObjectId(asset_id)})
+        asset = await async_db.assets.find_one({"_id": ObjectId(asset_id)})
         if not asset:
             raise HTTPException(status_code=404, detail="Asset not found")
         
@@ -182,7 +217,8 @@ async def get_asset(asset_id: str):
             "description": asset.get("description"),
             "upload_date": asset.get("upload_date", datetime.utcnow()),
             "usage_count": asset.get("usage_count", 0),
-            "metadata": AssetMetadata(**asset.get("metadata", {}))
+            "metadata": AssetMetadata(**asset.get("metadata", {})),
+            "thumbnails": (await thumbnails.lookup([asset.get("cloudinary_url")])).get(asset.get("cloudinary_url")),
         }
         return AssetResponse(**response_data)
     except HTTPException:
@@ -199,21 +235,21 @@ async def delete_asset(asset_id: str):
         if not ObjectId.is_valid(asset_id):
             raise HTTPException(status_code=400, detail="Invalid asset ID format")
         
-        asset = db.assets.find_one({"_id": ObjectId(asset_id)})
+        asset = await async_db.assets.find_one({"_id": ObjectId(asset_id)})
         if not asset:
             raise HTTPException(status_code=404, detail="Asset not found")
         
-        # Delete from Cloudinary if public_id exists
+        # Delete from media storage if public_id exists
         public_id = asset.get("cloudinary_public_id")
         if public_id:
             try:
-                await cloudinary_service.delete_asset(public_id)
+                await run_in_threadpool(media_storage.delete, public_id)
             except Exception as e:
-                print(f"⚠️ Failed to delete from Cloudinary: {str(e)}")
-                # Continue with MongoDB deletion even if Cloudinary fails
+                print(f"⚠️ Failed to delete from media storage: {str(e)}")
+                # Continue with MongoDB deletion even if storage fails
         
         # Delete from MongoDB
-        db.assets.delete_one({"_id": ObjectId(asset_id)})
+        await async_db.assets.delete_one({"_id": ObjectId(asset_id)})
         
         return {"message": "Asset deleted successfully"}
     except HTTPException:
@@ -226,7 +262,7 @@ async def delete_asset(asset_id: str):
 @router.put("/{asset_id}/usage")
 async def increment_usage(asset_id: str):
     try:
-        result = db.assets.update_one(
+        result = await async_db.assets.update_one(
             {"_id": ObjectId(asset_id)},
             {"$inc": {"usage_count": 1}}
         )
@@ -42,11 +42,11 @@ class VerifyMojoAuthOTPRequest(BaseModel):
     state_id: str
     otp: str
 
-# Database connection - use shared client from database.py to avoid multiple connection pools
-# This reduces memory usage by reusing a single connection pool
-from database import client, db
-users_collection = db["users"]
-otps_collection = db["otps"]
+# Database connection - use the shared motor client from database.py so queries
+# do not block the event loop and all routers reuse a single connection pool
+from database import async_client, async_db
+users_collection = async_db["users"]
+otps_collection = async_db["otps"]
 
 # Environment variables - require REGISTRATION_SECRET_KEY
 REGISTRATION_SECRET_KEY = os.getenv('REGISTRATION_SECRET_KEY')
@@ -245,12 +245,12 @@ async def precheck_register(request: PrecheckRegisterRequest):
             raise HTTPException(status_code=400, detail="Username can only contain letters, numbers, and underscores")
 
         # Check if email already exists
-        existing_user = users_collection.find_one({"email": email.lower()})
+        existing_user = await users_collection.find_one({"email": email.lower()})
         if existing_user:
             raise HTTPException(status_code=400, detail="Email already registered")
 
         # Check if username already exists
-        existing_username = users_collection.find_one({"username": username})
+        existing_username = await users_collection.find_one({"username": username})
         if existing_username:
             raise HTTPException(status_code=400, detail="Username already taken")
 
@@ -300,12 +300,12 @@ async def register(request: RegisterRequest):
             raise HTTPException(status_code=400, detail="Password must be at least 8 characters")
         
         # Check if email already exists
-        existing_user = users_collection.find_one({"email": email.lower()})
+        existing_user = await users_collection.find_one({"email": email.lower()})
         if existing_user:
             raise HTTPException(status_code=400, detail="Email already registered")
         
         # Check if username already exists
-        existing_username = users_collection.find_one({"username": username})
+        existing_username = await users_collection.find_one({"username": username})
         if existing_username:
             raise HTTPException(status_code=400, detail="Username already taken")
         
@@ -332,7 +332,7 @@ async def register(request: RegisterRequest):
             "updatedAt": datetime.utcnow()
         }
         
-        result = users_collection.insert_one(user_doc)
+        result = await users_collection.insert_one(user_doc)
         user_id = str(result.inserted_id)
         
         # OTP record deletion commented out - OTP is temporarily disabled
@@ -362,7 +362,7 @@ async def login(request: LoginRequest):
     try:
         # Verify MongoDB connection before processing login
         try:
-            client.admin.command('ping')
+            await async_client.admin.command('ping')
         except Exception as db_error:
             print(f"⚠️ MongoDB connection error during login: {db_error}")
             raise HTTPException(status_code=503, detail="Database connection unavailable. Please try again in a moment.")
@@ -372,7 +372,7 @@ async def login(request: LoginRequest):
         password = request.password
         
         # Find user
-        user = users_collection.find_one({"email": email.lower()})
+        user = await users_collection.find_one({"email": email.lower()})
         
         if not user:
             # Do not reveal whether email exists
@@ -424,7 +424,7 @@ async def logout(credentials: HTTPAuthorizationCredentials = Depends(security)):
 async def get_current_user(user_id: str = Depends(get_current_user_id)):
     """Get current user information"""
     try:
-        user = users_collection.find_one({"_id": ObjectId(user_id)})
+        user = await users_collection.find_one({"_id": ObjectId(user_id)})
         
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
@@ -453,7 +453,7 @@ async def send_mojoauth_otp(request: SendMojoAuthOTPRequest):
             raise HTTPException(status_code=400, detail="Invalid email format")
         
         # Check if email already exists
-        existing_user = users_collection.find_one({"email": request.email.lower()})
+        existing_user = await users_collection.find_one({"email": request.email.lower()})
         if existing_user:
             raise HTTPException(status_code=400, detail="Email already registered")
         
@@ -654,12 +654,12 @@ async def register_mojoauth(request: RegisterMojoAuthRequest):
             raise HTTPException(status_code=400, detail="Password must be at least 8 characters")
         
         # Check if email already exists
-        existing_user = users_collection.find_one({"email": request.email.lower()})
+        existing_user = await users_collection.find_one({"email": request.email.lower()})
         if existing_user:
             raise HTTPException(status_code=400, detail="Email already registered")
         
         # Check if username already exists
-        existing_username = users_collection.find_one({"username": request.username})
+        existing_username = await users_collection.find_one({"username": request.username})
         if existing_username:
             raise HTTPException(status_code=400, detail="Username already taken")
         
@@ -733,7 +733,7 @@ async def register_mojoauth(request: RegisterMojoAuthRequest):
             "updatedAt": datetime.utcnow()
         }
         
-        result = users_collection.insert_one(user_doc)
+        result = await users_collection.insert_one(user_doc)
         user_id = str(result.inserted_id)
         
         # Generate JWT token
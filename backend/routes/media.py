@@ -0,0 +1,96 @@
+import os
+import re
+from email.utils import formatdate
+
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import FileResponse, RedirectResponse, Response, StreamingResponse
+
+from services.media_storage import CONTENT_TYPES_BY_EXTENSION, OBJECTS_PATH, LocalMediaStorage, media_storage
+from services.upload_queue import PENDING_PATH, upload_queue
+
+router = APIRouter(tags=["media"])
+
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+_CHUNK_SIZE = 64 * 1024
+# Object names are content hashes, so a URL's bytes never change
+_IMMUTABLE = "public, max-age=31536000, immutable"
+# Browsers must not second-guess the (whitelisted) image type
+_NOSNIFF = {"X-Content-Type-Options": "nosniff"}
+
+
+@router.get(PENDING_PATH + "/{job_id}")
+async def pending_media(job_id: str):
+    """Serve an image whose CDN upload is still queued, or redirect once it has finished"""
+    media = upload_queue.pending_media(job_id)
+    if media is None:
+        raise HTTPException(status_code=404, detail="Media not found")
+    if media[0] == "redirect":
+        return RedirectResponse(media[1], status_code=307)
+    path, content_type = media
+    # Short-lived: the document switches to the CDN URL as soon as the upload lands
+    return FileResponse(path, media_type=content_type, headers={"Cache-Control": "private, max-age=60", **_NOSNIFF})
+
+
+def _parse_range(header: str, size: int):
+    """(start, end) inclusive for a single ``bytes=`` range; None to send the whole file"""
+    match = _RANGE_RE.match(header.strip())
+    if not match:
+        return None  # multi-range or unknown unit: ignore, as RFC 9110 allows
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        start, end = max(0, size - int(last)), size - 1  # suffix range: the last N bytes
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise HTTPException(status_code=416, detail="Range not satisfiable", headers={"Content-Range": f"bytes */{size}"})
+    return start, end
+
+
+def _iter_file(path, start: int, length: int):
+    with open(path, "rb") as fh:
+        fh.seek(start)
+        while length > 0:
+            chunk = fh.read(min(_CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+@router.get(OBJECTS_PATH + "/{object_name}")
+async def media_object(object_name: str, request: Request):
+    """Serve an object from the local content-addressed store (MEDIA_STORAGE=local)"""
+    path = media_storage.path_for(object_name) if isinstance(media_storage, LocalMediaStorage) else None
+    if path is None:
+        raise HTTPException(status_code=404, detail="Media not found")
+
+    stat = os.stat(path)
+    etag = f'"{object_name.partition(".")[0]}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": _IMMUTABLE,
+        "Last-Modified": formatdate(stat.st_mtime, usegmt=True),
+        "Accept-Ranges": "bytes",
+        **_NOSNIFF,
+    }
+    media_type = CONTENT_TYPES_BY_EXTENSION["." + object_name.rsplit(".", 1)[-1]]
+    if etag in [tag.strip() for tag in request.headers.get("if-none-match", "").split(",")]:
+        return Response(status_code=304, headers=headers)
+
+    byte_range = None
+    range_header = request.headers.get("range")
+    if range_header and request.headers.get("if-range", etag) == etag:
+        byte_range = _parse_range(range_header, stat.st_size)
+    if byte_range is None:
+        return FileResponse(path, media_type=media_type, headers=headers)
+
+    start, end = byte_range
+    length = end - start + 1
+    headers.update({"Content-Range": f"bytes {start}-{end}/{stat.st_size}", "Content-Length": str(length)})
+    return StreamingResponse(
+        _iter_file(path, start, length), status_code=206, headers=headers,
+        media_type=media_type,
+    )
@@ -1,39 +1,45 @@
 from fastapi import APIRouter, HTTPException, UploadFile, File, Form, Body, Request
+from starlette.concurrency import run_in_threadpool
 from typing import List, Optional, Dict, Any
 from datetime import datetime
 from bson import ObjectId
-import cloudinary
-import cloudinary.uploader
+from pymongo.errors import WriteError
+import base64
 import json
 import os
-import gc
+import time
 
-# Database connection - use shared client from database.py to avoid multiple connection pools
-# This reduces memory usage by reusing a single connection pool
-from database import client, db
+# Database connection - use the shared motor client from database.py so queries
+# do not block the event loop and all routers reuse a single connection pool
+from database import async_db
+from services.memory_governor import governor as memory_governor
+from services import sketch_patch, sketch_search
+from services.media_storage import UnsupportedMediaType, media_storage
+from services.thumbnails import thumbnails
+from services.upload_queue import upload_queue, url_target
 
-# Cloudinary config - load from environment variables
-cloudinary_cloud_name = os.getenv('CLOUDINARY_CLOUD_NAME')
-cloudinary_api_key = os.getenv('CLOUDINARY_API_KEY')
-cloudinary_api_secret = os.getenv('CLOUDINARY_API_SECRET')
+router = APIRouter(prefix="/sketches", tags=["sketches"])
 
-if not cloudinary_cloud_name or not cloudinary_api_key or not cloudinary_api_secret:
-    raise RuntimeError(
-        "Cloudinary configuration is required. "
-        "Set CLOUDINARY_CLOUD_NAME, CLOUDINARY_API_KEY, and CLOUDINARY_API_SECRET in your .env file."
-    )
+# The image fields are patched with the stored URL once a background upload lands
+SKETCH_IMAGE_TARGETS = [
+    url_target("sketches", "image_url", extra={"cloudinary_url": "secure_url", "cloudinary_public_id": "public_id"})
+]
 
-cloudinary.config(
-    cloud_name=cloudinary_cloud_name,
-    api_key=cloudinary_api_key,
-    api_secret=cloudinary_api_secret,
-    secure=True
-)
 
-router = APIRouter(prefix="/sketches", tags=["sketches"])
+async def _stage_sketch_upload(request: Request, image: UploadFile, public_id: str):
+    data = await run_in_threadpool(image.file.read)
+    try:
+        return await run_in_threadpool(
+            upload_queue.stage, data, "Sketch", public_id, SKETCH_IMAGE_TARGETS,
+            options={"resource_type": "image"}, base_url=str(request.base_url),
+        )
+    except UnsupportedMediaType as e:
+        raise HTTPException(status_code=415, detail=str(e))
+
 
 @router.post("/save")
 async def save_sketch(
+    request: Request,
     name: Optional[str] = Form(None),
     suspect: Optional[str] = Form(None),
     eyewitness: Optional[str] = Form(None),
@@ -46,7 +52,7 @@ async def save_sketch(
     sketch_state: Optional[str] = Form(None),
     image: Optional[UploadFile] = File(None)
 ):
-    """Save a new sketch to MongoDB and Cloudinary"""
+    """Save a new sketch to MongoDB and media storage"""
     try:
         # Validate required fields with better error messages
         if not name or not name.strip():
@@ -64,13 +70,12 @@ async def save_sketch(
         except json.JSONDecodeError as e:
             raise HTTPException(status_code=400, detail=f"Invalid sketch state format: {str(e)}")
         
-        # Upload image to Cloudinary in Sketch folder
+        # Store the image in the Sketch folder (remote backends upload in the background)
+        upload_job = None
+        placeholder_saved = False
         try:
-            upload_result = cloudinary.uploader.upload(
-                image.file,
-                folder="Sketch",
-                public_id=f"sketch_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}_{name.lower().replace(' ', '_')}",
-                resource_type="image"
+            upload_job = await _stage_sketch_upload(
+                request, image, f"sketch_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}_{name.lower().replace(' ', '_')}"
             )
             
             # Create sketch document
@@ -84,25 +89,29 @@ async def save_sketch(
                 "description": description.strip() if description else None,
                 "priority": priority,
                 "status": status,
-                "image_url": upload_result["secure_url"],  # Cloudinary URL
-                "cloudinary_url": upload_result["secure_url"],  # Alias for compatibility
-                "cloudinary_public_id": upload_result["public_id"],
+                "image_url": upload_job.placeholder,  # Final URL once uploaded
+                "cloudinary_url": upload_job.placeholder,  # Alias for compatibility
+                "cloudinary_public_id": upload_job.stored_public_id,  # Set when a queued upload completes
                 "sketch_state": state_data,  # Full state: features, canvasSettings, etc.
+                "revision": 1,  # Bumped by every update; PATCH is conditional on it
                 "created_at": datetime.utcnow(),
                 "updated_at": datetime.utcnow()
             }
+            sketch_doc["search_terms"] = {f: sketch_search.tokens(sketch_doc[f]) for f in sketch_search.TERM_FIELDS}
+            sketch_doc["search_terms_version"] = sketch_search.TERMS_VERSION
             
             # Save to MongoDB with write concern verification
-            result = db.sketches.insert_one(sketch_doc)
+            result = await async_db.sketches.insert_one(sketch_doc)
             
             # Verify the insert was successful
             if not result.inserted_id:
                 raise HTTPException(status_code=500, detail="Failed to save sketch: No ID returned from database")
+            placeholder_saved = True
             
             sketch_id = str(result.inserted_id)
             
             # Verify the document was actually saved by reading it back
-            saved_sketch = db.sketches.find_one({"_id": result.inserted_id})
+            saved_sketch = await async_db.sketches.find_one({"_id": result.inserted_id})
             if not saved_sketch:
                 raise HTTPException(status_code=500, detail="Failed to save sketch: Document not found after insert")
             
@@ -113,13 +122,15 @@ async def save_sketch(
                 "status": "ok",
                 "message": "Sketch saved successfully",
                 "sketch_id": sketch_id,
-                "cloudinary_url": upload_result["secure_url"]
+                "cloudinary_url": upload_job.placeholder
             }
         finally:
-            # Cleanup file handle and force garbage collection
+            # Upload only if the sketch was saved with the placeholder; otherwise drop the spooled image
+            upload_queue.settle(upload_job, placeholder_saved)
+            # Cleanup file handle; the memory governor collects if RSS is high
             if hasattr(image, 'file'):
                 image.file.close()
-            gc.collect()
+            memory_governor.maybe_collect()
         
     except HTTPException:
         raise
@@ -129,68 +140,177 @@ async def save_sketch(
         print(f"❌ Error saving sketch: {str(e)}\n{error_details}")
         raise HTTPException(status_code=500, detail=f"Failed to save sketch: {str(e)}")
 
+# Everything the list view shows; sketch_state (often hundreds of KB) is only served by GET /sketches/{id}
+SKETCH_SUMMARY_FIELDS = (
+    "name", "suspect", "eyewitness", "officer", "date", "reason", "description",
+    "priority", "status", "image_url", "cloudinary_url", "created_at", "updated_at",
+)
+SKETCH_DEFAULT_PAGE = 100
+SKETCH_MAX_PAGE = 500
+# Filtered totals are counted at most once per this many seconds per filter
+SKETCH_COUNT_CACHE_SECONDS = float(os.getenv("SKETCH_COUNT_CACHE_SECONDS", "30"))
+_count_cache: Dict[str, tuple] = {}
+
+
+async def ensure_indexes():
+    # Keyset order of the list view
+    await async_db.sketches.create_index([("created_at", -1), ("_id", -1)])
+    await sketch_search.ensure_indexes(async_db.sketches)
+    backfilled = await sketch_search.backfill(async_db.sketches)
+    if backfilled:
+        print(f"✓ Indexed search terms for {backfilled} existing sketches")
+
+
+def _encode_sketch_cursor(doc) -> str:
+    created_at = doc.get("created_at")
+    raw = json.dumps([created_at.isoformat() if created_at else None, str(doc["_id"])], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _sketch_keyset(token: str) -> dict:
+    """Query for the rows after a cursor in (created_at desc, _id desc) order.
+
+    Sketches without created_at sort last (null is lowest), so they follow
+    every dated row and are then paged by _id alone.
+    """
+    try:
+        created_at, oid = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+        after_id = ObjectId(oid)
+        after_created = datetime.fromisoformat(created_at) if created_at else None
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid sketch cursor")
+    if after_created is None:
+        return {"created_at": None, "_id": {"$lt": after_id}}
+    return {"$or": [
+        {"created_at": {"$lt": after_created}},
+        {"created_at": after_created, "_id": {"$lt": after_id}},
+        {"created_at": None},
+    ]}
+
+
+async def _sketch_total(query: dict) -> int:
+    """Estimated total when unfiltered (collection metadata), else a briefly cached count"""
+    if not query:
+        return await async_db.sketches.estimated_document_count()
+    key = json.dumps(query, sort_keys=True, default=str)
+    cached = _count_cache.get(key)
+    now = time.monotonic()
+    if cached and now - cached[0] < SKETCH_COUNT_CACHE_SECONDS:
+        return cached[1]
+    total = await async_db.sketches.count_documents(query)
+    if len(_count_cache) > 256:
+        _count_cache.clear()
+    _count_cache[key] = (now, total)
+    return total
+
+
+def _sketch_summary(sketch: dict) -> dict:
+    created_at = sketch.get("created_at")
+    updated_at = sketch.get("updated_at")
+    return {
+        "_id": str(sketch["_id"]),
+        "name": sketch.get("name", "Untitled"),
+        "suspect": sketch.get("suspect"),
+        "eyewitness": sketch.get("eyewitness"),
+        "officer": sketch.get("officer"),
+        "date": sketch.get("date"),
+        "reason": sketch.get("reason"),
+        "description": sketch.get("description"),
+        "priority": sketch.get("priority", "normal"),
+        "status": sketch.get("status", "draft"),
+        "image_url": sketch.get("image_url") or sketch.get("cloudinary_url"),
+        "cloudinary_url": sketch.get("image_url") or sketch.get("cloudinary_url"),
+        "created_at": created_at.isoformat() if created_at else None,
+        "updated_at": updated_at.isoformat() if updated_at else None
+    }
+
+
 @router.get("")
 async def get_sketches(
+    limit: int = SKETCH_DEFAULT_PAGE,
+    cursor: Optional[str] = None,
     skip: int = 0,
-    limit: int = 100,
     suspect: Optional[str] = None,
     officer: Optional[str] = None
 ):
-    """Get list of all sketches with optional filtering"""
+    """List sketch summaries, newest first.
+
+    Pass the returned ``next_cursor`` back as ``cursor`` for the next page
+    (``null`` on the last one). ``skip`` is still honoured without a cursor for
+    older clients, but gets slower the deeper it goes. ``total`` is estimated
+    or cached, not exact.
+    """
     try:
+        limit = max(1, min(limit, SKETCH_MAX_PAGE))
         query = {}
-        if suspect:
-            query["suspect"] = {"$regex": suspect, "$options": "i"}
-        if officer:
-            query["officer"] = {"$regex": officer, "$options": "i"}
-        
-        # Sort by created_at descending, handling None values
-        # Use a compound sort to handle missing created_at fields
-        sketches_cursor = db.sketches.find(query).sort([
-            ("created_at", -1),
-            ("_id", -1)  # Secondary sort by _id for consistent ordering
-        ]).skip(skip).limit(limit)
-        
-        sketches = list(sketches_cursor)
-        
-        result = []
-        for sketch in sketches:
-            created_at = sketch.get("created_at")
-            updated_at = sketch.get("updated_at")
-            
-            result.append({
-                "_id": str(sketch["_id"]),
-                "name": sketch.get("name", "Untitled"),
-                "suspect": sketch.get("suspect"),
-                "eyewitness": sketch.get("eyewitness"),
-                "officer": sketch.get("officer"),
-                "date": sketch.get("date"),
-                "reason": sketch.get("reason"),
-                "description": sketch.get("description"),
-                "priority": sketch.get("priority", "normal"),
-                "status": sketch.get("status", "draft"),
-                "image_url": sketch.get("image_url") or sketch.get("cloudinary_url"),
-                "cloudinary_url": sketch.get("image_url") or sketch.get("cloudinary_url"),
-                "created_at": created_at.isoformat() if created_at else None,
-                "updated_at": updated_at.isoformat() if updated_at else None
-            })
-        
-        # Get total count for accurate pagination
-        total_count = db.sketches.count_documents(query)
+        # Word-prefix matches on the normalised search_terms index (see services/sketch_search.py)
+        for field, text in (("suspect", suspect), ("officer", officer)):
+            if text:
+                terms = sketch_search.terms_filter(field, text)
+                if terms is None:
+                    # Nothing searchable in the filter: it matches no sketch, it is not "no filter"
+                    return {"sketches": [], "next_cursor": None, "total": 0, "skip": skip, "limit": limit}
+                query.update(terms)
+        
+        page_query = query
+        if cursor:
+            keyset = _sketch_keyset(cursor)
+            page_query = {"$and": [query, keyset]} if query else keyset
+        
+        sketches_cursor = async_db.sketches.find(
+            page_query, {f: 1 for f in SKETCH_SUMMARY_FIELDS}
+        ).sort([("created_at", -1), ("_id", -1)])
+        if skip and not cursor:
+            sketches_cursor = sketches_cursor.skip(skip)
+        sketches = await sketches_cursor.limit(limit + 1).to_list(length=limit + 1)
+        has_more = len(sketches) > limit
+        sketches = sketches[:limit]
+        
+        result = [_sketch_summary(sketch) for sketch in sketches]
+        
+        # Tile-sized derivatives (None until generated)
+        thumbs = await thumbnails.lookup(sketch["image_url"] for sketch in result)
+        for sketch in result:
+            sketch["thumbnails"] = thumbs.get(sketch["image_url"])
         
         return {
             "sketches": result,
-            "total": total_count,
+            "next_cursor": _encode_sketch_cursor(sketches[-1]) if has_more else None,
+            "total": await _sketch_total(query),
             "skip": skip,
             "limit": limit
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         import traceback
         error_details = traceback.format_exc()
         print(f"❌ Error fetching sketches: {str(e)}\n{error_details}")
         raise HTTPException(status_code=500, detail=f"Failed to fetch sketches: {str(e)}")
 
+@router.get("/search")
+async def search_sketches(q: str, limit: int = 20):
+    """Free-text search over name, suspect, officer, eyewitness and description, best match first"""
+    q = q.strip()
+    if not q:
+        raise HTTPException(status_code=400, detail="q is required")
+    limit = max(1, min(limit, SKETCH_MAX_PAGE))
+    projection = {f: 1 for f in SKETCH_SUMMARY_FIELDS}
+    projection["score"] = {"$meta": "textScore"}
+    docs = await async_db.sketches.find({"$text": {"$search": q}}, projection).sort(
+        [("score", {"$meta": "textScore"}), ("created_at", -1)]
+    ).limit(limit).to_list(length=limit)
+    results = []
+    for doc in docs:
+        summary = _sketch_summary(doc)
+        summary["score"] = round(doc.get("score", 0.0), 4)
+        results.append(summary)
+    thumbs = await thumbnails.lookup(sketch["image_url"] for sketch in results)
+    for sketch in results:
+        sketch["thumbnails"] = thumbs.get(sketch["image_url"])
+    return {"sketches": results, "q": q, "limit": limit}
+
 @router.get("/{sketch_id}")
 async def get_sketch(sketch_id: str):
     """Get a single sketch with full state"""
@@ -198,7 +318,7 @@ async def get_sketch(sketch_id: str):
         if not ObjectId.is_valid(sketch_id):
             raise HTTPException(status_code=400, detail="Invalid sketch ID format")
         
-        sketch = db.sketches.find_one({"_id": ObjectId(sketch_id)})
+        sketch = await async_db.sketches.find_one({"_id": ObjectId(sketch_id)})
         if not sketch:
             raise HTTPException(status_code=404, detail="Sketch not found")
         
@@ -217,6 +337,7 @@ async def get_sketch(sketch_id: str):
             "cloudinary_url": sketch.get("image_url") or sketch.get("cloudinary_url"),
             "cloudinary_public_id": sketch.get("cloudinary_public_id"),
             "sketch_state": sketch.get("sketch_state", {}),  # Full state restoration
+            "revision": sketch.get("revision", 0),
             "created_at": sketch.get("created_at").isoformat() if sketch.get("created_at") else None,
             "updated_at": sketch.get("updated_at").isoformat() if sketch.get("updated_at") else None
         }
@@ -243,11 +364,13 @@ async def update_sketch(
     image: Optional[UploadFile] = File(None)
 ):
     """Update an existing sketch"""
+    upload_job = None
+    placeholder_saved = False
     try:
         if not ObjectId.is_valid(sketch_id):
             raise HTTPException(status_code=400, detail="Invalid sketch ID format")
         
-        sketch = db.sketches.find_one({"_id": ObjectId(sketch_id)})
+        sketch = await async_db.sketches.find_one({"_id": ObjectId(sketch_id)})
         if not sketch:
             raise HTTPException(status_code=404, detail="Sketch not found")
         
@@ -279,6 +402,10 @@ async def update_sketch(
             update_data["priority"] = priority
         if status is not None:
             update_data["status"] = status
+        # Keep the search tokens in step with suspect/officer (all of them if the stored ones are missing or stale)
+        update_data.update(sketch_search.terms_for(
+            update_data if sketch_search.is_current(sketch) else {**sketch, **update_data}
+        ))
         
         # CRITICAL: sketch_state MUST always be included in updates
         # Try multiple methods to get sketch_state (FastAPI Form() might not work with PUT + no file)
@@ -344,29 +471,27 @@ async def update_sketch(
         # Update image if provided
         if image:
             try:
-                # Delete old image from Cloudinary if exists
+                # Delete old image from media storage if exists
                 old_public_id = sketch.get("cloudinary_public_id")
                 if old_public_id:
                     try:
-                        cloudinary.uploader.destroy(old_public_id)
+                        await run_in_threadpool(media_storage.delete, old_public_id)
                     except:
                         pass  # Continue even if deletion fails
                 
-                # Upload new image
-                upload_result = cloudinary.uploader.upload(
-                    image.file,
-                    folder="Sketch",
-                    public_id=f"sketch_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}_{name.lower().replace(' ', '_') if name else 'updated'}",
-                    resource_type="image"
+                # Store the new image (remote backends upload in the background)
+                upload_job = await _stage_sketch_upload(
+                    request, image,
+                    f"sketch_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}_{name.lower().replace(' ', '_') if name else 'updated'}",
                 )
-                update_data["image_url"] = upload_result["secure_url"]
-                update_data["cloudinary_url"] = upload_result["secure_url"]  # Alias
-                update_data["cloudinary_public_id"] = upload_result["public_id"]
+                update_data["image_url"] = upload_job.placeholder
+                update_data["cloudinary_url"] = upload_job.placeholder  # Alias
+                update_data["cloudinary_public_id"] = upload_job.stored_public_id
             finally:
-                # Cleanup file handle and force garbage collection
+                # Cleanup file handle; the memory governor collects if RSS is high
                 if hasattr(image, 'file'):
                     image.file.close()
-                gc.collect()
+                memory_governor.maybe_collect()
         
         update_data["updated_at"] = datetime.utcnow()
         
@@ -385,21 +510,22 @@ async def update_sketch(
         print(f"📝 Updating {len(update_data)} fields: {list(update_data.keys())}")
         
         # Update in MongoDB
-        update_result = db.sketches.update_one(
+        update_result = await async_db.sketches.update_one(
             {"_id": ObjectId(sketch_id)},
-            {"$set": update_data}
+            {"$set": update_data, "$inc": {"revision": 1}}
         )
         
         # Verify the update was successful
         if update_result.matched_count == 0:
             raise HTTPException(status_code=404, detail="Sketch not found")
+        placeholder_saved = True
         
         if update_result.modified_count == 0 and len(update_data) > 1:
             # This might indicate the data is the same, but we should still verify
             print(f"⚠️ Sketch {sketch_id} update: no fields modified (data may be identical)")
         
         # Verify the document was actually updated by reading it back
-        updated_sketch = db.sketches.find_one({"_id": ObjectId(sketch_id)})
+        updated_sketch = await async_db.sketches.find_one({"_id": ObjectId(sketch_id)})
         if not updated_sketch:
             raise HTTPException(status_code=500, detail="Failed to update sketch: Document not found after update")
         
@@ -426,7 +552,8 @@ async def update_sketch(
         return {
             "status": "ok",
             "message": "Sketch updated successfully",
-            "sketch_id": sketch_id
+            "sketch_id": sketch_id,
+            "revision": updated_sketch.get("revision", 0)
         }
         
     except HTTPException:
@@ -436,29 +563,102 @@ async def update_sketch(
         error_details = traceback.format_exc()
         print(f"❌ Error updating sketch: {str(e)}\n{error_details}")
         raise HTTPException(status_code=500, detail=f"Failed to update sketch: {str(e)}")
+    finally:
+        # Only once the sketch holds the placeholder, so the patch cannot miss it
+        upload_queue.settle(upload_job, placeholder_saved)
+
+def _revision_filter(revision: int) -> dict:
+    # Sketches saved before revisions existed count as revision 0
+    return {"revision": revision} if revision else {"revision": {"$in": [0, None]}}
+
+
+async def _revision_conflict(oid: ObjectId):
+    current = await async_db.sketches.find_one({"_id": oid}, {"revision": 1})
+    if not current:
+        raise HTTPException(status_code=404, detail="Sketch not found")
+    raise HTTPException(
+        status_code=409,
+        detail={"message": "Sketch was modified by someone else", "revision": current.get("revision", 0)},
+    )
+
+
+@router.patch("/{sketch_id}")
+async def patch_sketch(sketch_id: str, payload: Dict[str, Any] = Body(...)):
+    """Apply a delta to ``sketch_state`` against a known revision.
+
+    Body: ``{"revision": n, "patch": [<RFC 6902 ops>]}`` or
+    ``{"revision": n, "merge": {<RFC 7386 merge patch>}}``. Returns the new
+    revision; 409 (with the current revision) if the sketch changed since
+    ``n``, 422 if the patch does not apply.
+    """
+    if not ObjectId.is_valid(sketch_id):
+        raise HTTPException(status_code=400, detail="Invalid sketch ID format")
+    revision = payload.get("revision")
+    if not isinstance(revision, int) or isinstance(revision, bool) or revision < 0:
+        raise HTTPException(status_code=400, detail="revision (the last revision you saw) is required")
+    if ("patch" in payload) == ("merge" in payload):
+        raise HTTPException(status_code=400, detail="Provide exactly one of 'patch' or 'merge'")
+    oid = ObjectId(sketch_id)
+    base = {"_id": oid, **_revision_filter(revision)}
+    stamp = {"$set": {"updated_at": datetime.utcnow()}, "$inc": {"revision": 1}}
+
+    # Fast path: the delta as one conditional update, without reading sketch_state
+    if "patch" in payload:
+        translated = sketch_patch.json_patch_update(payload["patch"])
+    else:
+        translated = sketch_patch.merge_patch_update(payload["merge"])
+    if translated is not None:
+        conditions, update = translated
+        update["$set"] = {**update.get("$set", {}), **stamp["$set"]}
+        update["$inc"] = stamp["$inc"]
+        try:
+            result = await async_db.sketches.update_one({"$and": [base, conditions]}, update)
+            if result.matched_count:
+                return {"status": "ok", "sketch_id": sketch_id, "revision": revision + 1}
+        except WriteError:
+            pass  # e.g. a path through a scalar; the full apply reports it properly
+
+    # Slow path: apply to the stored state and write it back under the same revision check
+    sketch = await async_db.sketches.find_one(base, {"sketch_state": 1})
+    if not sketch:
+        await _revision_conflict(oid)
+    state = sketch.get("sketch_state", {})
+    try:
+        if "patch" in payload:
+            state = await run_in_threadpool(sketch_patch.apply_json_patch, state, payload["patch"])
+        else:
+            state = await run_in_threadpool(sketch_patch.apply_merge_patch, state, payload["merge"])
+    except sketch_patch.PatchError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    result = await async_db.sketches.update_one(
+        base, {"$set": {"sketch_state": state, **stamp["$set"]}, "$inc": stamp["$inc"]}
+    )
+    if not result.matched_count:
+        await _revision_conflict(oid)
+    return {"status": "ok", "sketch_id": sketch_id, "revision": revision + 1}
 
 @router.delete("/{sketch_id}")
 async def delete_sketch(sketch_id: str):
-    """Delete a sketch and its Cloudinary image"""
+    """Delete a sketch and its stored image"""
     try:
         if not ObjectId.is_valid(sketch_id):
             raise HTTPException(status_code=400, detail="Invalid sketch ID format")
         
-        sketch = db.sketches.find_one({"_id": ObjectId(sketch_id)})
+        sketch = await async_db.sketches.find_one({"_id": ObjectId(sketch_id)})
         if not sketch:
             raise HTTPException(status_code=404, detail="Sketch not found")
         
-        # Delete from Cloudinary
+        # Delete from media storage
         public_id = sketch.get("cloudinary_public_id")
         if public_id:
             try:
-                cloudinary.uploader.destroy(public_id)
+                await run_in_threadpool(media_storage.delete, public_id)
             except Exception as e:
                 # Log but continue with MongoDB deletion
-                print(f"Warning: Failed to delete Cloudinary image: {str(e)}")
+                print(f"Warning: Failed to delete sketch image: {str(e)}")
         
         # Delete from MongoDB
-        db.sketches.delete_one({"_id": ObjectId(sketch_id)})
+        await async_db.sketches.delete_one({"_id": ObjectId(sketch_id)})
         
         return {
             "status": "ok",
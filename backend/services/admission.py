@@ -0,0 +1,152 @@
+"""Admission control for the inference path.
+
+At most ``capacity`` requests run inference at once (one per inference slot).
+Others wait in a bounded queue per priority class:
+
+- ``interactive`` (``/recognize_face``) may use every slot and is always
+  dequeued first;
+- ``bulk`` (enrollment) may hold at most ``capacity - reserved_interactive``
+  slots, so a burst of uploads cannot starve recognition.
+
+A request is shed with ``Overloaded`` (-> 503 + Retry-After) immediately when
+its queue is full, or when it has not been admitted within ``deadline``
+seconds. Bounding the queue bounds the number of decoded images and tensors
+alive at once, which is what used to push the container into the OOM killer.
+"""
+import asyncio
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict, Optional
+
+INTERACTIVE = "interactive"
+BULK = "bulk"
+PRIORITIES = (INTERACTIVE, BULK)
+
+
+class Overloaded(Exception):
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    def __init__(
+        self,
+        capacity: int,
+        reserved_interactive: int = 1,
+        max_queue: int = 8,
+        max_bulk_queue: int = 4,
+        deadline: float = 10.0,
+    ):
+        self.capacity = max(1, int(capacity))
+        # With a single slot nothing can be reserved; priority ordering still applies
+        self.bulk_limit = max(1, self.capacity - max(0, int(reserved_interactive)))
+        self.max_queue = {INTERACTIVE: max(0, int(max_queue)), BULK: max(0, int(max_bulk_queue))}
+        self.deadline = max(0.0, float(deadline))
+        self._running: Dict[str, int] = {p: 0 for p in PRIORITIES}
+        self._waiters: Dict[str, Deque[asyncio.Future]] = {p: deque() for p in PRIORITIES}
+        self._service_ewma = 0.0
+        self._counters = {
+            p: {"admitted": 0, "rejected_queue_full": 0, "rejected_deadline": 0, "wait_seconds_total": 0.0}
+            for p in PRIORITIES
+        }
+
+    # ---------------- Scheduling ----------------
+    def _can_run(self, priority: str) -> bool:
+        if sum(self._running.values()) >= self.capacity:
+            return False
+        return priority != BULK or self._running[BULK] < self.bulk_limit
+
+    def _dispatch(self):
+        for priority in PRIORITIES:
+            waiters = self._waiters[priority]
+            while waiters and self._can_run(priority):
+                future = waiters.popleft()
+                if future.done():
+                    continue
+                self._running[priority] += 1
+                future.set_result(None)
+
+    def _release(self, priority: str, service_seconds: Optional[float] = None):
+        self._running[priority] -= 1
+        if service_seconds is not None:
+            self._service_ewma = (
+                service_seconds if self._service_ewma == 0 else 0.8 * self._service_ewma + 0.2 * service_seconds
+            )
+        self._dispatch()
+
+    def _leave_queue(self, priority: str, future: asyncio.Future):
+        future.cancel()
+        try:
+            self._waiters[priority].remove(future)
+        except ValueError:
+            pass
+
+    def retry_after(self) -> int:
+        """Seconds until the current backlog has likely drained (at least 1)"""
+        queued = sum(len(w) for w in self._waiters.values())
+        estimate = (self._service_ewma or 1.0) * (queued + 1) / self.capacity
+        return max(1, math.ceil(estimate))
+
+    def _reject(self, priority: str, kind: str, reason: str):
+        self._counters[priority][kind] += 1
+        raise Overloaded(reason, self.retry_after())
+
+    # ---------------- Public API ----------------
+    @asynccontextmanager
+    async def admit(self, priority: str = BULK):
+        """Hold an inference slot for the duration of the ``async with`` block"""
+        started = time.monotonic()
+        queue_ahead = self._waiters[priority] or (priority == BULK and self._waiters[INTERACTIVE])
+        if not queue_ahead and self._can_run(priority):
+            self._running[priority] += 1
+        else:
+            if len(self._waiters[priority]) >= self.max_queue[priority]:
+                self._reject(priority, "rejected_queue_full", f"Inference queue full ({priority})")
+            future = asyncio.get_running_loop().create_future()
+            self._waiters[priority].append(future)
+            try:
+                await asyncio.wait({future}, timeout=self.deadline)
+            except BaseException:
+                # The request itself was cancelled (client went away)
+                if future.done() and not future.cancelled():
+                    self._release(priority)
+                else:
+                    self._leave_queue(priority, future)
+                raise
+            if not future.done():
+                self._leave_queue(priority, future)
+                self._reject(
+                    priority, "rejected_deadline",
+                    f"Waited more than {self.deadline:g}s for an inference slot ({priority})",
+                )
+
+        waited = time.monotonic() - started
+        self._counters[priority]["admitted"] += 1
+        self._counters[priority]["wait_seconds_total"] += waited
+        service_started = time.monotonic()
+        try:
+            yield
+        finally:
+            self._release(priority, time.monotonic() - service_started)
+
+    def metrics(self) -> dict:
+        return {
+            "capacity": self.capacity,
+            "bulk_limit": self.bulk_limit,
+            "deadline_seconds": self.deadline,
+            "service_seconds_ewma": round(self._service_ewma, 4),
+            "retry_after_seconds": self.retry_after(),
+            "classes": {
+                priority: {
+                    "running": self._running[priority],
+                    "queued": len(self._waiters[priority]),
+                    "max_queue": self.max_queue[priority],
+                    **{k: round(v, 4) if isinstance(v, float) else v for k, v in self._counters[priority].items()},
+                }
+                for priority in PRIORITIES
+            },
+        }
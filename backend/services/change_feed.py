@@ -0,0 +1,211 @@
+"""Versioned change log for the faces collection.
+
+Every mutation of ``faces`` also writes a small record to ``face_changes`` with a
+monotonically increasing ``seq`` taken from a counter document. Replicas tail
+the log from the last ``seq`` they applied (their resume token) and patch their
+local gallery index instead of reloading the whole collection.
+
+Record shape::
+
+    {"seq": 42, "op": "append", "face_id": "...", "embedding_id": "...", "origin": "...", "at": datetime}
+
+- ``append`` / ``replace_embedding``: one ``face_embeddings`` document was
+  added or rewritten; re-read that document
+- ``remove_embedding``: one enrolled image is gone
+- ``upsert``: any of the face's embeddings may have changed (bulk tools);
+  re-read them all
+- ``update``: metadata only (name, age, ...); the index is unaffected
+- ``delete``: the face is gone
+- ``clear``: the whole collection was emptied
+
+Every op is idempotent by ``embedding_id`` or ``face_id``, so replaying a record
+never duplicates rows. ``origin`` names the process that wrote the record; a
+process that already applied its own change to its index can skip it.
+"""
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+from pymongo import ASCENDING, ReturnDocument
+
+OP_UPSERT = "upsert"
+OP_UPDATE = "update"
+OP_DELETE = "delete"
+OP_CLEAR = "clear"
+OP_APPEND = "append"
+OP_REMOVE_EMBEDDING = "remove_embedding"
+OP_REPLACE_EMBEDDING = "replace_embedding"
+
+# Bumped for media changes that do not go through the feed (a queued upload
+# landing, thumbnails being generated), so cached listings still revalidate
+MEDIA_VERSION_COUNTER = "media_version"
+
+
+def bump_media_version(db):
+    db["counters"].update_one({"_id": MEDIA_VERSION_COUNTER}, {"$inc": {"seq": 1}}, upsert=True)
+
+
+class ChangeFeed:
+    """Writer/reader for the face_changes collection"""
+
+    def __init__(self, db, name: str = "face_changes", retention_days: float = 7, async_db=None,
+                 origin: Optional[str] = None):
+        self.collection = db[name]
+        self.counters = db["counters"]
+        # Optional motor handles so request handlers can record without blocking
+        self.async_collection = async_db[name] if async_db is not None else None
+        self.async_counters = async_db["counters"] if async_db is not None else None
+        self.counter_id = name
+        self.retention_days = retention_days
+        self.origin = origin
+
+    def ensure_indexes(self):
+        self.collection.create_index([("seq", ASCENDING)], unique=True)
+        if self.retention_days > 0:
+            self.collection.create_index(
+                [("at", ASCENDING)], expireAfterSeconds=int(self.retention_days * 86400)
+            )
+
+    def _record_doc(self, seq: int, op: str, face_id: Optional[str], embedding_id: Optional[str]) -> dict:
+        doc = {"seq": seq, "op": op, "face_id": face_id, "at": datetime.utcnow()}
+        if embedding_id is not None:
+            doc["embedding_id"] = embedding_id
+        if self.origin is not None:
+            doc["origin"] = self.origin
+        return doc
+
+    def record(self, op: str, face_id: Optional[str] = None, embedding_id: Optional[str] = None) -> int:
+        """Append a change and return its sequence number"""
+        counter = self.counters.find_one_and_update(
+            {"_id": self.counter_id},
+            {"$inc": {"seq": 1}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        seq = int(counter["seq"])
+        self.collection.insert_one(self._record_doc(seq, op, face_id, embedding_id))
+        return seq
+
+    async def record_async(self, op: str, face_id: Optional[str] = None, embedding_id: Optional[str] = None) -> int:
+        """``record`` on the motor handles (requires ``async_db``)"""
+        counter = await self.async_counters.find_one_and_update(
+            {"_id": self.counter_id},
+            {"$inc": {"seq": 1}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        seq = int(counter["seq"])
+        await self.async_collection.insert_one(self._record_doc(seq, op, face_id, embedding_id))
+        return seq
+
+    def latest_seq(self) -> int:
+        """Highest sequence number handed out so far (0 if the log is empty)"""
+        counter = self.counters.find_one({"_id": self.counter_id})
+        return int(counter["seq"]) if counter else 0
+
+    async def version_async(self) -> str:
+        """``<latest seq>.<media version>``: changes whenever a face listing could change"""
+        versions = {MEDIA_VERSION_COUNTER: 0, self.counter_id: 0}
+        cursor = self.async_counters.find({"_id": {"$in": list(versions)}})
+        async for counter in cursor:
+            versions[counter["_id"]] = int(counter.get("seq", 0))
+        return f"{versions[self.counter_id]}.{versions[MEDIA_VERSION_COUNTER]}"
+
+    def oldest_seq(self) -> Optional[int]:
+        doc = self.collection.find_one({}, {"seq": 1}, sort=[("seq", ASCENDING)])
+        return int(doc["seq"]) if doc else None
+
+    def changes_since(self, seq: int, limit: int = 500) -> List[Dict[str, Any]]:
+        cursor = self.collection.find(
+            {"seq": {"$gt": int(seq)}}, {"_id": 0}
+        ).sort("seq", ASCENDING).limit(limit)
+        try:
+            return list(cursor)
+        finally:
+            cursor.close()
+
+
+class ChangeFeedTailer:
+    """Applies face_changes to a local index, resuming from a persisted token.
+
+    ``poll`` applies whatever is new and returns the token to persist;
+    ``commit`` persists it. They are separate so a caller that applies changes
+    asynchronously (the shared-memory writer) only commits after they landed:
+    replaying an upsert is harmless, skipping one is not.
+    """
+
+    def __init__(
+        self,
+        feed: ChangeFeed,
+        apply_change: Callable[[Dict[str, Any]], None],
+        load_token: Callable[[], int],
+        save_token: Callable[[int], None],
+        rebuild: Callable[[], None],
+        interval: float = 1.0,
+        gap_grace: float = 5.0,
+        batch_size: int = 500,
+    ):
+        self.feed = feed
+        self.apply_change = apply_change
+        self.load_token = load_token
+        self.save_token = save_token
+        self.rebuild = rebuild
+        self.interval = max(0.05, float(interval))
+        self.gap_grace = float(gap_grace)
+        self.batch_size = max(1, int(batch_size))
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def poll(self) -> Optional[int]:
+        """Apply pending changes. Returns the new resume token, or None if nothing changed."""
+        token = int(self.load_token())
+        oldest = self.feed.oldest_seq()
+        if token > 0 and oldest is not None and oldest > token + 1:
+            # Our token fell off the retention window: deltas are gone, reload everything
+            print(f"⚠️ Change feed resume token {token} is older than retained log ({oldest}); rebuilding")
+            self.rebuild()
+            return None
+
+        changes = self.feed.changes_since(token, self.batch_size)
+        if not changes:
+            return None
+
+        applied = token
+        cutoff = datetime.utcnow() - timedelta(seconds=self.gap_grace)
+        for change in changes:
+            seq = int(change["seq"])
+            if seq != applied + 1 and change.get("at", cutoff) > cutoff:
+                # A lower seq was allocated but not written yet (concurrent writer);
+                # wait for it rather than skipping past it for good.
+                break
+            self.apply_change(change)
+            applied = seq
+        return applied if applied != token else None
+
+    def commit(self, token: Optional[int]):
+        if token is not None:
+            self.save_token(token)
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="change-feed", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval * 4)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                token = self.poll()
+                while token is not None:
+                    self.commit(token)
+                    if self._stop.is_set():
+                        break
+                    token = self.poll()
+            except Exception as e:
+                print(f"⚠️ Change feed poll failed: {e}")
+            self._stop.wait(self.interval)
@@ -1,70 +1,44 @@
 import cloudinary
 import cloudinary.uploader
-from cloudinary.utils import cloudinary_url
 from typing import Dict, Any, Optional
+import io
 import os
 
-class CloudinaryService:
+from services.media_storage import MediaStorage
+
+
+class CloudinaryStorage(MediaStorage):
+    """Cloudinary behind the media storage interface (MEDIA_STORAGE=cloudinary)"""
+
+    name = "cloudinary"
+
     def __init__(self):
+        cloud_name = os.getenv('CLOUDINARY_CLOUD_NAME')
+        api_key = os.getenv('CLOUDINARY_API_KEY')
+        api_secret = os.getenv('CLOUDINARY_API_SECRET')
+        if not cloud_name or not api_key or not api_secret:
+            raise RuntimeError(
+                "Cloudinary configuration is required when MEDIA_STORAGE=cloudinary. "
+                "Set CLOUDINARY_CLOUD_NAME, CLOUDINARY_API_KEY, and CLOUDINARY_API_SECRET in your .env file, "
+                "or use MEDIA_STORAGE=local."
+            )
         cloudinary.config(
-            cloud_name=os.getenv('CLOUDINARY_CLOUD_NAME'),
-            api_key=os.getenv('CLOUDINARY_API_KEY'),
-            api_secret=os.getenv('CLOUDINARY_API_SECRET')
+            cloud_name=cloud_name,
+            api_key=api_key,
+            api_secret=api_secret,
+            secure=True
         )
-    
-    async def upload_asset(self, file, category: str, name: str) -> Dict[str, Any]:
+
+    def put(self, data: bytes, folder: str, public_id: str, content_type: str = "application/octet-stream",
+            options: Optional[dict] = None, base_url: str = "") -> Dict[str, Any]:
         try:
-            # Upload with folder structure
-            result = cloudinary.uploader.upload(
-                file,
-                folder=f"forensic-assets/{category}",
-                public_id=f"{name.lower().replace(' ', '-')}",
-                resource_type="image",
-                transformation=[
-                    {"quality": "auto"},
-                    {"fetch_format": "auto"}
-                ]
-            )
-            
-            return {
-                "url": result['secure_url'],
-                "public_id": result['public_id'],
-                "width": result['width'],
-                "height": result['height'],
-                "format": result['format'],
-                "file_size": result['bytes']
-            }
+            return cloudinary.uploader.upload(io.BytesIO(data), folder=folder, public_id=public_id, **(options or {}))
         except Exception as e:
             raise Exception(f"Cloudinary upload failed: {str(e)}")
-    
-    async def delete_asset(self, public_id: str) -> bool:
+
+    def delete(self, public_id: str) -> bool:
         try:
             result = cloudinary.uploader.destroy(public_id)
             return result.get('result') == 'ok'
         except Exception as e:
             raise Exception(f"Cloudinary delete failed: {str(e)}")
-    
-    async def upload_sketch_image(self, file, name: str) -> Dict[str, Any]:
-        """Upload sketch image to Cloudinary in Sketch folder"""
-        try:
-            result = cloudinary.uploader.upload(
-                file,
-                folder="Sketch",
-                public_id=f"sketch_{name.lower().replace(' ', '_')}",
-                resource_type="image",
-                transformation=[
-                    {"quality": "auto"},
-                    {"fetch_format": "auto"}
-                ]
-            )
-            
-            return {
-                "url": result['secure_url'],
-                "public_id": result['public_id'],
-                "width": result['width'],
-                "height": result['height'],
-                "format": result['format'],
-                "file_size": result['bytes']
-            }
-        except Exception as e:
-            raise Exception(f"Cloudinary sketch upload failed: {str(e)}")
\ No newline at end of file
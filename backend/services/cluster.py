@@ -0,0 +1,112 @@
+"""Scatter-gather recognition across gallery shard nodes.
+
+Each shard node runs the regular API with ``CLUSTER_ROLE=shard`` and only
+indexes the faces whose id hashes to its ``SHARD_INDEX``. A coordinator node
+(``CLUSTER_ROLE=coordinator``) fans a query embedding out to every shard,
+waits at most ``timeout`` seconds per shard, merges the per-shard top-k lists
+and reports which shards did not answer so callers can tell a partial result
+from a complete one.
+
+Index changes are not pushed to shards. Every enrollment change is recorded in
+the ``face_changes`` feed, and each shard tails it and applies the rows it
+owns. Shards therefore converge without the coordinator having to reach them,
+and one that was down catches up from its saved position.
+"""
+import asyncio
+import base64
+import hashlib
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+import numpy as np
+
+from services.embedding_store import SearchHit
+
+SHARD_TOKEN_HEADER = "X-Shard-Token"
+
+
+def shard_for(face_id: str, shard_count: int) -> int:
+    """Stable hash partition of a face id (independent of PYTHONHASHSEED)"""
+    digest = hashlib.blake2b(face_id.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big") % max(1, shard_count)
+
+
+def encode_vector(vector: np.ndarray) -> str:
+    return base64.b64encode(np.asarray(vector, dtype="<f4").tobytes()).decode("ascii")
+
+
+def decode_vector(b64: str) -> np.ndarray:
+    return np.frombuffer(base64.b64decode(b64), dtype="<f4").astype("float32")
+
+
+class ClusterCoordinator:
+    """HTTP client side of the shard protocol"""
+
+    def __init__(self, shard_urls: List[str], timeout: float = 2.0, token: Optional[str] = None):
+        if not shard_urls:
+            raise ValueError("At least one shard URL is required in coordinator mode")
+        self.shard_urls = [url.rstrip("/") for url in shard_urls]
+        self.timeout = float(timeout)
+        self.headers = {SHARD_TOKEN_HEADER: token} if token else {}
+        self._async_client: Optional[httpx.AsyncClient] = None
+
+    @property
+    def shard_count(self) -> int:
+        return len(self.shard_urls)
+
+    # ---------------- Lifecycle ----------------
+    def _get_async_client(self) -> httpx.AsyncClient:
+        if self._async_client is None:
+            self._async_client = httpx.AsyncClient(headers=self.headers, timeout=self.timeout)
+        return self._async_client
+
+    async def close(self):
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+
+    # ---------------- Scatter-gather search ----------------
+    async def _search_shard(self, index: int, payload: Dict[str, Any]) -> List[SearchHit]:
+        response = await self._get_async_client().post(f"{self.shard_urls[index]}/internal/shard/search", json=payload)
+        response.raise_for_status()
+        return [
+            SearchHit(float(hit["score"]), hit["face_id"], hit["embedding_id"], -1)
+            for hit in response.json().get("hits", [])
+        ]
+
+    async def search(self, query: np.ndarray, k: int = 1) -> Tuple[List[SearchHit], Dict[str, Any]]:
+        """Query every shard concurrently and merge their top-k lists.
+
+        Returns the merged hits and a report of responding/failed shards. A shard
+        that errors or exceeds ``timeout`` is listed under ``failed`` and the
+        result is marked ``partial`` instead of failing the whole request.
+        """
+        payload = {"embedding": encode_vector(query), "k": int(k)}
+        tasks = [
+            asyncio.wait_for(self._search_shard(index, payload), timeout=self.timeout)
+            for index in range(self.shard_count)
+        ]
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+
+        hits: List[SearchHit] = []
+        failed = []
+        for index, result in enumerate(results):
+            if isinstance(result, BaseException):
+                if isinstance(result, asyncio.TimeoutError):
+                    reason = "timeout"
+                elif isinstance(result, httpx.HTTPStatusError):
+                    reason = f"HTTP {result.response.status_code}"
+                else:
+                    reason = str(result) or type(result).__name__
+                failed.append({"shard": index, "url": self.shard_urls[index], "error": reason})
+            else:
+                hits.extend(result)
+        hits.sort(key=lambda hit: hit.score, reverse=True)
+
+        report = {
+            "shards_total": self.shard_count,
+            "shards_responded": self.shard_count - len(failed),
+            "partial": bool(failed),
+            "failed": failed,
+        }
+        return hits[:max(1, int(k))], report
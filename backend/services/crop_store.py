@@ -0,0 +1,90 @@
+"""Content-addressed store of aligned face crops.
+
+Enrollment keeps the 160x160 RGB crop MTCNN aligned for each image as a raw
+uint8 array (76,800 bytes) named by its SHA-256::
+
+    <directory>/ab/abcdef....u8
+
+The embedding document references the crop by ``crop_sha256``. Re-embedding
+the gallery (model upgrade, quantization experiments) can then batch FaceNet
+straight from disk with no Cloudinary downloads and no detection. Identical
+crops are stored once, and writes are atomic so a crash never leaves a
+truncated file under a valid name.
+"""
+import hashlib
+import os
+import tempfile
+from pathlib import Path
+from typing import Iterator, Optional
+
+import numpy as np
+import torch
+
+CROP_SIZE = 160
+CROP_SHAPE = (CROP_SIZE, CROP_SIZE, 3)
+
+
+def crop_from_tensor(face: torch.Tensor) -> np.ndarray:
+    """Undo MTCNN's ``fixed_image_standardization`` and return an HxWx3 uint8 crop"""
+    pixels = face.detach().cpu().reshape(3, CROP_SIZE, CROP_SIZE) * 128.0 + 127.5
+    return pixels.round().clamp(0, 255).to(torch.uint8).permute(1, 2, 0).numpy()
+
+
+def tensor_from_crops(crops: np.ndarray) -> torch.Tensor:
+    """Stack of uint8 crops (N x 160 x 160 x 3) -> standardised FaceNet input (N x 3 x 160 x 160)"""
+    batch = torch.from_numpy(np.ascontiguousarray(crops)).permute(0, 3, 1, 2).float()
+    return (batch - 127.5) / 128.0
+
+
+class CropStore:
+    def __init__(self, directory: str):
+        self.directory = Path(directory)
+
+    def _path(self, digest: str) -> Path:
+        return self.directory / digest[:2] / f"{digest}.u8"
+
+    def put(self, crop: np.ndarray) -> str:
+        """Store ``crop`` (160x160x3 uint8) if new and return its SHA-256 hex digest"""
+        data = np.ascontiguousarray(crop, dtype=np.uint8)
+        if data.shape != CROP_SHAPE:
+            raise ValueError(f"Expected a {CROP_SHAPE} crop, got {data.shape}")
+        raw = data.tobytes()
+        digest = hashlib.sha256(raw).hexdigest()
+        path = self._path(digest)
+        if path.exists():
+            return digest
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as fh:
+                fh.write(raw)
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+        return digest
+
+    def get(self, digest: str) -> Optional[np.ndarray]:
+        try:
+            raw = self._path(digest).read_bytes()
+        except FileNotFoundError:
+            return None
+        if len(raw) != CROP_SIZE * CROP_SIZE * 3:
+            return None
+        return np.frombuffer(raw, dtype=np.uint8).reshape(CROP_SHAPE)
+
+    def has(self, digest: str) -> bool:
+        return self._path(digest).exists()
+
+    def delete(self, digest: str):
+        try:
+            self._path(digest).unlink()
+        except FileNotFoundError:
+            pass
+
+    def digests(self) -> Iterator[str]:
+        if not self.directory.exists():
+            return
+        for path in self.directory.glob("??/*.u8"):
+            yield path.stem
@@ -0,0 +1,492 @@
+"""Memory-mapped on-disk store for face embeddings.
+
+The gallery is kept in two ``.npy`` files next to each other:
+
+- ``embeddings.npy``: a ``(capacity, dim)`` float32 matrix of L2-normalised vectors
+- ``ids.npy``: a ``(capacity,)`` structured sidecar mapping every row back to the
+  ``faces`` document (``face_id``) and its ``face_embeddings`` document
+  (``embedding_id``)
+
+Both are opened with ``numpy.lib.format.open_memmap`` so the OS pages them in on
+demand instead of the process holding the whole gallery in RAM. Search streams
+over the matrix in fixed-size chunks and keeps a running top-k, so peak memory is
+bounded by ``chunk_rows`` no matter how large the gallery grows.
+
+Only one process may write a store directory. A writable store takes an
+exclusive ``flock`` on ``<directory>/.lock`` the first time it opens or
+writes, and keeps it until ``close()``. A second writer gets ``StoreLocked``
+instead of interleaving appends, growth and ``meta.json`` updates with the
+first. ``read_only=True`` maps the files without the lock, e.g. for tools or
+for workers that only search.
+"""
+import fcntl
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Callable, Iterable, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+EMBEDDING_DIM = 512
+STORE_FORMAT_VERSION = 2
+ID_DTYPE = np.dtype([("face_id", "S24"), ("embedding_id", "S24")])
+TOMBSTONE = b""
+
+
+class StoreLocked(RuntimeError):
+    """Another process holds the store directory for writing"""
+
+
+class SearchHit(NamedTuple):
+    score: float
+    face_id: str
+    embedding_id: str
+    row: int
+
+
+def merge_top_k(
+    scores_a: np.ndarray,
+    rows_a: np.ndarray,
+    scores_b: np.ndarray,
+    rows_b: np.ndarray,
+    k: int,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Merge two (scores, rows) candidate lists and keep the k best, sorted descending"""
+    scores = np.concatenate([scores_a, scores_b])
+    rows = np.concatenate([rows_a, rows_b])
+    if scores.size > k:
+        keep = np.argpartition(scores, -k)[-k:]
+        scores = scores[keep]
+        rows = rows[keep]
+    order = np.argsort(scores)[::-1]
+    return scores[order], rows[order]
+
+
+def search_rows(
+    embeddings: np.ndarray,
+    ids: np.ndarray,
+    count: int,
+    query: np.ndarray,
+    k: int = 1,
+    chunk_rows: int = 4096,
+    start: int = 0,
+) -> List[SearchHit]:
+    """Chunked top-k scan over rows ``[start, count)`` of an embedding matrix and its id sidecar"""
+    k = max(1, int(k))
+    q = np.asarray(query, dtype="float32").reshape(-1)
+    best_scores = np.empty(0, dtype="float32")
+    best_rows = np.empty(0, dtype="int64")
+    for chunk_start in range(start, count, chunk_rows):
+        chunk_stop = min(chunk_start + chunk_rows, count)
+        scores = embeddings[chunk_start:chunk_stop] @ q
+        rows = np.arange(chunk_start, chunk_stop, dtype="int64")
+        live = ids["face_id"][chunk_start:chunk_stop] != TOMBSTONE
+        if not live.all():
+            scores = scores[live]
+            rows = rows[live]
+        best_scores, best_rows = merge_top_k(best_scores, best_rows, scores, rows, k)
+
+    hits = []
+    for score, row in zip(best_scores, best_rows):
+        record = ids[int(row)]
+        hits.append(SearchHit(float(score), record["face_id"].decode("ascii"), record["embedding_id"].decode("ascii"), int(row)))
+    return hits
+
+
+class EmbeddingStore:
+    """Append-friendly memory-mapped embedding matrix with an id sidecar"""
+
+    def __init__(
+        self,
+        directory,
+        dim: int = EMBEDDING_DIM,
+        chunk_rows: int = 4096,
+        initial_capacity: int = 1024,
+        compact_ratio: float = 0.25,
+        compact_min_tombstones: int = 1024,
+        read_only: bool = False,
+    ):
+        self.directory = Path(directory)
+        self.read_only = read_only
+        self.dim = dim
+        self.chunk_rows = max(1, int(chunk_rows))
+        self.initial_capacity = max(1, int(initial_capacity))
+        # Tombstoned rows are dropped once they reach compact_ratio of the rows
+        # (and at least compact_min_tombstones); 0 disables compaction
+        self.compact_ratio = float(compact_ratio)
+        self.compact_min_tombstones = max(1, int(compact_min_tombstones))
+        self.embeddings_path = self.directory / "embeddings.npy"
+        self.ids_path = self.directory / "ids.npy"
+        self.meta_path = self.directory / "meta.json"
+        self.lock_path = self.directory / ".lock"
+        self._lock_fd: Optional[int] = None
+
+        self._embeddings: Optional[np.memmap] = None
+        self._ids: Optional[np.memmap] = None
+        self.count = 0
+        self.tombstones = 0
+        # Resume token: last face_changes sequence number reflected in the files
+        self.change_seq = 0
+        # Bumped whenever rows move (compaction), so copies of the rows know to refresh
+        self.compactions = 0
+        # Inodes of the open embeddings/ids pair; changes whenever either file is replaced
+        self.file_key: Tuple[int, int] = (0, 0)
+        self._lock = threading.RLock()
+
+    # ---------------- Lifecycle ----------------
+    @property
+    def is_open(self) -> bool:
+        return self._embeddings is not None and self._ids is not None
+
+    @property
+    def capacity(self) -> int:
+        return 0 if self._embeddings is None else int(self._embeddings.shape[0])
+
+    @property
+    def live_count(self) -> int:
+        return self.count - self.tombstones
+
+    def lock(self):
+        """Take the directory's writer lock (a no-op if this store already holds it)"""
+        with self._lock:
+            if self._lock_fd is not None:
+                return
+            if self.read_only:
+                raise RuntimeError("A read-only embedding store cannot be locked for writing")
+            self.directory.mkdir(parents=True, exist_ok=True)
+            fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(fd)
+                raise StoreLocked(f"Embedding store {self.directory} is open for writing in another process")
+            self._lock_fd = fd
+
+    def _unlock(self):
+        if self._lock_fd is not None:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+            os.close(self._lock_fd)
+            self._lock_fd = None
+
+    def open(self) -> bool:
+        """Reopen an existing store from disk. Returns False if there is nothing usable."""
+        with self._lock:
+            if not self.read_only:
+                self.lock()
+            if not (self.embeddings_path.exists() and self.ids_path.exists() and self.meta_path.exists()):
+                return False
+            try:
+                meta = json.loads(self.meta_path.read_text())
+                if meta.get("version") != STORE_FORMAT_VERSION or meta.get("dim") != self.dim:
+                    return False
+                mode = "r" if self.read_only else "r+"
+                embeddings = np.lib.format.open_memmap(str(self.embeddings_path), mode=mode)
+                ids = np.lib.format.open_memmap(str(self.ids_path), mode=mode)
+            except (OSError, ValueError) as e:
+                print(f"⚠️ Could not reopen embedding store at {self.directory}: {e}")
+                return False
+            if embeddings.shape[1:] != (self.dim,) or ids.dtype != ID_DTYPE or ids.shape[0] != embeddings.shape[0]:
+                return False
+            count = int(meta.get("count", 0))
+            if count > embeddings.shape[0]:
+                return False
+            self._embeddings = embeddings
+            self._ids = ids
+            self.file_key = self._stat_key()
+            self.count = count
+            self.tombstones = int(meta.get("tombstones", 0))
+            self.change_seq = int(meta.get("change_seq", 0))
+            return True
+
+    def close(self):
+        """Unmap the files and give up the writer lock"""
+        with self._lock:
+            self._unmap()
+            self._unlock()
+
+    def _unmap(self):
+        if not self.read_only:
+            if self._embeddings is not None:
+                self._embeddings.flush()
+            if self._ids is not None:
+                self._ids.flush()
+        self._embeddings = None
+        self._ids = None
+
+    def rebuild(
+        self,
+        rows: Iterable[Tuple[str, str, np.ndarray]],
+        expected_rows: int = 0,
+        change_seq: Optional[int] = None,
+    ):
+        """Replace the store contents with ``rows`` streamed from the database.
+
+        The new files are written next to the live ones and swapped in with
+        ``os.replace`` so readers never see a half-built gallery. ``change_seq``
+        is the change-feed position the rows reflect (unchanged if None).
+        """
+        with self._lock:
+            self.lock()
+            capacity = max(self.initial_capacity, int(expected_rows))
+            tmp_emb = self.embeddings_path.with_suffix(".npy.tmp")
+            tmp_ids = self.ids_path.with_suffix(".npy.tmp")
+            embeddings, ids = self._create_files(tmp_emb, tmp_ids, capacity)
+
+            count = 0
+            for face_id, embedding_id, embedding in rows:
+                if count >= embeddings.shape[0]:
+                    embeddings, ids = self._grow_files(tmp_emb, tmp_ids, embeddings, ids, count)
+                embeddings[count] = np.asarray(embedding, dtype="float32").reshape(self.dim)
+                ids[count] = (face_id.encode("ascii"), embedding_id.encode("ascii"))
+                count += 1
+
+            embeddings.flush()
+            ids.flush()
+            del embeddings, ids
+            self._install(tmp_emb, tmp_ids, count, change_seq)
+
+    def load_arrays(
+        self,
+        embeddings: np.ndarray,
+        ids: np.ndarray,
+        change_seq: Optional[int] = None,
+        row_filter: Optional[Callable[[np.ndarray], np.ndarray]] = None,
+        copy_rows: int = 16384,
+    ):
+        """Replace the store contents with a ``(rows, dim)`` matrix and its ``ID_DTYPE`` sidecar.
+
+        Rows are block-copied (typically straight out of an mmapped snapshot),
+        so this costs one sequential pass over the data instead of one Python
+        iteration per row. ``row_filter`` receives each chunk of ids and returns
+        a boolean mask of the rows to keep.
+        """
+        if embeddings.ndim != 2 or embeddings.shape[1] != self.dim:
+            raise ValueError(f"Expected a (rows, {self.dim}) matrix, got {embeddings.shape}")
+        if ids.dtype != ID_DTYPE or ids.shape[0] != embeddings.shape[0]:
+            raise ValueError("ids must be an ID_DTYPE array with one entry per row")
+        with self._lock:
+            self.lock()
+            rows = int(embeddings.shape[0])
+            tmp_emb = self.embeddings_path.with_suffix(".npy.tmp")
+            tmp_ids = self.ids_path.with_suffix(".npy.tmp")
+            out_emb, out_ids = self._create_files(tmp_emb, tmp_ids, max(self.initial_capacity, rows))
+
+            count = 0
+            for start in range(0, rows, copy_rows):
+                stop = min(start + copy_rows, rows)
+                chunk_ids = ids[start:stop]
+                chunk_emb = embeddings[start:stop]
+                if row_filter is not None:
+                    keep = np.asarray(row_filter(chunk_ids), dtype=bool)
+                    chunk_ids = chunk_ids[keep]
+                    chunk_emb = chunk_emb[keep]
+                n = len(chunk_ids)
+                out_emb[count:count + n] = chunk_emb
+                out_ids[count:count + n] = chunk_ids
+                count += n
+
+            out_emb.flush()
+            out_ids.flush()
+            del out_emb, out_ids
+            self._install(tmp_emb, tmp_ids, count, change_seq)
+
+    def view(self) -> Tuple[np.ndarray, np.ndarray, int, int]:
+        """(embeddings, ids, count, change_seq) as of now, for readers that scan without the lock.
+
+        Later appends land past ``count``, and tombstones or in-place replacements
+        made during the scan are reapplied by replaying the change feed from
+        ``change_seq``, so a copy taken from the view is a valid starting point.
+        """
+        with self._lock:
+            self._require_open()
+            return self._embeddings, self._ids, self.count, self.change_seq
+
+    def files(self) -> Tuple[str, str, Tuple[int, int], int]:
+        """(embeddings path, ids path, file_key, count) for readers that map the files themselves.
+
+        The files are replaced one after the other, so a reader has to check
+        that the pair it opened still has ``file_key`` before trusting a row
+        of one to describe the same row of the other.
+        """
+        with self._lock:
+            self._require_open()
+            return str(self.embeddings_path), str(self.ids_path), self.file_key, self.count
+
+    def compact(self) -> int:
+        """Rewrite the files without tombstoned rows. Returns the number of rows dropped."""
+        with self._lock:
+            self._require_writable()
+            dropped = self.tombstones
+            if not dropped:
+                return 0
+            self.load_arrays(
+                self._embeddings[:self.count], self._ids[:self.count],
+                row_filter=lambda ids: ids["face_id"] != TOMBSTONE,
+                copy_rows=self.chunk_rows,
+            )
+            self.compactions += 1
+            return dropped
+
+    def clear(self):
+        """Drop every row while keeping the files allocated."""
+        self.rebuild(())
+
+    def set_change_seq(self, change_seq: int):
+        """Persist the change-feed resume token alongside the data it describes"""
+        with self._lock:
+            self._require_writable()
+            self.change_seq = int(change_seq)
+            self._write_meta()
+
+    # ---------------- Mutations ----------------
+    def append(self, face_id: str, embedding_id: str, embedding: np.ndarray) -> int:
+        """Append one embedding and return its row number."""
+        with self._lock:
+            self._require_writable()
+            if self.count >= self.capacity:
+                self._grow_live()
+            row = self.count
+            self._embeddings[row] = np.asarray(embedding, dtype="float32").reshape(self.dim)
+            self._ids[row] = (face_id.encode("ascii"), embedding_id.encode("ascii"))
+            self.count = row + 1
+            self._embeddings.flush()
+            self._ids.flush()
+            self._write_meta()
+            return row
+
+    def remove_face(self, face_id: str) -> int:
+        """Tombstone every row belonging to ``face_id``. Returns the number of rows removed."""
+        return self._tombstone("face_id", face_id)
+
+    def remove_embedding(self, embedding_id: str) -> int:
+        """Tombstone the row(s) of one enrolled image. Returns the number of rows removed."""
+        return self._tombstone("embedding_id", embedding_id)
+
+    def replace_embedding(self, face_id: str, embedding_id: str, embedding: np.ndarray) -> int:
+        """Overwrite the vector of an enrolled image in place (appending it if unknown)"""
+        with self._lock:
+            self._require_writable()
+            rows = self.find_rows("embedding_id", embedding_id)
+            if not len(rows):
+                return self.append(face_id, embedding_id, embedding)
+            vector = np.asarray(embedding, dtype="float32").reshape(self.dim)
+            for row in rows:
+                self._embeddings[row] = vector
+            self._embeddings.flush()
+            return int(rows[0])
+
+    def embedding_ids(self, face_id: str) -> List[str]:
+        """Embedding ids currently indexed for ``face_id``"""
+        with self._lock:
+            self._require_open()
+            rows = self.find_rows("face_id", face_id)
+            return [self._ids[int(row)]["embedding_id"].decode("ascii") for row in rows]
+
+    def find_rows(self, field: str, value: str) -> np.ndarray:
+        """Row numbers whose ``face_id``/``embedding_id`` equals ``value`` (chunked scan)"""
+        key = value.encode("ascii")
+        found = [np.empty(0, dtype="int64")]
+        for start in range(0, self.count, self.chunk_rows):
+            stop = min(start + self.chunk_rows, self.count)
+            found.append(np.nonzero(self._ids[field][start:stop] == key)[0] + start)
+        return np.concatenate(found)
+
+    def _tombstone(self, field: str, value: str) -> int:
+        with self._lock:
+            self._require_writable()
+            rows = self.find_rows(field, value)
+            if not len(rows):
+                return 0
+            self._ids[rows] = (TOMBSTONE, TOMBSTONE)
+            self._embeddings[rows] = 0.0
+            self.tombstones += len(rows)
+            self._embeddings.flush()
+            self._ids.flush()
+            self._write_meta()
+            if self.compact_ratio > 0 and self.tombstones >= max(self.compact_min_tombstones, self.compact_ratio * self.count):
+                self.compact()
+            return len(rows)
+
+    # ---------------- Search ----------------
+    def search(self, query: np.ndarray, k: int = 1) -> List[SearchHit]:
+        """Score ``query`` against every live row, one chunk at a time, keeping the top-k."""
+        # Snapshot under the lock (growth and installs swap the arrays), scan outside it
+        with self._lock:
+            if not self.is_open or self.count == 0:
+                return []
+            embeddings, ids, count = self._embeddings, self._ids, self.count
+        return search_rows(embeddings, ids, count, query, k, self.chunk_rows)
+
+    # ---------------- Internals ----------------
+    def _require_open(self):
+        if not self.is_open:
+            raise RuntimeError("Embedding store is not open")
+
+    def _require_writable(self):
+        self._require_open()
+        if self.read_only:
+            raise RuntimeError("Embedding store is open read-only")
+
+    def _create_files(self, emb_path: Path, ids_path: Path, capacity: int):
+        embeddings = np.lib.format.open_memmap(
+            str(emb_path), mode="w+", dtype="float32", shape=(capacity, self.dim)
+        )
+        ids = np.lib.format.open_memmap(str(ids_path), mode="w+", dtype=ID_DTYPE, shape=(capacity,))
+        return embeddings, ids
+
+    def _grow_files(self, emb_path: Path, ids_path: Path, embeddings, ids, used: int):
+        """Double the capacity of a pair of memmaps, copying the first ``used`` rows chunk by chunk."""
+        new_capacity = max(self.initial_capacity, embeddings.shape[0] * 2)
+        grow_emb = emb_path.with_suffix(".grow")
+        grow_ids = ids_path.with_suffix(".grow")
+        new_embeddings, new_ids = self._create_files(grow_emb, grow_ids, new_capacity)
+        for start in range(0, used, self.chunk_rows):
+            stop = min(start + self.chunk_rows, used)
+            new_embeddings[start:stop] = embeddings[start:stop]
+            new_ids[start:stop] = ids[start:stop]
+        new_embeddings.flush()
+        new_ids.flush()
+        del embeddings, ids, new_embeddings, new_ids
+        os.replace(grow_emb, emb_path)
+        os.replace(grow_ids, ids_path)
+        return (
+            np.lib.format.open_memmap(str(emb_path), mode="r+"),
+            np.lib.format.open_memmap(str(ids_path), mode="r+"),
+        )
+
+    def _grow_live(self):
+        embeddings, ids = self._embeddings, self._ids
+        self._embeddings = None
+        self._ids = None
+        self._embeddings, self._ids = self._grow_files(
+            self.embeddings_path, self.ids_path, embeddings, ids, self.count
+        )
+        self.file_key = self._stat_key()
+
+    def _stat_key(self) -> Tuple[int, int]:
+        return os.stat(self.embeddings_path).st_ino, os.stat(self.ids_path).st_ino
+
+    def _install(self, tmp_emb: Path, tmp_ids: Path, count: int, change_seq: Optional[int]):
+        """Swap freshly written files in place of the live ones (caller holds the lock)"""
+        self._unmap()
+        os.replace(tmp_emb, self.embeddings_path)
+        os.replace(tmp_ids, self.ids_path)
+        self.count = count
+        self.tombstones = 0
+        if change_seq is not None:
+            self.change_seq = int(change_seq)
+        self._write_meta()
+        self.open()
+
+    def _write_meta(self):
+        meta = {
+            "version": STORE_FORMAT_VERSION,
+            "dim": self.dim,
+            "count": self.count,
+            "tombstones": self.tombstones,
+            "change_seq": self.change_seq,
+        }
+        tmp = self.meta_path.with_suffix(".json.tmp")
+        tmp.write_text(json.dumps(meta))
+        os.replace(tmp, self.meta_path)
@@ -0,0 +1,95 @@
+"""Coarse-to-fine face detection.
+
+MTCNN's cost is dominated by its image pyramid, which grows with the input
+size and shrinks with ``min_face_size``. The detector therefore:
+
+1. runs MTCNN on a small proxy of the image (longest side ``proxy_side``) with
+   a minimum face size proportional to the proxy (``min_face_fraction``), so
+   the pyramid has only a few levels;
+2. scales the selected box and landmarks back to the full-resolution image and
+   extracts the 160x160 aligned crop from there, so crop quality is the same
+   as (or better than) detecting at full size.
+
+If nothing is found on the proxy, one full-resolution pass with the model's
+own ``min_face_size`` runs as a fallback so small faces are not lost.
+"""
+import time
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+from facenet_pytorch import MTCNN
+from facenet_pytorch.models.utils.detect_face import detect_face
+from PIL import Image
+
+
+def _detect(mtcnn: MTCNN, img: Image.Image, min_face_size: int):
+    """``MTCNN.detect(img, landmarks=True)`` with a per-call minimum face size"""
+    batch_boxes, batch_points = detect_face(
+        img, min_face_size, mtcnn.pnet, mtcnn.rnet, mtcnn.onet,
+        mtcnn.thresholds, mtcnn.factor, mtcnn.device,
+    )
+    boxes, points = np.array(batch_boxes[0]), np.array(batch_points[0])
+    if len(boxes) == 0:
+        return None, None, None
+    if mtcnn.select_largest:
+        order = np.argsort((boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1]))[::-1]
+        boxes, points = boxes[order], points[order]
+    return boxes[:, :4], boxes[:, 4], points
+
+
+class CoarseToFineDetector:
+    """Find the face on a downscaled proxy, crop it from the original"""
+
+    def __init__(self, mtcnn: MTCNN, proxy_side: int = 400, min_face_fraction: float = 0.06):
+        self.mtcnn = mtcnn
+        self.proxy_side = max(64, int(proxy_side))
+        self.min_face_fraction = max(0.0, float(min_face_fraction))
+
+    def detect(
+        self,
+        img: Image.Image,
+        timings: Optional[Dict[str, float]] = None,
+    ) -> Tuple[Optional[np.ndarray], Optional[float], Optional[np.ndarray]]:
+        """Return the selected (box, probability, landmarks) in ``img`` coordinates, or Nones"""
+        started = time.perf_counter()
+        scale = min(1.0, self.proxy_side / max(img.width, img.height))
+        found = (None, None, None)
+        if scale < 1.0:
+            proxy = img.resize(
+                (max(1, round(img.width * scale)), max(1, round(img.height * scale))),
+                Image.Resampling.BILINEAR,
+            )
+            min_face = max(self.mtcnn.min_face_size, int(self.min_face_fraction * min(proxy.width, proxy.height)))
+            boxes, probs, points = _detect(self.mtcnn, proxy, min_face)
+            proxy.close()
+            if boxes is not None:
+                found = self._select(boxes / scale, probs, points / scale, img)
+        if timings is not None:
+            timings["detect_proxy"] = timings.get("detect_proxy", 0.0) + time.perf_counter() - started
+
+        if found[0] is None:
+            # Small face (or small image): one pass at full resolution
+            started = time.perf_counter()
+            boxes, probs, points = _detect(self.mtcnn, img, self.mtcnn.min_face_size)
+            if boxes is not None:
+                found = self._select(boxes, probs, points, img)
+            if timings is not None:
+                timings["detect_full"] = timings.get("detect_full", 0.0) + time.perf_counter() - started
+        return found
+
+    def _select(self, boxes, probs, points, img):
+        boxes, probs, points = self.mtcnn.select_boxes(
+            boxes, probs, points, img, method=self.mtcnn.selection_method
+        )
+        if boxes is None:
+            return None, None, None
+        # Unbatched select_boxes returns a scalar probability
+        return boxes[0], float(np.ravel(probs)[0]), points[0] if points is not None else None
+
+    def crop(self, img: Image.Image, box: np.ndarray, timings: Optional[Dict[str, float]] = None):
+        """Aligned, standardised 3x160x160 face tensor cut from ``img``"""
+        started = time.perf_counter()
+        face = self.mtcnn.extract(img, np.asarray(box, dtype="float32").reshape(1, 4), None)
+        if timings is not None:
+            timings["crop"] = timings.get("crop", 0.0) + time.perf_counter() - started
+        return face
@@ -0,0 +1,117 @@
+"""Per-image embedding documents for the faces gallery.
+
+Each enrolled photo gets its own document in ``face_embeddings``::
+
+    {
+        "_id": ObjectId,
+        "face_id": ObjectId,        # owning faces document
+        "embedding": Binary,        # raw little-endian float32, L2-normalised
+        "image_url": "https://...",
+        "quality": 0.73,            # enrollment quality score (absent on legacy rows)
+        "crop_sha256": "ab12...",   # aligned crop in the CropStore (absent on legacy rows)
+        "created_at": datetime,
+    }
+
+``faces`` keeps the identity metadata and the ``image_urls`` list used by the
+gallery, but no longer grows an ``embeddings`` array. Adding or removing one
+photo is a single targeted write, no identity can approach the 16MB document
+limit, and index rebuilds can stream embeddings in ``_id`` order.
+"""
+import base64
+import pickle
+from datetime import datetime
+from typing import Iterator, Optional, Tuple
+
+import numpy as np
+from bson import Binary, ObjectId
+from pymongo import ASCENDING
+
+from services.change_feed import OP_UPSERT
+
+
+def encode_vector(embedding: np.ndarray) -> Binary:
+    return Binary(np.asarray(embedding, dtype="<f4").tobytes())
+
+
+def decode_vector(data: bytes) -> np.ndarray:
+    return np.frombuffer(data, dtype="<f4").astype("float32")
+
+
+def decode_legacy_embedding(b64: str) -> np.ndarray:
+    """Decode the base64-pickled vectors stored in the old ``faces.embeddings`` arrays"""
+    return pickle.loads(base64.b64decode(b64.encode("utf-8"))).astype("float32")
+
+
+def ensure_indexes(embeddings_collection):
+    embeddings_collection.create_index([("face_id", ASCENDING), ("_id", ASCENDING)])
+
+
+def make_embedding_doc(
+    face_id: ObjectId,
+    embedding: np.ndarray,
+    image_url: str,
+    quality: Optional[float] = None,
+    crop_sha256: Optional[str] = None,
+) -> dict:
+    doc = {
+        "face_id": face_id,
+        "embedding": encode_vector(embedding),
+        "image_url": image_url,
+        "created_at": datetime.utcnow(),
+    }
+    if quality is not None:
+        doc["quality"] = float(quality)
+    if crop_sha256 is not None:
+        doc["crop_sha256"] = crop_sha256
+    return doc
+
+
+def iter_embeddings(
+    embeddings_collection,
+    face_id: Optional[ObjectId] = None,
+    batch_size: int = 1000,
+) -> Iterator[Tuple[str, str, np.ndarray]]:
+    """Stream (face_id, embedding_id, vector) rows, optionally for a single face"""
+    query = {} if face_id is None else {"face_id": face_id}
+    cursor = embeddings_collection.find(
+        query, {"face_id": 1, "embedding": 1}
+    ).sort("_id", ASCENDING).batch_size(batch_size)
+    try:
+        for doc in cursor:
+            yield str(doc["face_id"]), str(doc["_id"]), decode_vector(doc["embedding"])
+    finally:
+        cursor.close()
+
+
+def migrate_legacy_faces(faces_collection, embeddings_collection, feed=None) -> int:
+    """Move ``faces.embeddings`` arrays into per-image documents.
+
+    Safe to re-run: a face's previously migrated rows are replaced, and the
+    legacy array is only removed after its rows were written. When a change
+    ``feed`` is given, each migrated face is recorded as an upsert so running
+    workers reload its rows. Returns the number of faces migrated.
+    """
+    migrated = 0
+    cursor = faces_collection.find(
+        {"embeddings": {"$exists": True}}, {"embeddings": 1, "image_urls": 1}
+    )
+    try:
+        for face in cursor:
+            image_urls = face.get("image_urls", [])
+            docs = []
+            for index, emb_b64 in enumerate(face.get("embeddings", [])):
+                image_url = image_urls[index] if index < len(image_urls) else (image_urls[0] if image_urls else "")
+                doc = make_embedding_doc(face["_id"], decode_legacy_embedding(emb_b64), image_url)
+                doc["legacy_index"] = index
+                docs.append(doc)
+
+            embeddings_collection.delete_many({"face_id": face["_id"], "legacy_index": {"$exists": True}})
+            if docs:
+                embeddings_collection.insert_many(docs, ordered=True)
+            faces_collection.update_one({"_id": face["_id"]}, {"$unset": {"embeddings": ""}})
+            if feed is not None:
+                feed.record(OP_UPSERT, str(face["_id"]))
+            migrated += 1
+    finally:
+        cursor.close()
+    return migrated
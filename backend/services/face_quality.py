@@ -0,0 +1,121 @@
+"""Enrollment-time face quality scoring and per-identity embedding selection.
+
+A quality score in [0, 1] is the product of four factors, each in [0, 1]:
+
+- detection: MTCNN's face probability
+- size: shorter side of the face box relative to ``TARGET_FACE_PX``
+- sharpness: variance of the Laplacian of the (resized, grayscale) face box
+- pose: frontal-ness from the five MTCNN landmarks (nose offset from the eye
+  midpoint for yaw, eye-line angle for roll)
+
+An upload where MTCNN found no face scores 0. ``select_diverse`` then picks at
+most N embeddings per identity, trading quality against redundancy (maximal
+marginal relevance), so the gallery keeps a few good, different views instead
+of every photo ever uploaded.
+"""
+import math
+from typing import List, NamedTuple, Optional, Sequence
+
+import numpy as np
+from PIL import Image
+
+TARGET_FACE_PX = 112
+SHARPNESS_REF = 150.0
+# Quality assumed for embeddings enrolled before scoring existed
+LEGACY_QUALITY = 0.5
+
+
+class FaceQuality(NamedTuple):
+    score: float
+    detection: float
+    size: float
+    sharpness: float
+    pose: float
+
+    def as_dict(self) -> dict:
+        return {name: round(float(value), 4) for name, value in self._asdict().items()}
+
+
+NO_FACE = FaceQuality(0.0, 0.0, 0.0, 0.0, 0.0)
+
+
+def _clip01(value: float) -> float:
+    return float(min(1.0, max(0.0, value)))
+
+
+def _sharpness(img: Image.Image, box: Sequence[float]) -> float:
+    """Laplacian variance of the face box at a fixed size (so it is comparable across photos)"""
+    left, top, right, bottom = (int(round(v)) for v in box)
+    left, top = max(0, left), max(0, top)
+    right, bottom = min(img.width, right), min(img.height, bottom)
+    if right - left < 3 or bottom - top < 3:
+        return 0.0
+    crop = img.crop((left, top, right, bottom)).convert("L").resize(
+        (TARGET_FACE_PX, TARGET_FACE_PX), Image.Resampling.BILINEAR
+    )
+    gray = np.asarray(crop, dtype="float32")
+    crop.close()
+    lap = (
+        gray[:-2, 1:-1] + gray[2:, 1:-1] + gray[1:-1, :-2] + gray[1:-1, 2:]
+        - 4.0 * gray[1:-1, 1:-1]
+    )
+    return float(lap.var())
+
+
+def _pose(landmarks: Optional[np.ndarray]) -> float:
+    if landmarks is None or len(landmarks) < 3:
+        return 0.5
+    left_eye, right_eye, nose = (np.asarray(p, dtype="float32") for p in landmarks[:3])
+    eye_vec = right_eye - left_eye
+    eye_dist = float(np.linalg.norm(eye_vec))
+    if eye_dist < 1e-3:
+        return 0.0
+    # ~0 for a frontal face, ~0.5 when the nose lines up with one eye (profile)
+    yaw = abs(float(nose[0] - (left_eye[0] + right_eye[0]) / 2)) / eye_dist
+    roll = abs(math.degrees(math.atan2(float(eye_vec[1]), float(eye_vec[0]))))
+    return _clip01(1.0 - yaw / 0.5) * _clip01(1.0 - roll / 90.0)
+
+
+def score_face(
+    img: Image.Image,
+    box: Optional[Sequence[float]],
+    prob: Optional[float],
+    landmarks: Optional[np.ndarray] = None,
+) -> FaceQuality:
+    """Score the face MTCNN selected in ``img`` (box in ``img`` pixel coordinates)"""
+    if box is None or prob is None:
+        return NO_FACE
+    width, height = float(box[2] - box[0]), float(box[3] - box[1])
+    detection = _clip01(float(prob))
+    size = _clip01(min(width, height) / TARGET_FACE_PX)
+    sharpness = _clip01(_sharpness(img, box) / SHARPNESS_REF)
+    pose = _pose(landmarks)
+    return FaceQuality(detection * size * sharpness * pose, detection, size, sharpness, pose)
+
+
+def select_diverse(
+    embeddings: np.ndarray,
+    qualities: Sequence[float],
+    cap: int,
+    diversity: float = 0.5,
+) -> List[int]:
+    """Pick at most ``cap`` row indices, best-quality first, penalising near-duplicates.
+
+    Each step takes the candidate maximising
+    ``(1 - diversity) * quality + diversity * (1 - max cosine to the rows kept so far)``.
+    """
+    count = len(qualities)
+    if cap <= 0 or count <= cap:
+        return list(range(count))
+    embeddings = np.asarray(embeddings, dtype="float32").reshape(count, -1)
+    qualities = np.asarray(qualities, dtype="float32")
+
+    selected = [int(np.argmax(qualities))]
+    max_sim = embeddings @ embeddings[selected[0]]
+    while len(selected) < cap:
+        gain = (1.0 - diversity) * qualities + diversity * (1.0 - max_sim)
+        gain[selected] = -np.inf
+        pick = int(np.argmax(gain))
+        selected.append(pick)
+        np.maximum(max_sim, embeddings @ embeddings[pick], out=max_sim)
+    return sorted(selected)
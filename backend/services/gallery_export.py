@@ -0,0 +1,106 @@
+"""Streaming export of the face gallery.
+
+``export_faces`` is an async generator of byte chunks for a
+``StreamingResponse``. It never holds more than one cursor batch per
+collection and one output buffer:
+
+- faces are read in ``_id`` order; with ``include_embeddings`` the
+  ``face_embeddings`` cursor is read in ``(face_id, _id)`` order (the existing
+  index) and merge-joined against it, so there is no per-face query;
+- the generator only pulls the next batch when Starlette asks for the next
+  chunk, i.e. after the previous one was written to the socket. A slow
+  client therefore slows the cursor down (backpressure) instead of making
+  the process buffer the export.
+
+Line format (``ndjson``, one face per line)::
+
+    {"id": "...", "name": "...", "age": "...", "crime": "...", "description": "...",
+     "image_urls": [...], "embeddings": [{"id": "...", "image_url": "...", "quality": 0.7,
+     "embedding": "<base64 of raw little-endian float32>"}]}
+
+``json`` wraps the same objects in ``{"faces": [...]}``.
+"""
+import base64
+import json
+from typing import AsyncIterator
+
+from pymongo import ASCENDING
+
+FORMATS = {"ndjson": "application/x-ndjson", "json": "application/json"}
+FACE_FIELDS = ("name", "age", "crime", "description", "image_urls")
+
+
+async def _embedding_rows(embeddings_collection, batch_size: int):
+    cursor = embeddings_collection.find(
+        {}, {"face_id": 1, "embedding": 1, "image_url": 1, "quality": 1}
+    ).sort([("face_id", ASCENDING), ("_id", ASCENDING)]).batch_size(batch_size)
+    try:
+        async for doc in cursor:
+            yield doc
+    finally:
+        await cursor.close()
+
+
+async def export_faces(
+    faces_collection,
+    embeddings_collection,
+    fmt: str = "ndjson",
+    include_embeddings: bool = False,
+    batch_size: int = 500,
+    chunk_size: int = 64 * 1024,
+) -> AsyncIterator[bytes]:
+    """Yield the gallery as ``fmt`` (see FORMATS) in chunks of about ``chunk_size`` bytes"""
+    if fmt not in FORMATS:
+        raise ValueError(f"Unsupported export format: {fmt}")
+    ndjson = fmt == "ndjson"
+    buffer = bytearray(b"" if ndjson else b'{"faces":[')
+    first = True
+
+    embeddings = _embedding_rows(embeddings_collection, batch_size) if include_embeddings else None
+    pending = None  # embedding row read ahead of the current face
+
+    async def next_embedding():
+        try:
+            return await embeddings.__anext__()
+        except StopAsyncIteration:
+            return None
+
+    cursor = faces_collection.find({}, {f: 1 for f in FACE_FIELDS}).sort("_id", ASCENDING).batch_size(batch_size)
+    try:
+        if embeddings is not None:
+            pending = await next_embedding()
+        async for doc in cursor:
+            record = {"id": str(doc["_id"])}
+            record.update({f: doc.get(f, [] if f == "image_urls" else "") for f in FACE_FIELDS})
+            if embeddings is not None:
+                rows = []
+                # Skip rows of faces that no longer exist (deleted mid-export or orphaned)
+                while pending is not None and pending["face_id"] < doc["_id"]:
+                    pending = await next_embedding()
+                while pending is not None and pending["face_id"] == doc["_id"]:
+                    rows.append({
+                        "id": str(pending["_id"]),
+                        "image_url": pending.get("image_url", ""),
+                        "quality": pending.get("quality"),
+                        "embedding": base64.b64encode(bytes(pending["embedding"])).decode("ascii"),
+                    })
+                    pending = await next_embedding()
+                record["embeddings"] = rows
+
+            line = json.dumps(record, separators=(",", ":"), default=str).encode()
+            if ndjson:
+                buffer += line + b"\n"
+            else:
+                buffer += line if first else b"," + line
+            first = False
+            if len(buffer) >= chunk_size:
+                yield bytes(buffer)
+                buffer.clear()
+        if not ndjson:
+            buffer += b"]}"
+        if buffer:
+            yield bytes(buffer)
+    finally:
+        await cursor.close()
+        if embeddings is not None:
+            await embeddings.aclose()
@@ -0,0 +1,63 @@
+"""Allocation-free FaceNet inference.
+
+Each thread gets its own input and output tensors per batch size, allocated on
+first use and reused afterwards. A request copies its face into the input
+buffer, runs the model under ``torch.inference_mode`` (no autograd
+bookkeeping) and normalises the output in place. Only the model's own
+activations are allocated per call, and the caller gets a small copy of the
+embedding row(s) to keep.
+
+Channels-last layout is optional (``channels_last=True``): it speeds up the
+convolutions on some CPUs and slows them on others, so measure it with
+``tools/bench_facenet_inference.py``.
+"""
+import threading
+from typing import Dict, Tuple
+
+import numpy as np
+import torch
+
+FACE_SIZE = 160
+EMBEDDING_DIM = 512
+
+
+class FaceNetRunner:
+    def __init__(self, model: torch.nn.Module, device: torch.device, channels_last: bool = False):
+        self.device = device
+        self.channels_last = bool(channels_last)
+        self.memory_format = torch.channels_last if self.channels_last else torch.contiguous_format
+        self.model = model.to(memory_format=self.memory_format) if self.channels_last else model
+        self._local = threading.local()
+
+    def _buffers(self, batch: int) -> Tuple[torch.Tensor, torch.Tensor]:
+        buffers: Dict[int, Tuple[torch.Tensor, torch.Tensor]] = getattr(self._local, "buffers", None)
+        if buffers is None:
+            buffers = self._local.buffers = {}
+        if batch not in buffers:
+            inputs = torch.empty(
+                (batch, 3, FACE_SIZE, FACE_SIZE), dtype=torch.float32, device=self.device
+            ).contiguous(memory_format=self.memory_format)
+            outputs = torch.empty((batch, EMBEDDING_DIM), dtype=torch.float32, device=self.device)
+            buffers[batch] = (inputs, outputs)
+        return buffers[batch]
+
+    def _run(self, inputs: torch.Tensor, outputs: torch.Tensor) -> np.ndarray:
+        with torch.inference_mode():
+            outputs.copy_(self.model(inputs))
+            outputs.div_(torch.linalg.vector_norm(outputs, dim=1, keepdim=True).add_(1e-10))
+        return outputs.cpu().numpy().copy()
+
+    def embed(self, faces: torch.Tensor) -> np.ndarray:
+        """L2-normalised embeddings for standardised faces (3x160x160 or Nx3x160x160)"""
+        if faces.ndim == 3:
+            faces = faces.unsqueeze(0)
+        inputs, outputs = self._buffers(faces.shape[0])
+        inputs.copy_(faces)
+        return self._run(inputs, outputs)
+
+    def embed_pixels(self, pixels: np.ndarray) -> np.ndarray:
+        """Embedding of one 160x160x3 uint8 image, standardised in place to [-1, 1]"""
+        inputs, outputs = self._buffers(1)
+        inputs[0].copy_(torch.from_numpy(np.ascontiguousarray(pixels)).permute(2, 0, 1))
+        inputs.sub_(127.5).div_(127.5)
+        return self._run(inputs, outputs)[0]
@@ -0,0 +1,200 @@
+"""Pluggable storage for uploaded images.
+
+Every backend implements ``put`` and ``delete``:
+
+- ``put(data, folder, public_id, content_type, options, base_url)`` stores the
+  bytes and returns at least ``{"secure_url", "public_id", "bytes"}`` (the
+  shape ``cloudinary.uploader.upload`` returns, which the documents already
+  use);
+- ``delete(public_id)`` removes what ``put`` returned as ``public_id``.
+
+``MEDIA_STORAGE`` selects the backend:
+
+- ``cloudinary`` (default): ``services.cloudinary_service.CloudinaryStorage``.
+  Uploads go through the background queue (``services.upload_queue``).
+- ``local``: ``LocalMediaStorage``, a content-addressed directory served by
+  this API under ``/media/objects``. Nothing leaves the host, so it suits
+  on-prem and air-gapped deployments. A write is a local file
+  write, so it happens inside the request (``synchronous``) rather than
+  through the queue.
+"""
+import hashlib
+import io
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Iterator, Optional
+
+from PIL import Image
+
+OBJECTS_PATH = "/media/objects"
+
+# The only types ever stored or served; anything else could be rendered by the
+# browser (e.g. text/html or SVG) from the API origin
+IMAGE_TYPES = {
+    "JPEG": ("image/jpeg", ".jpg"),
+    "PNG": ("image/png", ".png"),
+    "WEBP": ("image/webp", ".webp"),
+    "GIF": ("image/gif", ".gif"),
+}
+CONTENT_TYPES_BY_EXTENSION = {ext: content_type for content_type, ext in IMAGE_TYPES.values()}
+
+
+class UnsupportedMediaType(ValueError):
+    """The bytes are not a JPEG, PNG, WebP or GIF image"""
+
+
+def image_content_type(data: bytes) -> str:
+    """Content type of ``data`` from its decoded header, never from what the client declared"""
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            image_format = img.format
+    except Exception as e:
+        raise UnsupportedMediaType("Not a readable image") from e
+    if image_format not in IMAGE_TYPES:
+        raise UnsupportedMediaType(f"Unsupported image format: {image_format}")
+    return IMAGE_TYPES[image_format][0]
+
+
+class MediaStorage:
+    name = "base"
+    # True when put() is cheap enough to run inside the request
+    synchronous = False
+
+    def put(self, data: bytes, folder: str, public_id: str, content_type: str = "application/octet-stream",
+            options: Optional[dict] = None, base_url: str = "") -> dict:
+        raise NotImplementedError
+
+    def delete(self, public_id: str) -> bool:
+        raise NotImplementedError
+
+
+def _extension(content_type: str) -> str:
+    for image_type, ext in IMAGE_TYPES.values():
+        if image_type == content_type:
+            return ext
+    raise UnsupportedMediaType(f"Unsupported content type: {content_type}")
+
+
+class LocalMediaStorage(MediaStorage):
+    """Content-addressed image store: ``<root>/ab/<sha256>.<ext>``.
+
+    The object name is the SHA-256 of the bytes, so uploading the same image
+    twice stores it once and returns the same URL. Writes go to a temporary
+    file that is renamed into place, so readers never see a partial object.
+    Objects can be shared by several documents, so ``delete`` leaves them in
+    place; ``tools/gc_media.py`` removes the ones no document references.
+    """
+
+    name = "local"
+    synchronous = True
+
+    def __init__(self, root: str, public_base_url: str = ""):
+        self.root = Path(root)
+        self.public_base_url = public_base_url.rstrip("/")
+
+    def path_for(self, object_name: str) -> Optional[Path]:
+        """Path of a stored object, or None for malformed or unknown names"""
+        digest, _, ext = object_name.partition(".")
+        if len(digest) != 64 or not all(c in "0123456789abcdef" for c in digest) or "." + ext not in CONTENT_TYPES_BY_EXTENSION:
+            return None
+        path = self.root / digest[:2] / object_name
+        return path if path.is_file() else None
+
+    def url_for(self, object_name: str, base_url: str = "") -> str:
+        base = self.public_base_url or base_url.rstrip("/")
+        return f"{base}{OBJECTS_PATH}/{object_name}"
+
+    def put(self, data: bytes, folder: str, public_id: str, content_type: str = "application/octet-stream",
+            options: Optional[dict] = None, base_url: str = "") -> dict:
+        # The declared type is ignored: the extension (and so the served type) comes from the bytes
+        digest = hashlib.sha256(data).hexdigest()
+        object_name = digest + _extension(image_content_type(data))
+        path = self.root / digest[:2] / object_name
+        deduplicated = path.exists()
+        if deduplicated:
+            os.utime(path)  # fresh again for tools/gc_media.py's age check
+        else:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as fh:
+                    fh.write(data)
+                    fh.flush()
+                    os.fsync(fh.fileno())
+                os.replace(tmp, path)
+            except BaseException:
+                if os.path.exists(tmp):
+                    os.unlink(tmp)
+                raise
+        return {
+            "secure_url": self.url_for(object_name, base_url),
+            "public_id": object_name,
+            "bytes": len(data),
+            "deduplicated": deduplicated,
+        }
+
+    def delete(self, public_id: str) -> bool:
+        # Possibly shared with other documents; garbage-collected offline
+        return False
+
+    def objects(self) -> Iterator[Path]:
+        if not self.root.exists():
+            return
+        for path in self.root.glob("??/*.*"):
+            if not path.name.endswith(".tmp"):
+                yield path
+
+
+class FakeStorage(MediaStorage):
+    """In-memory backend for tests: fails the first ``fail_times`` puts per object"""
+
+    name = "fake"
+
+    def __init__(self, fail_times: int = 0, latency: float = 0.0, base_url: str = "https://cdn.invalid",
+                 synchronous: bool = False):
+        self.fail_times = fail_times
+        self.latency = latency
+        self.base_url = base_url
+        self.synchronous = synchronous
+        self.objects_by_id = {}
+        self.calls = {}
+        self._lock = threading.Lock()
+
+    def put(self, data: bytes, folder: str, public_id: str, content_type: str = "application/octet-stream",
+            options: Optional[dict] = None, base_url: str = "") -> dict:
+        key = f"{folder}/{public_id}" if folder else public_id
+        with self._lock:
+            self.calls[key] = self.calls.get(key, 0) + 1
+            attempt = self.calls[key]
+        if self.latency:
+            time.sleep(self.latency)
+        if attempt <= self.fail_times:
+            raise ConnectionError(f"fake upload failure {attempt}/{self.fail_times} for {key}")
+        with self._lock:
+            self.objects_by_id[key] = bytes(data)
+        return {"secure_url": f"{self.base_url}/{key}", "public_id": key, "bytes": len(data)}
+
+    def delete(self, public_id: str) -> bool:
+        with self._lock:
+            return self.objects_by_id.pop(public_id, None) is not None
+
+
+def create_storage() -> MediaStorage:
+    backend = os.getenv("MEDIA_STORAGE", "cloudinary").strip().lower()
+    public_base_url = os.getenv("PUBLIC_BASE_URL", "")
+    if backend == "local":
+        return LocalMediaStorage(
+            os.getenv("MEDIA_LOCAL_DIR", str(Path(__file__).resolve().parents[1] / "data" / "media")),
+            public_base_url=public_base_url,
+        )
+    if backend == "cloudinary":
+        from services.cloudinary_service import CloudinaryStorage
+
+        return CloudinaryStorage()
+    raise RuntimeError(f"MEDIA_STORAGE must be 'cloudinary' or 'local'. Got: {backend}")
+
+
+media_storage = create_storage()
@@ -0,0 +1,188 @@
+"""RSS-driven garbage collection.
+
+Handlers used to call ``gc.collect()`` after every upload, and the memory
+middleware called it every 10 requests. A full collection walks every tracked
+object, including the large, long-lived torch module graphs, so each call
+added tens of milliseconds of latency whether or not memory was tight.
+
+The governor samples the process's anonymous RSS (``RssAnon`` in
+``/proc/self/status``, a few microseconds) after each request and only
+collects when it matters. File-backed pages such as the mmapped embedding
+store and model weights are left out: the kernel can drop them at will and
+no collection would shrink them.
+
+- above the soft watermark: one full collection, at most every
+  ``min_interval`` seconds;
+- above the hard watermark: a full collection followed by ``malloc_trim``
+  so freed arenas go back to the OS, at most every ``hard_min_interval``
+  seconds. If a hard collection leaves RSS above the watermark (live data,
+  not garbage), the next one waits until RSS has grown by ``hard_step`` more
+  or ``min_interval`` has passed, instead of running on every request.
+
+``freeze()`` moves everything alive after model load into the permanent
+generation (``gc.freeze``), so later collections skip the model objects.
+Every collection, whether automatic or triggered here, is timed through
+``gc.callbacks`` for the pause metrics.
+"""
+import ctypes
+import gc
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+_MB = 1024 * 1024
+
+
+def read_rss() -> Optional[int]:
+    """Anonymous resident memory in bytes (None where /proc is unavailable)"""
+    try:
+        with open("/proc/self/status", "rb") as fh:
+            for line in fh:
+                if line.startswith(b"RssAnon:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        return None
+    # Kernels before 4.5: resident minus shared (file-backed and shmem) pages
+    try:
+        with open("/proc/self/statm", "rb") as fh:
+            fields = fh.read().split()
+        return (int(fields[1]) - int(fields[2])) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def cgroup_memory_limit() -> Optional[int]:
+    """Container memory limit in bytes (cgroup v2 or v1), None if unlimited"""
+    for path in ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes"):
+        try:
+            value = Path(path).read_text().strip()
+        except OSError:
+            continue
+        if value.isdigit() and int(value) < 1 << 60:
+            return int(value)
+    return None
+
+
+def _load_malloc_trim():
+    try:
+        return ctypes.CDLL("libc.so.6").malloc_trim
+    except (OSError, AttributeError):
+        return None
+
+
+class MemoryGovernor:
+    def __init__(self, soft_limit_mb: float, hard_limit_mb: float, min_interval: float = 5.0,
+                 hard_min_interval: float = 1.0, hard_step_mb: Optional[float] = None):
+        self.soft_limit = int(soft_limit_mb * _MB)
+        self.hard_limit = int(max(hard_limit_mb, soft_limit_mb) * _MB)
+        self.min_interval = max(0.0, float(min_interval))
+        self.hard_min_interval = min(max(0.0, float(hard_min_interval)), self.min_interval)
+        # Default: 5% of the hard watermark
+        self.hard_step = int((hard_step_mb * _MB) if hard_step_mb is not None else self.hard_limit * 0.05)
+        self._malloc_trim = _load_malloc_trim()
+        self._lock = threading.Lock()
+        self._last_collect = 0.0
+        # RSS left behind by the last hard collection, while it is still above the watermark
+        self._hard_floor: Optional[int] = None
+        self._peak_rss = 0
+        self._triggered = {"soft": 0, "hard": 0, "forced": 0}
+        self._gc_started = 0.0
+        self._pauses = {generation: {"count": 0, "total_ms": 0.0, "max_ms": 0.0} for generation in range(3)}
+        gc.callbacks.append(self._on_gc)
+
+    def _on_gc(self, phase: str, info: dict):
+        if phase == "start":
+            self._gc_started = time.perf_counter()
+            return
+        pause_ms = (time.perf_counter() - self._gc_started) * 1000
+        stats = self._pauses[info.get("generation", 2)]
+        stats["count"] += 1
+        stats["total_ms"] += pause_ms
+        stats["max_ms"] = max(stats["max_ms"], pause_ms)
+
+    def _collect(self, trim: bool):
+        gc.collect()
+        if trim and self._malloc_trim is not None:
+            self._malloc_trim(0)
+        self._last_collect = time.monotonic()
+
+    def maybe_collect(self) -> bool:
+        """Collect only if RSS is above a watermark. Returns True if it collected."""
+        rss = read_rss()
+        if rss is None:
+            return False
+        self._peak_rss = max(self._peak_rss, rss)
+        if rss < self.soft_limit:
+            self._hard_floor = None
+            return False
+        with self._lock:
+            since = time.monotonic() - self._last_collect
+            if rss >= self.hard_limit:
+                grew = self._hard_floor is None or rss >= self._hard_floor + self.hard_step
+                if since < self.hard_min_interval or not (grew or since >= self.min_interval):
+                    return False
+                self._triggered["hard"] += 1
+                self._collect(trim=True)
+                after = read_rss()
+                self._hard_floor = after if after is not None and after >= self.hard_limit else None
+                return True
+            self._hard_floor = None
+            if since >= self.min_interval:
+                self._triggered["soft"] += 1
+                self._collect(trim=False)
+                return True
+        return False
+
+    def collect(self):
+        """Unconditional collection, for one-off points such as before loading models"""
+        with self._lock:
+            self._triggered["forced"] += 1
+            self._collect(trim=True)
+
+    def freeze(self):
+        """Exclude everything currently alive (loaded models) from future collections"""
+        gc.collect()
+        gc.freeze()
+
+    def unfreeze(self):
+        """Make frozen objects collectable again, e.g. before dropping the models"""
+        gc.unfreeze()
+
+    def metrics(self) -> dict:
+        rss = read_rss()
+        return {
+            "rss_anon_mb": round(rss / _MB, 1) if rss is not None else None,
+            "peak_rss_anon_mb": round(self._peak_rss / _MB, 1),
+            "soft_limit_mb": round(self.soft_limit / _MB, 1),
+            "hard_limit_mb": round(self.hard_limit / _MB, 1),
+            "collections_triggered": dict(self._triggered),
+            "gc_pauses": {
+                f"gen{generation}": {k: round(v, 3) if isinstance(v, float) else v for k, v in stats.items()}
+                for generation, stats in self._pauses.items()
+            },
+            "gc_counts": list(gc.get_count()),
+            "gc_frozen_objects": gc.get_freeze_count(),
+        }
+
+
+def _float_env(key: str, default: float) -> float:
+    value = os.getenv(key)
+    if value is None:
+        return float(default)
+    try:
+        return float(value)
+    except ValueError as exc:
+        raise RuntimeError(f"Environment variable {key} must be a float. Got: {value}") from exc
+
+
+# Watermarks default to 75% / 90% of the container limit (512MB if unknown)
+_budget_mb = (cgroup_memory_limit() or 512 * _MB) / _MB
+governor = MemoryGovernor(
+    soft_limit_mb=_float_env("MEMORY_SOFT_LIMIT_MB", round(_budget_mb * 0.75)),
+    hard_limit_mb=_float_env("MEMORY_HARD_LIMIT_MB", round(_budget_mb * 0.90)),
+    min_interval=_float_env("MEMORY_GC_MIN_INTERVAL_SECONDS", 5.0),
+    hard_min_interval=_float_env("MEMORY_GC_HARD_MIN_INTERVAL_SECONDS", 1.0),
+)
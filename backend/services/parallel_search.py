@@ -0,0 +1,150 @@
+"""Partitioned gallery search over a process pool.
+
+The embedding matrix is split into ``partitions`` contiguous row ranges. Each
+range is scored by a separate worker process that memory-maps the store files
+itself, so no embeddings are pickled across process boundaries and each worker
+keeps its own slice hot in cache. The per-partition top-k lists are merged in
+the caller.
+
+The store replaces its two files one after the other, so every task carries
+the store's ``file_key`` (the inodes of the pair it has open). A worker that
+maps a different pair refuses the task instead of pairing renumbered rows
+with an old id table, and the caller falls back to an in-process scan.
+"""
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from services.embedding_store import EmbeddingStore, SearchHit, search_rows
+
+# Per-worker cache of the mapped (embeddings, ids) pair, keyed by path and
+# replaced when the parent reports a different file_key (rebuild, growth or compaction).
+_open_pairs: Dict[Tuple[str, str], Tuple[Tuple[int, int], np.ndarray, np.ndarray]] = {}
+
+# Applied to the pool's workers only, unless the parent already sets them
+_WORKER_ENV = {"OMP_NUM_THREADS": "1", "OPENBLAS_NUM_THREADS": "1", "MKL_NUM_THREADS": "1"}
+
+
+class StaleStoreFiles(Exception):
+    """The files on disk are not the pair the parent's store has open"""
+
+
+def _map_npy(fh) -> Tuple[int, np.ndarray]:
+    """Map an open ``.npy`` file read-only; returns (inode, array)"""
+    version = np.lib.format.read_magic(fh)
+    read_header = np.lib.format.read_array_header_1_0 if version == (1, 0) else np.lib.format.read_array_header_2_0
+    shape, fortran_order, dtype = read_header(fh)
+    array = np.memmap(fh, dtype=dtype, mode="r", offset=fh.tell(), shape=shape,
+                      order="F" if fortran_order else "C")
+    return os.fstat(fh.fileno()).st_ino, array
+
+
+def _open_pair(embeddings_path: str, ids_path: str, file_key: Tuple[int, int]) -> Tuple[np.ndarray, np.ndarray]:
+    cached = _open_pairs.get((embeddings_path, ids_path))
+    if cached is not None and cached[0] == tuple(file_key):
+        return cached[1], cached[2]
+    # Map through the handles we check, so a replace after the check cannot slip in
+    with open(embeddings_path, "rb") as emb_fh, open(ids_path, "rb") as ids_fh:
+        emb_inode, embeddings = _map_npy(emb_fh)
+        ids_inode, ids = _map_npy(ids_fh)
+    if (emb_inode, ids_inode) != tuple(file_key):
+        raise StaleStoreFiles(f"{embeddings_path} changed since the search was issued")
+    _open_pairs[(embeddings_path, ids_path)] = (tuple(file_key), embeddings, ids)
+    return embeddings, ids
+
+
+def search_partition(
+    embeddings_path: str,
+    ids_path: str,
+    file_key: Tuple[int, int],
+    start: int,
+    stop: int,
+    query: np.ndarray,
+    k: int,
+    chunk_rows: int,
+) -> List[SearchHit]:
+    """Score rows ``[start, stop)`` of the on-disk store (runs inside a pool worker)"""
+    embeddings, ids = _open_pair(embeddings_path, ids_path, file_key)
+    return search_rows(embeddings, ids, stop, query, k, chunk_rows, start=start)
+
+
+def partition_bounds(count: int, partitions: int) -> List[Tuple[int, int]]:
+    """Split ``count`` rows into at most ``partitions`` contiguous, non-empty ranges"""
+    partitions = max(1, min(int(partitions), count))
+    edges = np.linspace(0, count, partitions + 1).astype(int)
+    return [(int(a), int(b)) for a, b in zip(edges[:-1], edges[1:]) if b > a]
+
+
+class PartitionedSearcher:
+    """Fan a query out to a pool of worker processes, one per partition"""
+
+    def __init__(self, partitions: int, chunk_rows: int = 4096):
+        self.partitions = max(1, int(partitions))
+        self.chunk_rows = max(1, int(chunk_rows))
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def start(self):
+        if self._pool is not None:
+            return
+        # spawn rather than fork: the parent has torch and Mongo threads running
+        pool = ProcessPoolExecutor(
+            max_workers=self.partitions,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+        # Every partition already gets its own core; keep BLAS inside each worker
+        # single-threaded so the pool does not oversubscribe the machine. BLAS reads
+        # these when it loads, before any initializer could run, so they have to be in
+        # the environment the workers are spawned with. The pool spawns one worker per
+        # submit until it is full: start them all now, then put the parent's back.
+        saved = {var: os.environ.get(var) for var in _WORKER_ENV}
+        try:
+            for var, value in _WORKER_ENV.items():
+                os.environ.setdefault(var, value)
+            warmup = [pool.submit(os.getpid) for _ in range(self.partitions)]
+        finally:
+            for var, value in saved.items():
+                if value is None:
+                    os.environ.pop(var, None)
+                else:
+                    os.environ[var] = value
+        for future in warmup:
+            future.result()
+        self._pool = pool
+
+    def stop(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def search(self, store: EmbeddingStore, query: np.ndarray, k: int = 1) -> List[SearchHit]:
+        embeddings_path, ids_path, file_key, count = store.files()
+        if count == 0:
+            return []
+        self.start()
+        query = np.asarray(query, dtype="float32").reshape(-1)
+        futures = [
+            self._pool.submit(
+                search_partition,
+                embeddings_path,
+                ids_path,
+                file_key,
+                start,
+                stop,
+                query,
+                k,
+                self.chunk_rows,
+            )
+            for start, stop in partition_bounds(count, self.partitions)
+        ]
+        hits: List[SearchHit] = []
+        try:
+            for future in futures:
+                hits.extend(future.result())
+        except StaleStoreFiles:
+            # The files were swapped while the query was in flight: scan the store's own snapshot
+            return store.search(query, k)
+        hits.sort(key=lambda hit: hit.score, reverse=True)
+        return hits[:max(1, int(k))]
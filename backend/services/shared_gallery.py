@@ -0,0 +1,476 @@
+"""Shared-memory gallery index shared by every web worker on a host.
+
+Without this each uvicorn/gunicorn worker would hold its own copy of the
+embedding matrix. Instead one POSIX shared-memory segment holds the gallery and
+every worker maps the same pages:
+
+- A small *control* segment (``<name>``) carries the header below and a ring of
+  pending mutations submitted by any worker.
+- A *data* segment (``<name>-<epoch>``) carries two copies of the matrix and its
+  id sidecar (a double buffer). The active copy is ``generation % 2``.
+
+Exactly one worker (whoever holds an ``flock`` on ``lock_path``) is the writer.
+It drains the ring every ``refresh_interval`` seconds, applies the mutations to
+the on-disk :class:`EmbeddingStore` and to the inactive buffer, bumps
+``generation`` to publish, then replays them onto the other buffer. Readers never
+take a lock: they read ``generation``, search the active buffer and re-check
+``generation`` afterwards, retrying if the writer published in between. If the
+writer dies its lock is released by the kernel and another worker takes over.
+"""
+import fcntl
+import os
+import threading
+from multiprocessing import resource_tracker, shared_memory
+from typing import Callable, List, Optional
+
+import numpy as np
+
+from services.embedding_store import (
+    EMBEDDING_DIM,
+    ID_DTYPE,
+    TOMBSTONE,
+    EmbeddingStore,
+    SearchHit,
+    search_rows,
+)
+
+SEGMENT_MAGIC = 0x45594547  # "EYEG"
+SEGMENT_VERSION = 2
+
+OP_APPEND = 1
+OP_REMOVE_FACE = 2
+OP_CLEAR = 3
+OP_REMOVE_EMBEDDING = 4
+OP_REPLACE_EMBEDDING = 5
+
+CONTROL_DTYPE = np.dtype([
+    ("magic", "<u4"),
+    ("version", "<u4"),
+    ("epoch", "<u8"),        # data segment currently published (0 = none yet)
+    ("generation", "<u8"),   # bumped on every publish; active buffer is generation % 2
+    ("count", "<u8", (2,)),  # used rows per buffer
+    ("capacity", "<u8"),     # rows per buffer in the current data segment
+    ("ring_head", "<u8"),    # next ring slot producers write
+    ("ring_tail", "<u8"),    # next ring slot the writer reads
+    ("resync", "<u8"),       # set when the ring overflowed and a full reload is needed
+    ("writer_pid", "<u8"),
+])
+
+
+def _ring_dtype(dim: int) -> np.dtype:
+    return np.dtype([
+        ("op", "<u4"),
+        ("face_id", "S24"),
+        ("embedding_id", "S24"),
+        ("embedding", "<f4", (dim,)),
+    ])
+
+
+def _open_segment(name: str, size: int = 0, create: bool = False) -> shared_memory.SharedMemory:
+    """Open a segment without handing it to the resource tracker.
+
+    The tracker would otherwise unlink the segment as soon as the process that
+    opened it exits, pulling it out from under every other worker.
+    """
+    shm = shared_memory.SharedMemory(name=name, create=create, size=size)
+    try:
+        resource_tracker.unregister(shm._name, "shared_memory")
+    except Exception:
+        pass
+    return shm
+
+
+def _close_segment(shm: Optional[shared_memory.SharedMemory], unlink: bool = False):
+    if shm is None:
+        return
+    try:
+        shm.close()
+    except BufferError:
+        # numpy views are still alive somewhere; the mapping is released with them
+        pass
+    if unlink:
+        try:
+            # SharedMemory.unlink() also unregisters from the tracker; keep the bookkeeping balanced
+            resource_tracker.register(shm._name, "shared_memory")
+            shm.unlink()
+        except FileNotFoundError:
+            pass
+
+
+class SharedGallery:
+    """Lock-free, multi-process gallery index backed by POSIX shared memory"""
+
+    def __init__(
+        self,
+        name: str,
+        lock_path,
+        dim: int = EMBEDDING_DIM,
+        ring_slots: int = 1024,
+        refresh_interval: float = 0.5,
+        chunk_rows: int = 4096,
+        initial_capacity: int = 1024,
+    ):
+        self.name = name
+        self.lock_path = str(lock_path)
+        self.dim = dim
+        self.ring_slots = max(1, int(ring_slots))
+        self.refresh_interval = max(0.05, float(refresh_interval))
+        self.chunk_rows = max(1, int(chunk_rows))
+        self.initial_capacity = max(1, int(initial_capacity))
+        self.ring_dtype = _ring_dtype(dim)
+
+        self._control_shm: Optional[shared_memory.SharedMemory] = None
+        self._header = None
+        self._ring = None
+        self._data_shm: Optional[shared_memory.SharedMemory] = None
+        self._data_epoch = 0
+        self._buffers = None  # [(embeddings, ids), (embeddings, ids)]
+
+        self._store: Optional[EmbeddingStore] = None
+        self._published_compactions = 0  # store.compactions as of the last full publish
+        self._load_store: Optional[Callable[[], EmbeddingStore]] = None
+        self._resync_store: Optional[Callable[[], None]] = None
+        self._poll_changes: Optional[Callable[[], Optional[int]]] = None
+        self._commit_changes: Optional[Callable[[Optional[int]], None]] = None
+        self._writer_fd: Optional[int] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._attach_lock = threading.Lock()
+
+    # ---------------- Lifecycle ----------------
+    @property
+    def is_writer(self) -> bool:
+        return self._writer_fd is not None
+
+    @property
+    def is_ready(self) -> bool:
+        return self._header is not None and int(self._header["epoch"]) != 0
+
+    def start(
+        self,
+        load_store: Callable[[], EmbeddingStore],
+        resync_store: Callable[[], None],
+        poll_changes: Optional[Callable[[], Optional[int]]] = None,
+        commit_changes: Optional[Callable[[Optional[int]], None]] = None,
+    ):
+        """Attach to the control segment and start the writer-election/refresh thread.
+
+        ``load_store`` returns the opened on-disk store (only called once this
+        worker becomes the writer); ``resync_store`` rebuilds it from MongoDB.
+        ``poll_changes``/``commit_changes`` let the writer tail the change feed:
+        the polled changes are submitted to the ring, drained, and only then is
+        the returned resume token committed.
+        """
+        self._load_store = load_store
+        self._resync_store = resync_store
+        self._poll_changes = poll_changes
+        self._commit_changes = commit_changes
+        os.makedirs(os.path.dirname(self.lock_path) or ".", exist_ok=True)
+        self._attach_control()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="shared-gallery", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.refresh_interval * 4)
+            self._thread = None
+        if self._writer_fd is not None:
+            fcntl.flock(self._writer_fd, fcntl.LOCK_UN)
+            os.close(self._writer_fd)
+            self._writer_fd = None
+        self._buffers = None
+        self._header = None
+        self._ring = None
+        _close_segment(self._data_shm)
+        _close_segment(self._control_shm)
+        self._data_shm = None
+        self._control_shm = None
+
+    # ---------------- Producers (any worker) ----------------
+    def submit_append(self, face_id: str, embedding_id: str, embedding: np.ndarray):
+        self._submit(OP_APPEND, face_id, embedding_id, embedding)
+
+    def submit_remove_face(self, face_id: str):
+        self._submit(OP_REMOVE_FACE, face_id)
+
+    def submit_remove_embedding(self, embedding_id: str):
+        self._submit(OP_REMOVE_EMBEDDING, embedding_id=embedding_id)
+
+    def submit_replace_embedding(self, face_id: str, embedding_id: str, embedding: np.ndarray):
+        self._submit(OP_REPLACE_EMBEDDING, face_id, embedding_id, embedding)
+
+    def submit_clear(self):
+        self._submit(OP_CLEAR)
+
+    def request_resync(self):
+        """Ask the writer to reload the store from MongoDB on its next cycle"""
+        if self._header is not None:
+            self._header["resync"] = 1
+
+    def _submit(self, op: int, face_id: str = "", embedding_id: str = "", embedding: Optional[np.ndarray] = None):
+        header = self._header
+        if header is None:
+            raise RuntimeError("Shared gallery is not attached")
+        with open(self.lock_path + ".ring", "a+") as ring_lock:
+            fcntl.flock(ring_lock.fileno(), fcntl.LOCK_EX)
+            try:
+                head = int(header["ring_head"])
+                tail = int(header["ring_tail"])
+                if head - tail >= self.ring_slots:
+                    # The writer is behind; it will reload everything from MongoDB instead
+                    header["resync"] = 1
+                    return
+                slot = self._ring[head % self.ring_slots]
+                slot["op"] = op
+                slot["embedding_id"] = embedding_id.encode("ascii")
+                slot["face_id"] = face_id.encode("ascii")
+                if embedding is not None:
+                    slot["embedding"] = np.asarray(embedding, dtype="float32").reshape(self.dim)
+                header["ring_head"] = head + 1
+            finally:
+                fcntl.flock(ring_lock.fileno(), fcntl.LOCK_UN)
+
+    # ---------------- Readers (any worker) ----------------
+    def search(self, query: np.ndarray, k: int = 1, max_retries: int = 8) -> Optional[List[SearchHit]]:
+        """Search the active buffer. Returns None until a writer has published a gallery,
+        or if the published gallery kept changing under every one of ``max_retries`` attempts."""
+        header = self._header
+        if header is None:
+            return None
+        for _ in range(max_retries):
+            generation = int(header["generation"])
+            epoch = int(header["epoch"])
+            if epoch == 0:
+                return None
+            if epoch != self._data_epoch:
+                capacity = int(header["capacity"])
+                if int(header["epoch"]) != epoch:
+                    continue  # republished between the two reads: capacity may belong to the next epoch
+                try:
+                    self._attach_data(epoch, capacity)
+                except (FileNotFoundError, ValueError, TypeError):
+                    # The writer moved on and unlinked this segment, or the capacity read
+                    # was torn against a republish; re-read the header and try again
+                    continue
+            buffers = self._buffers
+            active = generation % 2
+            count = int(header["count"][active])
+            embeddings, ids = buffers[active]
+            hits = search_rows(embeddings, ids, count, query, k, self.chunk_rows)
+            if int(header["generation"]) == generation and int(header["epoch"]) == epoch:
+                return hits
+        # Kept losing the race with the writer: let the caller serve it some other way
+        return None
+
+    # ---------------- Segments ----------------
+    def _attach_control(self):
+        size = CONTROL_DTYPE.itemsize + self.ring_slots * self.ring_dtype.itemsize
+        try:
+            shm = _open_segment(self.name, size=size, create=True)
+            created = True
+        except FileExistsError:
+            shm = _open_segment(self.name)
+            created = False
+        header = np.ndarray((), dtype=CONTROL_DTYPE, buffer=shm.buf)
+        if not created and (
+            int(header["magic"]) != SEGMENT_MAGIC
+            or int(header["version"]) != SEGMENT_VERSION
+            or shm.size < size
+        ):
+            raise RuntimeError(
+                f"Shared memory segment {self.name} exists with an incompatible layout. "
+                "Remove it from /dev/shm or pick another SHARED_GALLERY_NAME."
+            )
+        if created:
+            header[()] = 0
+            header["version"] = SEGMENT_VERSION
+            header["magic"] = SEGMENT_MAGIC
+        self._control_shm = shm
+        self._header = header
+        self._ring = np.ndarray(
+            (self.ring_slots,), dtype=self.ring_dtype, buffer=shm.buf, offset=CONTROL_DTYPE.itemsize
+        )
+
+    def _buffer_views(self, shm: shared_memory.SharedMemory, capacity: int):
+        emb_bytes = capacity * self.dim * 4
+        buf_bytes = emb_bytes + capacity * ID_DTYPE.itemsize
+        views = []
+        for index in range(2):
+            offset = index * buf_bytes
+            embeddings = np.ndarray((capacity, self.dim), dtype="float32", buffer=shm.buf, offset=offset)
+            ids = np.ndarray((capacity,), dtype=ID_DTYPE, buffer=shm.buf, offset=offset + emb_bytes)
+            views.append((embeddings, ids))
+        return views
+
+    def _data_size(self, capacity: int) -> int:
+        return 2 * capacity * (self.dim * 4 + ID_DTYPE.itemsize)
+
+    def _attach_data(self, epoch: int, capacity: int):
+        with self._attach_lock:
+            if epoch == self._data_epoch:
+                return
+            shm = _open_segment(f"{self.name}-{epoch}")
+            try:
+                buffers = self._buffer_views(shm, capacity)
+            except (ValueError, TypeError):
+                _close_segment(shm)
+                raise
+            old = self._data_shm
+            self._buffers = buffers
+            self._data_shm = shm
+            self._data_epoch = epoch
+            _close_segment(old)
+
+    # ---------------- Writer ----------------
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                if not self.is_writer:
+                    self._try_become_writer()
+                if self.is_writer:
+                    token = self._poll_changes() if self._poll_changes is not None else None
+                    self._drain()
+                    if token is not None:
+                        self._commit_changes(token)
+            except Exception as e:
+                print(f"⚠️ Shared gallery refresh failed: {e}")
+            self._stop.wait(self.refresh_interval)
+
+    def _try_become_writer(self):
+        fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return
+        self._writer_fd = fd
+        self._header["writer_pid"] = os.getpid()
+        print(f"✓ Worker {os.getpid()} is the shared gallery writer")
+        self._store = self._load_store()
+        self._publish_from_store()
+        # Ops still queued (submitted while no writer was draining) are not in the store yet.
+        # Apply them now; ones the previous writer already stored are idempotent replays.
+        self._drain()
+
+    def _publish_from_store(self):
+        """Copy the whole on-disk store into a fresh data segment and publish it."""
+        store = self._store
+        self._published_compactions = store.compactions
+        store_embeddings, store_ids, count, _ = store.view()
+        capacity = max(self.initial_capacity, count * 2)
+        epoch = int(self._header["epoch"]) + 1
+        name = f"{self.name}-{epoch}"
+        try:
+            stale = _open_segment(name)
+            _close_segment(stale, unlink=True)
+        except FileNotFoundError:
+            pass
+        shm = _open_segment(name, size=self._data_size(capacity), create=True)
+        buffers = self._buffer_views(shm, capacity)
+        for embeddings, ids in buffers:
+            for start in range(0, count, self.chunk_rows):
+                stop = min(start + self.chunk_rows, count)
+                embeddings[start:stop] = store_embeddings[start:stop]
+                ids[start:stop] = store_ids[start:stop]
+
+        old_shm, old_epoch = self._data_shm, self._data_epoch
+        with self._attach_lock:
+            self._data_shm = shm
+            self._data_epoch = epoch
+            self._buffers = buffers
+        header = self._header
+        header["capacity"] = capacity
+        header["count"][0] = count
+        header["count"][1] = count
+        header["epoch"] = epoch
+        header["generation"] = int(header["generation"]) + 1
+        # Readers re-attach by epoch; unlinking only removes the name, live mappings stay valid
+        if old_epoch:
+            _close_segment(old_shm, unlink=True)
+        elif epoch > 1:
+            try:
+                _close_segment(_open_segment(f"{self.name}-{epoch - 1}"), unlink=True)
+            except FileNotFoundError:
+                pass
+
+    def _drain(self):
+        header = self._header
+        if int(header["resync"]):
+            header["resync"] = 0
+            header["ring_tail"] = int(header["ring_head"])
+            self._resync_store()
+            self._publish_from_store()
+            return
+
+        head = int(header["ring_head"])
+        tail = int(header["ring_tail"])
+        if head == tail:
+            return
+        ops = [self._ring[i % self.ring_slots].copy() for i in range(tail, head)]
+        header["ring_tail"] = head
+
+        for op in ops:
+            self._apply_to_store(op)
+        if self._store.count > int(header["capacity"]) or self._store.compactions != self._published_compactions:
+            # Out of room, or the store dropped its tombstones: republish the compact rows
+            self._publish_from_store()
+            return
+
+        generation = int(header["generation"])
+        inactive = (generation + 1) % 2
+        self._apply_to_buffer(inactive, ops)
+        header["generation"] = generation + 1
+        # The previous active buffer may still be read until readers notice the bump
+        self._apply_to_buffer(generation % 2, ops)
+
+    def _apply_to_store(self, op):
+        kind = int(op["op"])
+        face_id = op["face_id"].decode("ascii")
+        if kind == OP_APPEND:
+            self._store.append(face_id, op["embedding_id"].decode("ascii"), op["embedding"])
+        elif kind == OP_REMOVE_FACE:
+            self._store.remove_face(face_id)
+        elif kind == OP_REMOVE_EMBEDDING:
+            self._store.remove_embedding(op["embedding_id"].decode("ascii"))
+        elif kind == OP_REPLACE_EMBEDDING:
+            self._store.replace_embedding(face_id, op["embedding_id"].decode("ascii"), op["embedding"])
+        elif kind == OP_CLEAR:
+            self._store.clear()
+
+    def _apply_to_buffer(self, index: int, ops):
+        embeddings, ids = self._buffers[index]
+        count = int(self._header["count"][index])
+        for op in ops:
+            kind = int(op["op"])
+            if kind == OP_APPEND:
+                embeddings[count] = op["embedding"]
+                ids[count] = (op["face_id"], op["embedding_id"])
+                count += 1
+            elif kind == OP_REMOVE_FACE:
+                rows = self._find_rows(ids, count, "face_id", op["face_id"])
+                ids[rows] = (TOMBSTONE, TOMBSTONE)
+                embeddings[rows] = 0.0
+            elif kind == OP_REMOVE_EMBEDDING:
+                rows = self._find_rows(ids, count, "embedding_id", op["embedding_id"])
+                ids[rows] = (TOMBSTONE, TOMBSTONE)
+                embeddings[rows] = 0.0
+            elif kind == OP_REPLACE_EMBEDDING:
+                rows = self._find_rows(ids, count, "embedding_id", op["embedding_id"])
+                if len(rows):
+                    embeddings[rows] = op["embedding"]
+                else:
+                    embeddings[count] = op["embedding"]
+                    ids[count] = (op["face_id"], op["embedding_id"])
+                    count += 1
+            elif kind == OP_CLEAR:
+                count = 0
+        self._header["count"][index] = count
+
+    def _find_rows(self, ids, count: int, field: str, key: bytes) -> np.ndarray:
+        found = [np.empty(0, dtype="int64")]
+        for start in range(0, count, self.chunk_rows):
+            stop = min(start + self.chunk_rows, count)
+            found.append(np.nonzero(ids[field][start:stop] == key)[0] + start)
+        return np.concatenate(found)
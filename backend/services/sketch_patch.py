@@ -0,0 +1,249 @@
+"""Incremental updates of ``sketch_state``.
+
+Clients send a JSON Patch (RFC 6902) or a JSON Merge Patch (RFC 7386) against
+the ``revision`` they last saw, instead of the whole state:
+
+- ``json_patch_update`` / ``merge_patch_update`` turn a patch into one MongoDB
+  update (``$set``/``$unset``/``$push`` on ``sketch_state.<path>``) plus the
+  query conditions that make it equivalent to the RFC semantics. The server
+  never reads the stored state, so its work is proportional to the patch.
+  They return None for patches that cannot be expressed that way, e.g.
+  ``move``/``copy``/``test``, array inserts and removals, keys that are not
+  valid MongoDB field names, or overlapping paths.
+- ``apply_json_patch`` / ``apply_merge_patch`` apply a patch to a loaded
+  document. The route uses them when translation is impossible or the
+  conditions did not hold.
+
+Either way the write is conditional on the revision, so concurrent editors
+get a conflict instead of overwriting each other.
+"""
+import copy
+from typing import Any, List, Optional, Tuple
+
+JSON_PATCH_OPS = ("add", "remove", "replace", "move", "copy", "test")
+
+
+class PatchError(ValueError):
+    """The patch is malformed or does not apply to the document"""
+
+
+# ---------------- JSON Pointer ----------------
+def parse_pointer(pointer: Any) -> List[str]:
+    if not isinstance(pointer, str) or (pointer and not pointer.startswith("/")):
+        raise PatchError(f"Invalid JSON pointer: {pointer!r}")
+    if not pointer:
+        return []
+    return [seg.replace("~1", "/").replace("~0", "~") for seg in pointer[1:].split("/")]
+
+
+def _child(container, seg: str, pointer: str):
+    if isinstance(container, dict):
+        if seg not in container:
+            raise PatchError(f"Path not found: {pointer}")
+        return container[seg]
+    if isinstance(container, list):
+        return container[_index(container, seg, pointer)]
+    raise PatchError(f"Path not found: {pointer}")
+
+
+def _index(array: list, seg: str, pointer: str, allow_end: bool = False) -> int:
+    if seg == "-" and allow_end:
+        return len(array)
+    if not seg.isdigit() or (len(seg) > 1 and seg.startswith("0")):
+        raise PatchError(f"Invalid array index in {pointer}")
+    index = int(seg)
+    if index > len(array) or (index == len(array) and not allow_end):
+        raise PatchError(f"Array index out of range: {pointer}")
+    return index
+
+
+def _resolve(doc, path: List[str], pointer: str):
+    for seg in path:
+        doc = _child(doc, seg, pointer)
+    return doc
+
+
+# ---------------- Applying ----------------
+def _add(doc, path: List[str], value, pointer: str):
+    if not path:
+        return value
+    parent = _resolve(doc, path[:-1], pointer)
+    if isinstance(parent, dict):
+        parent[path[-1]] = value
+    elif isinstance(parent, list):
+        parent.insert(_index(parent, path[-1], pointer, allow_end=True), value)
+    else:
+        raise PatchError(f"Path not found: {pointer}")
+    return doc
+
+
+def _remove(doc, path: List[str], pointer: str):
+    if not path:
+        raise PatchError("Cannot remove the whole document")
+    parent = _resolve(doc, path[:-1], pointer)
+    if isinstance(parent, dict):
+        if path[-1] not in parent:
+            raise PatchError(f"Path not found: {pointer}")
+        return parent.pop(path[-1])
+    if isinstance(parent, list):
+        return parent.pop(_index(parent, path[-1], pointer))
+    raise PatchError(f"Path not found: {pointer}")
+
+
+def apply_json_patch(doc, ops: list):
+    """Apply RFC 6902 ``ops`` to ``doc`` (modified in place) and return the result"""
+    if not isinstance(ops, list):
+        raise PatchError("A JSON Patch must be a list of operations")
+    for op in ops:
+        if not isinstance(op, dict) or op.get("op") not in JSON_PATCH_OPS:
+            raise PatchError(f"Invalid patch operation: {op!r}")
+        kind, pointer = op["op"], op.get("path")
+        path = parse_pointer(pointer)
+        if kind in ("add", "replace", "test") and "value" not in op:
+            raise PatchError(f"'{kind}' at {pointer} needs a value")
+        if kind == "add":
+            doc = _add(doc, path, copy.deepcopy(op["value"]), pointer)
+        elif kind == "remove":
+            _remove(doc, path, pointer)
+        elif kind == "replace":
+            _resolve(doc, path, pointer)  # must exist
+            if path:
+                _remove(doc, path, pointer)
+            doc = _add(doc, path, copy.deepcopy(op["value"]), pointer)
+        elif kind == "test":
+            if _resolve(doc, path, pointer) != op["value"]:
+                raise PatchError(f"Test failed at {pointer}")
+        else:
+            source = parse_pointer(op.get("from"))
+            if kind == "move":
+                if path[:len(source)] == source and path != source:
+                    raise PatchError(f"Cannot move {op.get('from')} into itself")
+                value = _remove(doc, source, op.get("from"))
+            else:
+                value = copy.deepcopy(_resolve(doc, source, op.get("from")))
+            doc = _add(doc, path, value, pointer)
+    return doc
+
+
+def apply_merge_patch(target, patch):
+    """Apply an RFC 7386 merge patch to ``target`` and return the result"""
+    if not isinstance(patch, dict):
+        return copy.deepcopy(patch)
+    if not isinstance(target, dict):
+        target = {}
+    for key, value in patch.items():
+        if value is None:
+            target.pop(key, None)
+        else:
+            target[key] = apply_merge_patch(target.get(key), value)
+    return target
+
+
+# ---------------- Translating to one MongoDB update ----------------
+def _field_name(seg: str) -> bool:
+    """A segment that means the same as a MongoDB path component on objects and arrays alike"""
+    return bool(seg) and "." not in seg and not seg.startswith("$") and not seg.isdigit() and seg != "-" and "\0" not in seg
+
+
+def _overlaps(fields: List[str]) -> bool:
+    ordered = sorted(fields)
+    return any(b == a or b.startswith(a + ".") for a, b in zip(ordered, ordered[1:]))
+
+
+# A real embedded document: $type "object" alone also matches arrays of documents
+_OBJECT = {"$type": "object", "$not": {"$type": "array"}}
+
+
+def _conditions(objects: set, extra: List[dict]) -> dict:
+    return {"$and": [{field: _OBJECT} for field in sorted(objects)] + extra}
+
+
+def _ancestors(prefix: str, path: List[str]) -> List[str]:
+    """``prefix`` and every object path above the last segment of ``path``"""
+    return [".".join([prefix] + path[:i]) for i in range(len(path))]
+
+
+def json_patch_update(ops: list, prefix: str = "sketch_state") -> Optional[Tuple[dict, dict]]:
+    """(conditions, update) equivalent to ``ops`` on ``prefix``, or None if there is no such single update"""
+    if not isinstance(ops, list) or not ops:
+        return None
+    sets, unsets, pushes, objects, conditions = {}, {}, {}, set(), []
+    for op in ops:
+        if not isinstance(op, dict) or op.get("op") not in ("add", "remove", "replace"):
+            return None
+        try:
+            path = parse_pointer(op.get("path"))
+        except PatchError:
+            return None
+        if not path or not all(_field_name(seg) for seg in path[:-1]):
+            return None
+        if op["op"] == "add" and path[-1] == "-":
+            parent = ".".join([prefix] + path[:-1])
+            if "value" not in op or parent in pushes:
+                return None
+            pushes[parent] = {"$each": [op["value"]]}
+            objects.update(_ancestors(prefix, path[:-1]))
+            conditions.append({parent: {"$type": "array"}})
+            continue
+        if not _field_name(path[-1]) or (op["op"] != "remove" and "value" not in op):
+            return None
+        field = ".".join([prefix] + path)
+        if field in sets or field in unsets:
+            # A second op on the same member depends on the first (e.g. a repeated
+            # remove must fail): only the sequential apply gets that right
+            return None
+        objects.update(_ancestors(prefix, path))
+        if op["op"] == "add":
+            sets[field] = op["value"]
+        else:
+            if op["op"] == "remove":
+                unsets[field] = ""
+            else:
+                sets[field] = op["value"]
+            conditions.append({field: {"$exists": True}})
+    if _overlaps(list(sets) + list(unsets) + list(pushes)):
+        return None
+    update = {}
+    if sets:
+        update["$set"] = sets
+    if unsets:
+        update["$unset"] = unsets
+    if pushes:
+        update["$push"] = pushes
+    return _conditions(objects, conditions), update
+
+
+def merge_patch_update(patch, prefix: str = "sketch_state") -> Optional[Tuple[dict, dict]]:
+    """(conditions, update) equivalent to merge ``patch`` on ``prefix``, or None"""
+    if not isinstance(patch, dict) or not patch:
+        return None
+    sets, unsets, conditions = {}, {}, []
+
+    def walk(node: dict, path: str) -> bool:
+        for key, value in node.items():
+            if not _field_name(key):
+                return False
+            field = f"{path}.{key}"
+            if value is None:
+                unsets[field] = ""
+            elif isinstance(value, dict):
+                # Merging into a member: it must be an object or absent (then created)
+                if not value or all(v is None for v in value.values()):
+                    # Only removals: RFC 7386 still leaves an empty object behind when the
+                    # member is absent, which $unset alone would not
+                    return False
+                conditions.append({"$or": [{field: {"$exists": False}}, {field: _OBJECT}]})
+                if not walk(value, field):
+                    return False
+            else:
+                sets[field] = value
+        return True
+
+    if not walk(patch, prefix):
+        return None
+    update = {}
+    if sets:
+        update["$set"] = sets
+    if unsets:
+        update["$unset"] = unsets
+    return _conditions({prefix}, conditions), update
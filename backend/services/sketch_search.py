@@ -0,0 +1,100 @@
+"""Indexed search over sketches.
+
+Two index-backed mechanisms replace the unanchored ``$regex`` filters, which
+could not use an index and passed user input straight into a regex:
+
+- ``search_terms``: normalised tokens (casefolded, accents stripped, split on
+  anything that is not a letter or digit, in any script) of the ``suspect``
+  and ``officer`` fields, kept on every sketch document::
+
+      {"search_terms": {"suspect": ["jose", "garcia"], "officer": ["o", "brien"]}}
+
+  ``terms_filter("suspect", "Gar")`` matches sketches where every query token
+  is a prefix of some suspect token. The query is an anchored, escaped regex
+  on a multikey index, so it reads index ranges instead of the collection.
+  Text with no letters or digits at all has no tokens. ``terms_filter``
+  returns None for it, and the caller must treat that as "matches nothing"
+  rather than as no filter.
+- A weighted text index over name, suspect, officer, eyewitness and
+  description answers free-text search ranked by ``textScore``.
+
+``search_terms`` is written by ``terms_for`` on save and on updates that touch
+those fields, together with ``search_terms_version``. ``backfill`` rewrites it
+for sketches saved before it existed or tokenised under an older version.
+"""
+import re
+import unicodedata
+from typing import Dict, List, Optional
+
+from bson.regex import Regex
+from pymongo import UpdateOne
+
+TERM_FIELDS = ("suspect", "officer")
+TEXT_WEIGHTS = {"name": 10, "suspect": 8, "officer": 5, "eyewitness": 5, "description": 2}
+TEXT_INDEX_NAME = "sketch_text"
+# Bump when tokens() changes so backfill re-tokenises stored sketches
+TERMS_VERSION = 2
+# Letters and digits of any script; "_" separates words like punctuation does
+_TOKEN = re.compile(r"[^\W_]+")
+
+
+def tokens(text: Optional[str]) -> List[str]:
+    """Casefolded, accent-free word tokens of ``text`` (deduplicated, in order)"""
+    if not text:
+        return []
+    decomposed = unicodedata.normalize("NFKD", text.casefold())
+    folded = "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return list(dict.fromkeys(_TOKEN.findall(folded)))
+
+
+def terms_for(fields: Dict[str, Optional[str]]) -> Dict[str, list]:
+    """``$set`` entries refreshing ``search_terms`` for whichever TERM_FIELDS are in ``fields``"""
+    entries = {f"search_terms.{field}": tokens(fields[field]) for field in TERM_FIELDS if field in fields}
+    if entries:
+        entries["search_terms_version"] = TERMS_VERSION
+    return entries
+
+
+def is_current(doc: dict) -> bool:
+    """Whether ``doc``'s stored ``search_terms`` were produced by this version of ``tokens``"""
+    return "search_terms" in doc and doc.get("search_terms_version") == TERMS_VERSION
+
+
+def terms_filter(field: str, text: str) -> Optional[dict]:
+    """Query matching sketches whose ``field`` has a word starting with each token of ``text``.
+
+    None when ``text`` has no tokens: no sketch can match it.
+    """
+    query_tokens = tokens(text)
+    if not query_tokens:
+        return None
+    return {f"search_terms.{field}": {"$all": [Regex("^" + re.escape(token)) for token in query_tokens]}}
+
+
+async def ensure_indexes(collection):
+    for field in TERM_FIELDS:
+        await collection.create_index(f"search_terms.{field}")
+    # No language: names are not stemmed or dropped as stop words
+    await collection.create_index(
+        [(field, "text") for field in TEXT_WEIGHTS],
+        weights=TEXT_WEIGHTS, default_language="none", name=TEXT_INDEX_NAME,
+    )
+
+
+async def backfill(collection, batch_size: int = 500) -> int:
+    """(Re)write ``search_terms`` where it is missing or stale; returns how many sketches were updated"""
+    updated = 0
+    batch = []
+    cursor = collection.find({"search_terms_version": {"$ne": TERMS_VERSION}}, {field: 1 for field in TERM_FIELDS})
+    try:
+        async for doc in cursor:
+            terms = {field: tokens(doc.get(field)) for field in TERM_FIELDS}
+            batch.append(UpdateOne({"_id": doc["_id"]}, {"$set": {"search_terms": terms, "search_terms_version": TERMS_VERSION}}))
+            if len(batch) >= batch_size:
+                updated += (await collection.bulk_write(batch, ordered=False)).modified_count
+                batch = []
+        if batch:
+            updated += (await collection.bulk_write(batch, ordered=False)).modified_count
+    finally:
+        await cursor.close()
+    return updated
@@ -0,0 +1,202 @@
+"""Binary gallery snapshots for bootstrapping nodes.
+
+Building a node's embedding store from MongoDB means decoding every
+``face_embeddings`` document, one row at a time. A snapshot is the finished
+store in one file. A new node maps it and block-copies it in a single
+sequential pass.
+
+Layout (little-endian)::
+
+    offset 0      header, HEADER_SIZE bytes (see HEADER)
+    DATA_ALIGN    embeddings: (rows, dim) float32, L2-normalised
+    ids_offset    row table: (rows,) ID_DTYPE, i.e. face_id/embedding_id as 24-byte ASCII
+    meta_offset   JSON metadata: created_at, source, crc32 of embeddings + row table
+
+The header starts with ``MAGIC`` and a format version. Its offsets make both
+arrays addressable with ``np.memmap``, so ``read_snapshot`` opens a snapshot
+of any size without loading it. ``change_seq`` is the change-feed position
+the rows reflect. After an import the node tails ``face_changes`` from there,
+exactly as after a reopen.
+"""
+import json
+import os
+import struct
+import tempfile
+import zlib
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from services.embedding_store import EMBEDDING_DIM, ID_DTYPE, TOMBSTONE, EmbeddingStore
+
+MAGIC = b"FACESNAP"
+SNAPSHOT_VERSION = 1
+# magic, version, dim, rows, change_seq, embeddings_offset, ids_offset, meta_offset, meta_length
+HEADER = struct.Struct("<8sIIQQQQQQ")
+HEADER_SIZE = 128
+DATA_ALIGN = 4096
+MEDIA_TYPE = "application/vnd.eyedentify.snapshot"
+
+Chunk = Tuple[np.ndarray, np.ndarray]
+
+
+class SnapshotInfo(NamedTuple):
+    version: int
+    dim: int
+    rows: int
+    change_seq: int
+    embeddings_offset: int
+    ids_offset: int
+    meta: dict
+
+
+def _align(offset: int) -> int:
+    return -(-offset // DATA_ALIGN) * DATA_ALIGN
+
+
+def write_snapshot(path, chunks: Iterable[Chunk], change_seq: int, dim: int = EMBEDDING_DIM,
+                   source: str = "") -> SnapshotInfo:
+    """Write ``(embeddings, ids)`` chunks to ``path`` atomically.
+
+    The row count does not have to be known up front: embeddings stream to
+    the file while the row table goes to a side file that is appended at the
+    end, and the header is written last.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".snap.tmp")
+    ids_tmp = tmp + ".ids"
+    crc_embeddings = crc_ids = 0
+    rows = 0
+    try:
+        with os.fdopen(fd, "w+b") as out, open(ids_tmp, "w+b") as ids_out:
+            out.seek(DATA_ALIGN)
+            for embeddings, ids in chunks:
+                embeddings = np.ascontiguousarray(embeddings, dtype="<f4")
+                if embeddings.ndim != 2 or embeddings.shape[1] != dim or len(ids) != len(embeddings):
+                    raise ValueError(f"Snapshot chunks must be (n, {dim}) float32 with one id per row")
+                ids = np.ascontiguousarray(ids, dtype=ID_DTYPE)
+                crc_embeddings = zlib.crc32(memoryview(embeddings).cast("B"), crc_embeddings)
+                crc_ids = zlib.crc32(memoryview(ids).cast("B"), crc_ids)
+                out.write(memoryview(embeddings).cast("B"))
+                ids_out.write(memoryview(ids).cast("B"))
+                rows += len(embeddings)
+
+            ids_offset = _align(DATA_ALIGN + rows * dim * 4)
+            out.seek(ids_offset)
+            ids_out.seek(0)
+            while True:
+                block = ids_out.read(8 * 1024 * 1024)
+                if not block:
+                    break
+                out.write(block)
+
+            meta = {
+                "created_at": datetime.utcnow().isoformat() + "Z",
+                "source": source,
+                "crc32_embeddings": crc_embeddings,
+                "crc32_ids": crc_ids,
+            }
+            meta_bytes = json.dumps(meta).encode()
+            meta_offset = ids_offset + rows * ID_DTYPE.itemsize
+            out.write(meta_bytes)
+
+            out.seek(0)
+            out.write(HEADER.pack(MAGIC, SNAPSHOT_VERSION, dim, rows, int(change_seq), DATA_ALIGN,
+                                  ids_offset, meta_offset, len(meta_bytes)).ljust(HEADER_SIZE, b"\0"))
+            out.flush()
+            os.fsync(out.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+    finally:
+        if os.path.exists(ids_tmp):
+            os.unlink(ids_tmp)
+    return SnapshotInfo(SNAPSHOT_VERSION, dim, rows, int(change_seq), DATA_ALIGN, ids_offset, meta)
+
+
+def read_info(path) -> SnapshotInfo:
+    """Parse and sanity-check the header and metadata of a snapshot"""
+    size = os.path.getsize(path)
+    with open(path, "rb") as fh:
+        header = fh.read(HEADER_SIZE)
+        if len(header) < HEADER.size or header[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a gallery snapshot")
+        _, version, dim, rows, change_seq, emb_offset, ids_offset, meta_offset, meta_length = HEADER.unpack_from(header)
+        if version != SNAPSHOT_VERSION:
+            raise ValueError(f"Unsupported snapshot version {version} (expected {SNAPSHOT_VERSION})")
+        if (emb_offset + rows * dim * 4 > ids_offset
+                or ids_offset + rows * ID_DTYPE.itemsize > meta_offset
+                or meta_offset + meta_length > size):
+            raise ValueError(f"{path} is truncated or corrupt")
+        fh.seek(meta_offset)
+        meta = json.loads(fh.read(meta_length))
+    return SnapshotInfo(version, dim, rows, change_seq, emb_offset, ids_offset, meta)
+
+
+def read_snapshot(path, verify: bool = True) -> Tuple[SnapshotInfo, np.ndarray, np.ndarray]:
+    """Map a snapshot read-only: (info, embeddings, ids).
+
+    ``verify`` checks both CRCs in one sequential read. That read also warms
+    the page cache for the copy that usually follows.
+    """
+    info = read_info(path)
+    if info.rows == 0:
+        return info, np.empty((0, info.dim), dtype="float32"), np.empty(0, dtype=ID_DTYPE)
+    embeddings = np.memmap(path, dtype="<f4", mode="r", offset=info.embeddings_offset, shape=(info.rows, info.dim))
+    ids = np.memmap(path, dtype=ID_DTYPE, mode="r", offset=info.ids_offset, shape=(info.rows,))
+    if verify:
+        step = 16384
+        crc_embeddings = crc_ids = 0
+        for start in range(0, info.rows, step):
+            crc_embeddings = zlib.crc32(memoryview(embeddings[start:start + step]).cast("B"), crc_embeddings)
+            crc_ids = zlib.crc32(memoryview(ids[start:start + step]).cast("B"), crc_ids)
+        if (crc_embeddings, crc_ids) != (info.meta.get("crc32_embeddings"), info.meta.get("crc32_ids")):
+            raise ValueError(f"{path} failed its checksum")
+    return info, embeddings, ids
+
+
+def restore_snapshot(store: EmbeddingStore, path, verify: bool = True,
+                     row_filter: Optional[Callable[[np.ndarray], np.ndarray]] = None) -> SnapshotInfo:
+    """Replace ``store``'s contents with a snapshot and set its change-feed token"""
+    info, embeddings, ids = read_snapshot(path, verify=verify)
+    if info.dim != store.dim:
+        raise ValueError(f"Snapshot has {info.dim}-d embeddings, the store expects {store.dim}")
+    store.load_arrays(embeddings, ids, change_seq=info.change_seq, row_filter=row_filter)
+    return info
+
+
+# ---------------- Sources ----------------
+def store_chunks(store: EmbeddingStore, chunk_rows: int = 16384) -> Tuple[Iterator[Chunk], int]:
+    """Live rows of an open store, plus the change-feed position they reflect"""
+    embeddings, ids, count, change_seq = store.view()
+
+    def chunks():
+        for start in range(0, count, chunk_rows):
+            stop = min(start + chunk_rows, count)
+            chunk_ids = ids[start:stop]
+            live = chunk_ids["face_id"] != TOMBSTONE
+            yield np.asarray(embeddings[start:stop][live]), np.asarray(chunk_ids[live])
+
+    return chunks(), change_seq
+
+
+def row_chunks(rows: Iterable[Tuple[str, str, np.ndarray]], dim: int = EMBEDDING_DIM,
+               chunk_rows: int = 16384) -> Iterator[Chunk]:
+    """Batch ``(face_id, embedding_id, vector)`` rows (e.g. from MongoDB) into snapshot chunks"""
+    embeddings = np.empty((chunk_rows, dim), dtype="float32")
+    ids = np.empty(chunk_rows, dtype=ID_DTYPE)
+    n = 0
+    for face_id, embedding_id, vector in rows:
+        embeddings[n] = np.asarray(vector, dtype="float32").reshape(dim)
+        ids[n] = (face_id.encode("ascii"), embedding_id.encode("ascii"))
+        n += 1
+        if n == chunk_rows:
+            yield embeddings, ids
+            n = 0
+    if n:
+        yield embeddings[:n], ids[:n]
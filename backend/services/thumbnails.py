@@ -0,0 +1,217 @@
+"""Thumbnail derivatives for gallery tiles.
+
+The dashboard used to download full-size originals (often several MB) to draw
+160px tiles. Every stored image now gets fixed-size derivatives, by default
+64/160/320 px on the long side in WebP and JPEG, produced by a small
+background pool and written to the same media storage as the originals.
+
+Derivatives are keyed by the original's URL in ``media_derivatives``::
+
+    {"_id": "<original url>", "thumbnails": {"160": {"webp": url, "jpeg": url}, ...}, "created_at": ...}
+
+- New uploads: the upload queue calls ``schedule(url, data)`` as soon as the
+  original is stored, so the bytes are already in memory.
+- Legacy images: listing endpoints call ``lookup(urls)``. Any URL without a
+  record is scheduled for lazy generation, and its original is fetched once
+  (read from disk for the local store). The response then falls back to the
+  original until the record exists.
+
+Failed sources (e.g. a deleted CDN image) are not retried for
+``retry_failed_after`` seconds, so a broken URL on a hot page does not turn
+into a download per request.
+"""
+import hashlib
+import io
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, Iterable, Optional, Tuple
+
+import httpx
+from PIL import Image, ImageOps
+
+from services.change_feed import bump_media_version
+from services.media_storage import OBJECTS_PATH, LocalMediaStorage, MediaStorage
+
+FORMATS = {"webp": ("WEBP", "image/webp", {"quality": 80, "method": 4}),
+           "jpeg": ("JPEG", "image/jpeg", {"quality": 82, "optimize": True, "progressive": True})}
+
+
+def render_thumbnails(data: bytes, sizes: Iterable[int], formats: Iterable[str]) -> Dict[Tuple[int, str], bytes]:
+    """Encode ``data`` at each (long-side size, format); never upscales"""
+    rendered = {}
+    with Image.open(io.BytesIO(data)) as img:
+        img = ImageOps.exif_transpose(img)
+        has_alpha = img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info)
+        img = img.convert("RGBA" if has_alpha else "RGB")
+        # Largest first, each step downsampling the previous one
+        for size in sorted(sizes, reverse=True):
+            img.thumbnail((size, size), Image.LANCZOS)
+            for fmt in formats:
+                pil_format, _, params = FORMATS[fmt]
+                frame = img
+                if pil_format == "JPEG" and has_alpha:
+                    frame = Image.new("RGB", img.size, (255, 255, 255))
+                    frame.paste(img, mask=img.getchannel("A"))
+                buffer = io.BytesIO()
+                frame.save(buffer, pil_format, **params)
+                rendered[(size, fmt)] = buffer.getvalue()
+    return rendered
+
+
+class ThumbnailService:
+    def __init__(
+        self,
+        db,
+        async_db,
+        storage: MediaStorage,
+        sizes: Iterable[int] = (64, 160, 320),
+        formats: Iterable[str] = ("webp", "jpeg"),
+        workers: int = 1,
+        max_pending: int = 256,
+        lazy: bool = True,
+        retry_failed_after: float = 3600.0,
+        fetch_timeout: float = 10.0,
+        name: str = "media_derivatives",
+    ):
+        self.collection = db[name]
+        self.async_collection = async_db[name] if async_db is not None else None
+        self.storage = storage
+        self.sizes = tuple(sorted({int(s) for s in sizes}))
+        unknown = set(formats) - set(FORMATS)
+        if unknown:
+            raise ValueError(f"Unsupported thumbnail formats: {', '.join(sorted(unknown))}")
+        self.formats = tuple(formats)
+        self.max_pending = max(1, int(max_pending))
+        self.lazy = lazy
+        self.retry_failed_after = retry_failed_after
+        self.fetch_timeout = fetch_timeout
+        self._executor = ThreadPoolExecutor(max_workers=max(1, int(workers)), thread_name_prefix="thumbnails")
+        self._lock = threading.Lock()
+        self._pending = set()
+        self._failed: Dict[str, float] = {}
+        self._counters = {"generated": 0, "lazy_scheduled": 0, "dropped": 0, "failed": 0}
+        self._render_seconds_total = 0.0
+
+    # ---------------- Generation ----------------
+    def schedule(self, url: str, data: Optional[bytes] = None) -> bool:
+        """Queue derivative generation for ``url`` (fetching it when ``data`` is None)"""
+        if not url or not self.sizes or "/media/pending/" in url:
+            return False  # placeholders are handled when their upload lands
+        with self._lock:
+            if url in self._pending:
+                return False
+            failed_at = self._failed.get(url)
+            if data is None and failed_at is not None and time.monotonic() - failed_at < self.retry_failed_after:
+                return False
+            if len(self._pending) >= self.max_pending:
+                # Lazy lookups will schedule it again later
+                self._counters["dropped"] += 1
+                return False
+            self._pending.add(url)
+        self._executor.submit(self._generate, url, data)
+        return True
+
+    def _fetch(self, url: str) -> bytes:
+        if isinstance(self.storage, LocalMediaStorage) and OBJECTS_PATH + "/" in url:
+            path = self.storage.path_for(url.rsplit("/", 1)[-1])
+            if path is None:
+                raise FileNotFoundError(url)
+            return path.read_bytes()
+        response = httpx.get(url, timeout=self.fetch_timeout, follow_redirects=True)
+        response.raise_for_status()
+        return response.content
+
+    def _generate(self, url: str, data: Optional[bytes]):
+        try:
+            if data is None:
+                data = self._fetch(url)
+            started = time.perf_counter()
+            rendered = render_thumbnails(data, self.sizes, self.formats)
+            elapsed = time.perf_counter() - started
+            data = None
+            key = hashlib.sha1(url.encode()).hexdigest()[:20]
+            thumbnails: Dict[str, Dict[str, str]] = {}
+            for (size, fmt), payload in rendered.items():
+                result = self.storage.put(
+                    payload, "thumbnails", f"{key}_{size}_{fmt}", FORMATS[fmt][1], {"resource_type": "image"},
+                    base_url=url.split(OBJECTS_PATH, 1)[0] if OBJECTS_PATH in url else "",
+                )
+                thumbnails.setdefault(str(size), {})[fmt] = result["secure_url"]
+            self.collection.update_one(
+                {"_id": url},
+                {"$set": {"thumbnails": thumbnails, "created_at": datetime.utcnow()}},
+                upsert=True,
+            )
+            bump_media_version(self.collection.database)
+            with self._lock:
+                self._failed.pop(url, None)
+                self._counters["generated"] += 1
+                self._render_seconds_total += elapsed
+        except Exception as e:
+            with self._lock:
+                self._failed[url] = time.monotonic()
+                self._counters["failed"] += 1
+            print(f"⚠️ Thumbnails for {url} failed: {e}")
+        finally:
+            with self._lock:
+                self._pending.discard(url)
+
+    # ---------------- Lookup ----------------
+    async def lookup(self, urls: Iterable[str]) -> Dict[str, dict]:
+        """Derivative URLs by original URL; schedules lazy generation for the rest"""
+        wanted = list({url for url in urls if url})
+        if not wanted or self.async_collection is None:
+            return {}
+        found = {}
+        cursor = self.async_collection.find({"_id": {"$in": wanted}}, {"thumbnails": 1})
+        try:
+            async for doc in cursor:
+                found[doc["_id"]] = doc.get("thumbnails") or {}
+        finally:
+            await cursor.close()
+        if self.lazy:
+            for url in wanted:
+                if url not in found and self.schedule(url):
+                    with self._lock:
+                        self._counters["lazy_scheduled"] += 1
+        return found
+
+    def ensure_indexes(self):
+        self.collection.create_index("created_at")
+
+    def stop(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def metrics(self) -> dict:
+        with self._lock:
+            generated = self._counters["generated"]
+            return {
+                "sizes": list(self.sizes),
+                "formats": list(self.formats),
+                "pending": len(self._pending),
+                **self._counters,
+                "avg_render_seconds": round(self._render_seconds_total / generated, 4) if generated else None,
+            }
+
+
+def _create_default_service() -> ThumbnailService:
+    from database import async_db, db
+    from services.media_storage import media_storage
+
+    sizes = [int(s) for s in os.getenv("THUMBNAIL_SIZES", "64,160,320").split(",") if s.strip()]
+    formats = [f.strip().lower() for f in os.getenv("THUMBNAIL_FORMATS", "webp,jpeg").split(",") if f.strip()]
+    try:
+        workers = int(os.getenv("THUMBNAIL_WORKERS", "1"))
+    except ValueError as exc:
+        raise RuntimeError(f"Environment variable THUMBNAIL_WORKERS must be an integer. Got: {os.getenv('THUMBNAIL_WORKERS')}") from exc
+    return ThumbnailService(
+        db, async_db, media_storage,
+        sizes=sizes, formats=formats, workers=workers,
+        lazy=os.getenv("THUMBNAIL_LAZY", "true").strip().lower() in {"1", "true", "yes", "on"},
+    )
+
+
+thumbnails = _create_default_service()
@@ -0,0 +1,618 @@
+"""Persistent background queue for media uploads.
+
+Handlers used to call ``cloudinary.uploader.upload`` inline, so every request
+waited for the CDN round trip while the event loop was blocked. Now a
+handler *stages* the upload instead (for remote backends; see
+``services.media_storage``):
+
+1. the bytes and job metadata are written to a local spool directory
+   (``<id>.bin`` then ``<id>.json``; the JSON is written last, so a job
+   exists only once its bytes are durable);
+2. the documents are written with a placeholder URL,
+   ``<base>/media/pending/<id>``, served from the spool;
+3. ``submit()`` hands the job to a pool of worker threads, which upload
+   with bounded concurrency and retry failures with exponential backoff
+   and jitter;
+4. once the upload succeeds, every document still holding the placeholder
+   is patched with the final URL (see ``MongoPatcher``). The spooled bytes
+   are dropped and a small ``<id>.done.json`` record keeps the placeholder
+   redirecting to the final URL.
+
+Several processes (e.g. gunicorn workers) may share one spool. A process
+owns a job while it holds an exclusive ``flock`` on the job's ``.bin`` file,
+which it takes when it stages the job. The kernel drops the lock when the
+process dies. Recovery only takes over jobs that no live process holds and
+that have not been touched for ``recover_grace`` seconds. It runs at start,
+where it also retries jobs that exhausted their attempts, and then every
+``recover_grace`` seconds, so jobs orphaned by a crashed sibling are picked
+up without a restart. A done record is pruned after ``done_retention`` only
+once no target document still holds its placeholder. With a ``synchronous``
+backend (the local store) ``stage`` writes straight to storage and the
+returned URL is already final. The storage and patcher are injected, so the
+queue can be exercised against ``FakeStorage`` without a CDN or a database.
+"""
+import heapq
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import IO, Callable, Dict, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # not POSIX: one process per spool
+    fcntl = None
+
+from services.change_feed import bump_media_version
+from services.media_storage import CONTENT_TYPES_BY_EXTENSION, MediaStorage, image_content_type
+
+STATE_PENDING = "pending"
+STATE_FAILED = "failed"
+STATE_DONE = "done"
+
+PENDING_PATH = "/media/pending"
+
+
+class UploadJob:
+    __slots__ = (
+        "id", "folder", "public_id", "placeholder", "content_type", "options", "targets",
+        "attempts", "state", "error", "result",
+    )
+
+    def __init__(self, id: str, folder: str, public_id: str, placeholder: str,
+                 content_type: str = "application/octet-stream",
+                 options: Optional[dict] = None, targets: Optional[List[dict]] = None,
+                 attempts: int = 0, state: str = STATE_PENDING, error: Optional[str] = None,
+                 result: Optional[dict] = None):
+        self.id = id
+        self.folder = folder
+        self.public_id = public_id
+        self.placeholder = placeholder
+        self.content_type = content_type
+        self.options = options or {}
+        self.targets = targets or []
+        self.attempts = attempts
+        self.state = state
+        self.error = error
+        self.result = result
+
+    @property
+    def stored_public_id(self) -> Optional[str]:
+        """Backend id of the stored object, None while the upload is queued"""
+        return self.result.get("public_id") if self.result else None
+
+    def to_dict(self) -> dict:
+        return {slot: getattr(self, slot) for slot in self.__slots__}
+
+
+def url_target(collection: str, field: str, array: bool = False, extra: Optional[Dict[str, str]] = None) -> dict:
+    """Patch instruction: replace the placeholder held in ``collection.field``.
+
+    ``array`` marks a list field (e.g. ``image_urls``); only the matching
+    element is replaced. ``extra`` maps further document fields to keys of the
+    upload result, e.g. ``{"cloudinary_public_id": "public_id"}``.
+    """
+    return {"collection": collection, "field": field, "array": array, "extra": extra or {}}
+
+
+class MongoPatcher:
+    """Swap a placeholder URL for the uploaded one wherever it is still stored"""
+
+    def __init__(self, db):
+        self.db = db
+
+    def __call__(self, placeholder: str, result: dict, targets: List[dict]) -> int:
+        patched = 0
+        for target in targets:
+            field = target["field"]
+            update = {f"{field}.$" if target.get("array") else field: result["secure_url"]}
+            for doc_field, result_key in (target.get("extra") or {}).items():
+                if result_key in result:
+                    update[doc_field] = result[result_key]
+            res = self.db[target["collection"]].update_many({field: placeholder}, {"$set": update})
+            patched += res.modified_count
+        if patched:
+            bump_media_version(self.db)
+        return patched
+
+    def references(self, placeholder: str, targets: List[dict]) -> bool:
+        """Whether any target document still holds ``placeholder``"""
+        return any(
+            self.db[target["collection"]].find_one({target["field"]: placeholder}, {"_id": 1}) is not None
+            for target in targets
+        )
+
+
+def _write_atomic(path: Path, payload: bytes):
+    fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as fh:
+            fh.write(payload)
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+
+
+class UploadQueue:
+    def __init__(
+        self,
+        spool_dir: str,
+        storage: MediaStorage,
+        patcher: Optional[Callable[[str, dict, List[dict]], int]] = None,
+        workers: int = 2,
+        max_attempts: int = 6,
+        retry_base: float = 2.0,
+        retry_max: float = 300.0,
+        public_base_url: str = "",
+        done_retention: float = 86400.0,
+        recover_grace: float = 60.0,
+        on_stored: Optional[Callable[[str, bytes], None]] = None,
+    ):
+        self.spool = Path(spool_dir)
+        self.storage = storage
+        self.patcher = patcher
+        self.workers = max(1, int(workers))
+        self.max_attempts = max(1, int(max_attempts))
+        self.retry_base = max(0.0, float(retry_base))
+        self.retry_max = max(self.retry_base, float(retry_max))
+        self.public_base_url = public_base_url.rstrip("/")
+        self.done_retention = done_retention
+        self.recover_grace = max(1.0, float(recover_grace))
+        # Called with (final url, bytes) once an object is stored, e.g. to render thumbnails
+        self.on_stored = on_stored
+        self._cond = threading.Condition()
+        self._heap: List[tuple] = []  # (due, seq, job_id)
+        self._seq = 0
+        self._jobs: Dict[str, UploadJob] = {}
+        self._claims: Dict[str, IO[bytes]] = {}  # job id -> locked .bin handle
+        self._threads: List[threading.Thread] = []
+        self._stopping = False
+        self._active = 0
+        self._counters = {
+            "stored_inline": 0, "staged": 0, "uploaded": 0, "retried": 0, "failed": 0, "patched_documents": 0,
+            "recovered": 0, "discarded": 0,
+        }
+        self._upload_seconds_total = 0.0
+
+    # ---------------- Spool ----------------
+    def _meta_path(self, job_id: str) -> Path:
+        return self.spool / f"{job_id}.json"
+
+    def _data_path(self, job_id: str) -> Path:
+        return self.spool / f"{job_id}.bin"
+
+    def _done_path(self, job_id: str) -> Path:
+        return self.spool / f"{job_id}.done.json"
+
+    def _save(self, job: UploadJob):
+        _write_atomic(self._meta_path(job.id), json.dumps(job.to_dict()).encode())
+
+    def _claim(self, job_id: str) -> bool:
+        """Take ownership of a spooled job; False if another process holds it or it is gone"""
+        with self._cond:
+            if job_id in self._claims:
+                return True
+        path = self._data_path(job_id)
+        try:
+            fh = open(path, "rb")
+        except FileNotFoundError:
+            return False
+        if fcntl is not None:
+            try:
+                fcntl.flock(fh.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                fh.close()
+                return False
+        try:
+            # The owner may have finished (and unlinked the file) between our open and lock
+            current = os.stat(path).st_ino == os.fstat(fh.fileno()).st_ino
+        except FileNotFoundError:
+            current = False
+        if not current:
+            fh.close()
+            return False
+        with self._cond:
+            self._claims[job_id] = fh
+        return True
+
+    def _release(self, job_id: str):
+        with self._cond:
+            fh = self._claims.pop(job_id, None)
+        if fh is not None:
+            fh.close()
+
+    def placeholder_url(self, job_id: str, base_url: str = "") -> str:
+        base = self.public_base_url or base_url.rstrip("/")
+        return f"{base}{PENDING_PATH}/{job_id}"
+
+    def stage(self, data: bytes, folder: str, public_id: str, targets: List[dict],
+              options: Optional[dict] = None, base_url: str = "") -> UploadJob:
+        """Spool the bytes durably; the job is not uploaded until ``submit``.
+
+        ``job.placeholder`` is the URL to store in the documents listed in
+        ``targets`` until the upload completes. A synchronous backend stores
+        the bytes right away; the placeholder is then the final URL. Raises
+        ``UnsupportedMediaType`` unless ``data`` is a JPEG, PNG, WebP or GIF.
+        """
+        job_id = uuid.uuid4().hex
+        job = UploadJob(
+            id=job_id, folder=folder, public_id=public_id, placeholder=self.placeholder_url(job_id, base_url),
+            content_type=image_content_type(data), options=options, targets=targets,
+        )
+        if self.storage.synchronous:
+            result = self.storage.put(data, folder, public_id, job.content_type, job.options, base_url=base_url)
+            job.placeholder = result["secure_url"]
+            job.state = STATE_DONE
+            job.result = result
+            with self._cond:
+                self._counters["stored_inline"] += 1
+            self._notify_stored(result["secure_url"], data)
+            return job
+        self.spool.mkdir(parents=True, exist_ok=True)
+        _write_atomic(self._data_path(job.id), data)
+        # Locked before the JSON exists, so no other process can recover it
+        self._claim(job.id)
+        self._save(job)
+        with self._cond:
+            self._counters["staged"] += 1
+        return job
+
+    def _notify_stored(self, url: str, data: bytes):
+        if self.on_stored is None:
+            return
+        try:
+            self.on_stored(url, data)
+        except Exception as e:
+            print(f"⚠️ Post-upload hook failed for {url}: {e}")
+
+    def submit(self, job: UploadJob):
+        """Schedule a staged job, once the documents referencing its placeholder exist"""
+        if job.state != STATE_DONE:
+            self._schedule(job, delay=0.0)
+
+    def discard(self, job: UploadJob):
+        """Drop a staged job that no document ended up referencing (the handler failed)"""
+        if job.state == STATE_DONE:
+            return  # Stored synchronously; tools/gc_media.py sweeps unreferenced objects
+        with self._cond:
+            self._jobs.pop(job.id, None)
+            self._counters["discarded"] += 1
+        # JSON first: a job is only recoverable while both files exist
+        for path in (self._meta_path(job.id), self._data_path(job.id)):
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+        self._release(job.id)
+
+    def settle(self, job: Optional[UploadJob], saved: bool):
+        """End of a handler: upload ``job`` if a document now holds its placeholder, else discard it"""
+        if job is None:
+            return
+        if saved:
+            self.submit(job)
+        else:
+            self.discard(job)
+
+    def pending_media(self, job_id: str):
+        """(path, content_type) of spooled bytes, ("redirect", url) once uploaded, or None"""
+        if not job_id.isalnum():
+            return None
+        done = self._done_path(job_id)
+        if done.exists():
+            try:
+                return "redirect", json.loads(done.read_text())["url"]
+            except (OSError, ValueError, KeyError):
+                return None
+        data = self._data_path(job_id)
+        try:
+            meta = json.loads(self._meta_path(job_id).read_text())
+        except (OSError, ValueError):
+            return None
+        if not data.exists():
+            return None
+        content_type = meta.get("content_type")
+        if content_type not in CONTENT_TYPES_BY_EXTENSION.values():
+            return None  # spooled before types were checked
+        return data, content_type
+
+    # ---------------- Scheduling ----------------
+    def _schedule(self, job: UploadJob, delay: float):
+        with self._cond:
+            self._jobs[job.id] = job
+            self._seq += 1
+            heapq.heappush(self._heap, (time.monotonic() + delay, self._seq, job.id))
+            self._cond.notify()
+
+    def _backoff(self, attempts: int) -> float:
+        delay = min(self.retry_max, self.retry_base * (2 ** (attempts - 1)))
+        return delay * random.uniform(0.5, 1.0)
+
+    def _next_job(self) -> Optional[UploadJob]:
+        with self._cond:
+            while not self._stopping:
+                if self._heap:
+                    due, _, job_id = self._heap[0]
+                    wait = due - time.monotonic()
+                    if wait <= 0:
+                        heapq.heappop(self._heap)
+                        job = self._jobs.get(job_id)
+                        if job is None:
+                            continue  # discarded
+                        self._active += 1
+                        return job
+                    self._cond.wait(timeout=wait)
+                else:
+                    self._cond.wait()
+            return None
+
+    def _process(self, job: UploadJob):
+        try:
+            data = self._data_path(job.id).read_bytes()
+        except FileNotFoundError:
+            with self._cond:
+                self._jobs.pop(job.id, None)
+            self._release(job.id)
+            return
+        started = time.perf_counter()
+        try:
+            base_url = job.placeholder[: -len(f"{PENDING_PATH}/{job.id}")]
+            result = self.storage.put(data, job.folder, job.public_id, job.content_type, job.options, base_url=base_url)
+        except Exception as e:
+            job.attempts += 1
+            job.error = str(e)
+            if job.attempts >= self.max_attempts:
+                job.state = STATE_FAILED
+                self._save(job)
+                with self._cond:
+                    self._jobs.pop(job.id, None)
+                    self._counters["failed"] += 1
+                self._release(job.id)
+                print(f"❌ Upload {job.id} ({job.folder}/{job.public_id}) failed after {job.attempts} attempts: {e}")
+                return
+            self._save(job)
+            delay = self._backoff(job.attempts)
+            with self._cond:
+                self._counters["retried"] += 1
+            print(f"⚠️ Upload {job.id} attempt {job.attempts} failed ({e}); retrying in {delay:.1f}s")
+            self._schedule(job, delay)
+            return
+        elapsed = time.perf_counter() - started
+
+        patched = self.patcher(job.placeholder, result, job.targets) if self.patcher is not None else 0
+        self._notify_stored(result["secure_url"], data)
+        _write_atomic(self._done_path(job.id), json.dumps({
+            "url": result["secure_url"],
+            "at": time.time(),
+            # Lets pruning check (and repair) documents that still hold the placeholder
+            "placeholder": job.placeholder,
+            "targets": job.targets,
+            "result": result,
+        }).encode())
+        for path in (self._meta_path(job.id), self._data_path(job.id)):
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+        self._release(job.id)
+        with self._cond:
+            self._jobs.pop(job.id, None)
+            self._counters["uploaded"] += 1
+            self._counters["patched_documents"] += patched
+            self._upload_seconds_total += elapsed
+
+    def _worker(self):
+        while True:
+            job = self._next_job()
+            if job is None:
+                return
+            try:
+                self._process(job)
+            except Exception as e:
+                # Spool I/O or the patch failed; keep the job and try again later
+                print(f"⚠️ Upload {job.id} could not be completed: {e}")
+                self._schedule(job, self._backoff(max(1, job.attempts)))
+            finally:
+                with self._cond:
+                    self._active -= 1
+
+    # ---------------- Lifecycle ----------------
+    def _prune_done(self, path: Path, now: float):
+        """Drop a done record past its retention unless a document may still hold its placeholder"""
+        try:
+            if now - path.stat().st_mtime <= self.done_retention:
+                return
+            record = json.loads(path.read_text())
+        except (OSError, ValueError):
+            return
+        targets, placeholder = record.get("targets"), record.get("placeholder")
+        if targets is None or placeholder is None:
+            return  # written before records named their targets: keep redirecting
+        references = getattr(self.patcher, "references", None)
+        if self.patcher is not None and references is not None:
+            try:
+                if references(placeholder, targets):
+                    # A patch was missed (e.g. the document was written after it): repair it, prune later
+                    self.patcher(placeholder, record.get("result") or {"secure_url": record["url"]}, targets)
+                    return
+            except Exception as e:
+                print(f"⚠️ Could not check references to {placeholder}: {e}")
+                return
+        try:
+            path.unlink()
+        except OSError:
+            pass
+
+    def _recover(self, retry_failed: bool = False) -> int:
+        """Take over unclaimed jobs idle for ``recover_grace``; prune done records"""
+        if not self.spool.exists():
+            return 0
+        recovered = 0
+        now = time.time()
+        for path in self.spool.glob("*.json"):
+            if path.name.endswith(".done.json"):
+                self._prune_done(path, now)
+                continue
+            job_id = path.name[: -len(".json")]
+            with self._cond:
+                if job_id in self._jobs or job_id in self._claims:
+                    continue  # ours
+            try:
+                if now - path.stat().st_mtime < self.recover_grace:
+                    continue  # its owner may still be writing or retrying it
+            except OSError:
+                continue
+            if not self._data_path(job_id).exists():
+                # Bytes are written before the JSON and removed after it: nothing left to upload
+                try:
+                    path.unlink()
+                except OSError:
+                    pass
+                continue
+            if not self._claim(job_id):
+                continue  # held by a live process, or already finished
+            try:
+                # Read after claiming: the owner may have rewritten it meanwhile
+                job = UploadJob(**json.loads(path.read_text()))
+            except FileNotFoundError:
+                self._release(job_id)
+                continue
+            except (OSError, ValueError, TypeError) as e:
+                self._release(job_id)
+                print(f"⚠️ Ignoring unreadable upload job {path.name}: {e}")
+                continue
+            if job.state == STATE_FAILED:
+                if not retry_failed:
+                    self._release(job_id)
+                    continue
+                job.state, job.attempts = STATE_PENDING, 0
+            self._schedule(job, delay=0.0)
+            recovered += 1
+        for tmp in self.spool.glob("*.tmp"):
+            try:
+                if now - tmp.stat().st_mtime >= self.recover_grace:
+                    tmp.unlink()
+            except OSError:
+                pass
+        if recovered:
+            with self._cond:
+                self._counters["recovered"] += recovered
+        return recovered
+
+    def _recover_loop(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._stopping, timeout=self.recover_grace)
+                if self._stopping:
+                    return
+            try:
+                recovered = self._recover()
+            except Exception as e:
+                print(f"⚠️ Upload spool recovery failed: {e}")
+                continue
+            if recovered:
+                print(f"📤 Took over {recovered} orphaned upload(s)")
+
+    def start(self):
+        if self._threads:
+            return
+        self._stopping = False
+        recovered = self._recover(retry_failed=True)
+        if recovered:
+            print(f"📤 Resuming {recovered} spooled upload(s)")
+        for n in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"upload-worker-{n}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        thread = threading.Thread(target=self._recover_loop, name="upload-recover", daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def stop(self, timeout: float = 5.0):
+        """Stop the workers; unfinished jobs stay in the spool for the next start"""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join(timeout=timeout)
+        self._threads = []
+        # Let another process take over whatever is left
+        for job_id in list(self._claims):
+            self._release(job_id)
+
+    def join(self, timeout: float = 30.0) -> bool:
+        """Wait until no job is queued or running (tests and tools)"""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self._jobs or self._active:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(timeout=min(remaining, 0.05))
+        return True
+
+    def metrics(self) -> dict:
+        with self._cond:
+            uploaded = self._counters["uploaded"]
+            return {
+                "workers": self.workers,
+                "queued": len(self._jobs) - self._active,
+                "in_flight": self._active,
+                "max_attempts": self.max_attempts,
+                **self._counters,
+                "avg_upload_seconds": round(self._upload_seconds_total / uploaded, 4) if uploaded else None,
+            }
+
+
+def _int_env(key: str, default: int) -> int:
+    value = os.getenv(key)
+    if value is None:
+        return int(default)
+    try:
+        return int(value)
+    except ValueError as exc:
+        raise RuntimeError(f"Environment variable {key} must be an integer. Got: {value}") from exc
+
+
+def _float_env(key: str, default: float) -> float:
+    value = os.getenv(key)
+    if value is None:
+        return float(default)
+    try:
+        return float(value)
+    except ValueError as exc:
+        raise RuntimeError(f"Environment variable {key} must be a float. Got: {value}") from exc
+
+
+def _create_default_queue() -> UploadQueue:
+    from database import db
+    from services.media_storage import media_storage
+    from services.thumbnails import thumbnails
+
+    return UploadQueue(
+        spool_dir=os.getenv(
+            "UPLOAD_SPOOL_DIR", str(Path(__file__).resolve().parents[1] / "data" / "upload_spool")
+        ),
+        storage=media_storage,
+        patcher=MongoPatcher(db),
+        workers=_int_env("UPLOAD_WORKERS", 2),
+        max_attempts=_int_env("UPLOAD_MAX_ATTEMPTS", 6),
+        retry_base=_float_env("UPLOAD_RETRY_BASE_SECONDS", 2.0),
+        retry_max=_float_env("UPLOAD_RETRY_MAX_SECONDS", 300.0),
+        done_retention=_float_env("UPLOAD_DONE_RETENTION_SECONDS", 86400.0),
+        recover_grace=_float_env("UPLOAD_RECOVER_GRACE_SECONDS", 60.0),
+        public_base_url=os.getenv("PUBLIC_BASE_URL", ""),
+        on_stored=thumbnails.schedule,
+    )
+
+
+# Shared by main.py and the routers; workers start with the app
+upload_queue = _create_default_queue()
@@ -0,0 +1,71 @@
+"""
+Compare blocking pymongo calls and motor under concurrent requests.
+
+Simulates --concurrency request handlers on one event loop, each doing
+--queries find_one lookups against the faces collection, first with the
+blocking client (what the handlers used to do) and then with motor, and
+prints throughput and p50/p99 latency for both, e.g.:
+
+    python tools/bench_async_mongo.py --concurrency 50 --queries 20
+
+Optionally add --slow-ms to mix in a $where sleep that stands in for one slow
+query, to show it no longer stalls every other handler on the loop.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import async_db, db
+
+
+async def _handler_sync(queries, slow_filter, latencies):
+    for i in range(queries):
+        started = time.perf_counter()
+        db["faces"].find_one(slow_filter if slow_filter and i == 0 else {}, {"name": 1})
+        latencies.append(time.perf_counter() - started)
+        await asyncio.sleep(0)
+
+
+async def _handler_async(queries, slow_filter, latencies):
+    for i in range(queries):
+        started = time.perf_counter()
+        await async_db["faces"].find_one(slow_filter if slow_filter and i == 0 else {}, {"name": 1})
+        latencies.append(time.perf_counter() - started)
+
+
+async def _run(handler, concurrency, queries, slow_filter):
+    latencies = []
+    started = time.perf_counter()
+    await asyncio.gather(*(handler(queries, slow_filter if n == 0 else None, latencies) for n in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    latencies = np.asarray(latencies) * 1000
+    return len(latencies) / elapsed, np.percentile(latencies, 50), np.percentile(latencies, 99), elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--slow-ms", type=int, default=0, help="Make one handler's first query take this long")
+    args = parser.parse_args()
+
+    slow_filter = {"$where": f"sleep({args.slow_ms}) || true"} if args.slow_ms else None
+
+    async def bench():
+        await async_db["faces"].find_one({})  # open the motor pool
+        print(f"{'client':>8} | {'queries/s':>10} | {'p50 ms':>8} | {'p99 ms':>8} | {'wall s':>7}")
+        for label, handler in (("pymongo", _handler_sync), ("motor", _handler_async)):
+            qps, p50, p99, elapsed = await _run(handler, args.concurrency, args.queries, slow_filter)
+            print(f"{label:>8} | {qps:10.1f} | {p50:8.2f} | {p99:8.2f} | {elapsed:7.2f}")
+
+    asyncio.run(bench())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Compare single-pass MTCNN with coarse-to-fine detection on real photos.
+
+For each image, runs the previous pipeline (resize to 800px, MTCNN over the
+full pyramid) and the coarse-to-fine pipeline (detect on a proxy, crop from
+the original), and reports mean per-stage timings plus the cosine similarity
+between the two embeddings, e.g.:
+
+    python tools/bench_face_detection.py photos/*.jpg --proxy-side 400 --repeat 5
+"""
+import argparse
+import os
+import sys
+import time
+from collections import defaultdict
+
+import numpy as np
+import torch
+from facenet_pytorch import MTCNN, InceptionResnetV1
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.face_detection import CoarseToFineDetector
+
+
+def _fit(img: Image.Image, max_side: int) -> Image.Image:
+    longest = max(img.width, img.height)
+    if longest <= max_side:
+        return img
+    ratio = max_side / longest
+    return img.resize((int(img.width * ratio), int(img.height * ratio)), Image.Resampling.LANCZOS)
+
+
+def _embed(facenet, face) -> np.ndarray:
+    emb = facenet(face.unsqueeze(0)).squeeze(0).numpy().astype("float32")
+    return emb / (np.linalg.norm(emb) + 1e-10)
+
+
+def _single_pass(path, mtcnn, facenet, timings):
+    started = time.perf_counter()
+    img = _fit(Image.open(path).convert("RGB"), 800)
+    timings["decode"] += time.perf_counter() - started
+
+    started = time.perf_counter()
+    face = mtcnn(img)
+    timings["detect+crop"] += time.perf_counter() - started
+    if face is None:
+        return None
+
+    started = time.perf_counter()
+    emb = _embed(facenet, face)
+    timings["embed"] += time.perf_counter() - started
+    return emb
+
+
+def _coarse_to_fine(path, detector, facenet, full_max_side, timings):
+    started = time.perf_counter()
+    img = Image.open(path)
+    img.draft("RGB", (full_max_side, full_max_side))
+    img = _fit(img.convert("RGB"), full_max_side)
+    timings["decode"] += time.perf_counter() - started
+
+    stage = {}
+    box, _, _ = detector.detect(img, stage)
+    if box is None:
+        for name, seconds in stage.items():
+            timings[name] += seconds
+        return None
+    face = detector.crop(img, box, stage)
+    for name, seconds in stage.items():
+        timings[name] += seconds
+
+    started = time.perf_counter()
+    emb = _embed(facenet, face)
+    timings["embed"] += time.perf_counter() - started
+    return emb
+
+
+def _report(title, timings, runs):
+    total = sum(timings.values())
+    print(f"\n{title}")
+    for name, seconds in timings.items():
+        print(f"  {name:>13}: {seconds / runs * 1000:8.1f} ms")
+    print(f"  {'total':>13}: {total / runs * 1000:8.1f} ms")
+    return total
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("images", nargs="+")
+    parser.add_argument("--proxy-side", type=int, default=400)
+    parser.add_argument("--min-face-fraction", type=float, default=0.06)
+    parser.add_argument("--full-max-side", type=int, default=1600)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    torch.set_num_threads(1)
+    mtcnn = MTCNN(image_size=160, margin=0, min_face_size=20, keep_all=False, post_process=True)
+    facenet = InceptionResnetV1(pretrained="vggface2").eval()
+    detector = CoarseToFineDetector(mtcnn, args.proxy_side, args.min_face_fraction)
+
+    baseline, c2f = defaultdict(float), defaultdict(float)
+    similarities = []
+    misses = {"single-pass": 0, "coarse-to-fine": 0}
+    runs = 0
+    with torch.no_grad():
+        for _ in range(args.repeat):
+            for path in args.images:
+                runs += 1
+                a = _single_pass(path, mtcnn, facenet, baseline)
+                b = _coarse_to_fine(path, detector, facenet, args.full_max_side, c2f)
+                misses["single-pass"] += a is None
+                misses["coarse-to-fine"] += b is None
+                if a is not None and b is not None:
+                    similarities.append(float(np.dot(a, b)))
+
+    base_total = _report("Single-pass MTCNN (800px)", baseline, runs)
+    c2f_total = _report(f"Coarse-to-fine (proxy {args.proxy_side}px, crop <= {args.full_max_side}px)", c2f, runs)
+    print(f"\nSpeedup: {base_total / max(c2f_total, 1e-9):.2f}x  misses: {misses}")
+    if similarities:
+        print(f"Embedding cosine single-pass vs coarse-to-fine: mean {np.mean(similarities):.4f}, min {np.min(similarities):.4f}")
+
+
+if __name__ == "__main__":
+    main()
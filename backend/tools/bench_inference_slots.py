@@ -0,0 +1,78 @@
+"""
+Throughput vs p99 latency for different inference slot x thread splits.
+
+Queues --requests FaceNet passes over random faces so every slot stays busy,
+and prints throughput and per-pass latency for each split of the detected
+CPU budget, e.g. on a 16-CPU node:
+
+    python tools/bench_inference_slots.py --requests 400
+    python tools/bench_inference_slots.py --splits 1x16,2x8,4x4,8x2,16x1
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import torch
+from facenet_pytorch import InceptionResnetV1
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.inference import FaceNetRunner
+from services.inference_pool import detect_cpu_budget
+
+
+def _default_splits(cpus: int):
+    splits = []
+    threads = 1
+    while threads <= cpus:
+        splits.append((cpus // threads, threads))
+        threads *= 2
+    return splits
+
+
+def _run_split(runner, inputs, slots, threads, requests):
+    def job(index):
+        started = time.perf_counter()
+        runner.embed_pixels(inputs[index % len(inputs)])
+        return time.perf_counter() - started
+
+    with ThreadPoolExecutor(max_workers=slots, initializer=torch.set_num_threads, initargs=(threads,)) as pool:
+        list(pool.map(job, range(slots * 2)))  # warm up every slot's buffers
+        started = time.perf_counter()
+        latencies = list(pool.map(job, range(requests)))
+        elapsed = time.perf_counter() - started
+    latencies = np.asarray(latencies) * 1000
+    return requests / elapsed, np.percentile(latencies, 50), np.percentile(latencies, 99)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--splits", default="", help="Comma-separated SLOTSxTHREADS, default: powers of two")
+    args = parser.parse_args()
+
+    cpus = detect_cpu_budget()
+    if args.splits:
+        splits = [tuple(int(v) for v in item.lower().split("x")) for item in args.splits.split(",")]
+    else:
+        splits = _default_splits(cpus)
+
+    rng = np.random.default_rng(0)
+    inputs = [rng.integers(0, 256, (160, 160, 3), dtype=np.uint8) for _ in range(32)]
+    model = InceptionResnetV1(pretrained="vggface2").eval()
+    model.requires_grad_(False)
+    runner = FaceNetRunner(model, torch.device("cpu"))
+
+    print(f"CPU budget: {cpus} (affinity and cgroup quota)\n")
+    print(f"{'slots x threads':>15} | {'req/s':>8} | {'p50 ms':>8} | {'p99 ms':>8}")
+    for slots, threads in splits:
+        throughput, p50, p99 = _run_split(runner, inputs, slots, threads, args.requests)
+        print(f"{f'{slots} x {threads}':>15} | {throughput:8.1f} | {p50:8.1f} | {p99:8.1f}")
+    print("\np50/p99 are per-pass service times; set INFERENCE_SLOTS and INFERENCE_THREADS_PER_SLOT accordingly.")
+
+
+if __name__ == "__main__":
+    main()
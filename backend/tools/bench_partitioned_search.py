@@ -0,0 +1,82 @@
+"""
+Benchmark partitioned gallery search across 1..N worker processes.
+
+Builds a synthetic embedding store of --rows random unit vectors and reports
+p50/p99 latency and speedup for each partition count, e.g.:
+
+    python tools/bench_partitioned_search.py --rows 1000000 --max-partitions 8
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.embedding_store import EmbeddingStore, search_rows
+from services.parallel_search import PartitionedSearcher
+
+
+def _synthetic_rows(rows: int, dim: int, seed: int):
+    rng = np.random.default_rng(seed)
+    batch = 10000
+    for start in range(0, rows, batch):
+        block = rng.standard_normal((min(batch, rows - start), dim)).astype("float32")
+        block /= np.linalg.norm(block, axis=1, keepdims=True)
+        for offset, vector in enumerate(block):
+            yield f"{start + offset:024x}", f"{start + offset:024x}", vector
+
+
+def _time_queries(search, queries):
+    timings = []
+    for query in queries:
+        started = time.perf_counter()
+        search(query)
+        timings.append((time.perf_counter() - started) * 1000)
+    return np.percentile(timings, 50), np.percentile(timings, 99)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--max-partitions", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk-rows", type=int, default=4096)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = EmbeddingStore(directory, chunk_rows=args.chunk_rows)
+        print(f"📦 Building synthetic store with {args.rows} embeddings...")
+        store.rebuild(_synthetic_rows(args.rows, store.dim, seed=0), expected_rows=args.rows)
+
+        rng = np.random.default_rng(1)
+        queries = rng.standard_normal((args.queries, store.dim)).astype("float32")
+        queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+        base_p50, base_p99 = _time_queries(
+            lambda q: search_rows(store._embeddings, store._ids, store.count, q, args.k, args.chunk_rows),
+            queries,
+        )
+        print(f"\n{'partitions':>10} | {'p50 ms':>9} | {'p99 ms':>9} | {'speedup':>7}")
+        print(f"{'in-proc':>10} | {base_p50:9.2f} | {base_p99:9.2f} | {1.0:7.2f}")
+
+        for partitions in range(1, args.max_partitions + 1):
+            searcher = PartitionedSearcher(partitions, chunk_rows=args.chunk_rows)
+            try:
+                # Warm up: spawn workers and let each map its slice
+                for query in queries[:partitions]:
+                    searcher.search(store, query, args.k)
+                p50, p99 = _time_queries(lambda q: searcher.search(store, q, args.k), queries)
+            finally:
+                searcher.stop()
+            print(f"{partitions:>10} | {p50:9.2f} | {p99:9.2f} | {base_p50 / p50:7.2f}")
+
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Create, inspect and load binary gallery snapshots (see services/snapshot.py).
+
+    python tools/gallery_snapshot.py export gallery.snap                 # from MongoDB
+    python tools/gallery_snapshot.py export gallery.snap --from-store    # from EMBEDDING_STORE_DIR
+    python tools/gallery_snapshot.py info gallery.snap
+    python tools/gallery_snapshot.py import gallery.snap --store-dir /data/embedding_store
+
+``import`` writes a ready-to-open embedding store. Run it while the node is
+stopped, or point a new node at the file with EMBEDDING_SNAPSHOT_SOURCE. The
+store then tails the change feed from the snapshot's sequence number on
+startup. ``--shard i/n`` keeps only the rows owned by shard i of n.
+"""
+import argparse
+import os
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+import numpy as np
+
+from services import snapshot
+from services.embedding_store import EmbeddingStore
+
+DEFAULT_STORE_DIR = os.getenv("EMBEDDING_STORE_DIR", os.path.join(BACKEND_DIR, "data", "embedding_store"))
+
+
+def _print_info(info: snapshot.SnapshotInfo, path: str):
+    size = os.path.getsize(path) / (1024 * 1024)
+    print(f"{path}: v{info.version}, {info.rows} rows x {info.dim}, change seq {info.change_seq}, {size:.1f} MB")
+    print(f"  created {info.meta.get('created_at')} from {info.meta.get('source') or 'unknown'}")
+
+
+def export(args):
+    started = time.perf_counter()
+    if args.from_store:
+        # Read-only: a running node keeps the store's writer lock
+        store = EmbeddingStore(args.store_dir, read_only=True)
+        if not store.open():
+            sys.exit(f"No embedding store at {args.store_dir}")
+        chunks, change_seq = snapshot.store_chunks(store)
+        source = "store"
+    else:
+        from database import db
+        from services import face_embeddings
+        from services.change_feed import ChangeFeed
+
+        change_seq = ChangeFeed(db).latest_seq()
+        chunks = snapshot.row_chunks(face_embeddings.iter_embeddings(db["face_embeddings"]))
+        source = "mongo"
+    info = snapshot.write_snapshot(args.path, chunks, change_seq, source=source)
+    _print_info(info, args.path)
+    print(f"Exported in {time.perf_counter() - started:.1f}s")
+
+
+def load(args):
+    row_filter = None
+    if args.shard:
+        from services.cluster import shard_for
+
+        index, count = (int(part) for part in args.shard.split("/"))
+        row_filter = lambda ids: np.fromiter(  # noqa: E731
+            (shard_for(face_id.decode("ascii"), count) == index for face_id in ids["face_id"]),
+            dtype=bool, count=len(ids),
+        )
+    started = time.perf_counter()
+    store = EmbeddingStore(args.store_dir)
+    info = snapshot.restore_snapshot(store, args.path, verify=not args.no_verify, row_filter=row_filter)
+    store.close()
+    _print_info(info, args.path)
+    print(f"Loaded {store.count} rows into {args.store_dir} in {time.perf_counter() - started:.1f}s")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("export", help="Write a snapshot")
+    p.add_argument("path")
+    p.add_argument("--from-store", action="store_true", help="Read the local embedding store instead of MongoDB")
+    p.add_argument("--store-dir", default=DEFAULT_STORE_DIR)
+    p.set_defaults(func=export)
+
+    p = sub.add_parser("import", help="Replace an embedding store with a snapshot")
+    p.add_argument("path")
+    p.add_argument("--store-dir", default=DEFAULT_STORE_DIR)
+    p.add_argument("--shard", help="Keep only shard i of n, as 'i/n'")
+    p.add_argument("--no-verify", action="store_true", help="Skip the checksum pass")
+    p.set_defaults(func=load)
+
+    p = sub.add_parser("info", help="Print a snapshot's header")
+    p.add_argument("path")
+    p.set_defaults(func=lambda args: _print_info(snapshot.read_info(args.path), args.path))
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
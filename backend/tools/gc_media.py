@@ -0,0 +1,91 @@
+"""
+Remove objects from the local media store that no document references.
+
+The local store (MEDIA_STORAGE=local, MEDIA_LOCAL_DIR) is content-addressed:
+identical uploads share one object, so deleting a face, sketch or asset
+never deletes its file. This sweeps objects that appear neither in the image
+URL fields nor among the thumbnails of a referenced image. Files younger
+than --min-age-hours are skipped, so an upload whose document is still being
+written is never collected.
+
+    python tools/gc_media.py --dry-run
+    python tools/gc_media.py --min-age-hours 24
+"""
+import argparse
+import os
+import sys
+import time
+from typing import Optional
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from database import db
+from services.media_storage import OBJECTS_PATH, LocalMediaStorage, create_storage
+
+# (collection, field) pairs that hold media URLs
+URL_FIELDS = [
+    ("faces", "image_urls"),
+    ("face_embeddings", "image_url"),
+    ("sketches", "image_url"),
+    ("sketches", "cloudinary_url"),
+    ("assets", "cloudinary_url"),
+]
+
+
+def _object_name(url) -> Optional[str]:
+    marker = OBJECTS_PATH + "/"
+    return url.rsplit("/", 1)[-1] if isinstance(url, str) and marker in url else None
+
+
+def referenced_objects(dry_run: bool) -> set:
+    """Objects referenced by documents, plus the thumbnails of those originals.
+
+    Thumbnail records (media_derivatives) whose original is no longer
+    referenced are dropped, so their derivatives become collectable.
+    """
+    urls = set()
+    for collection, field in URL_FIELDS:
+        urls.update(url for url in db[collection].distinct(field) if isinstance(url, str))
+    names = {name for name in map(_object_name, urls) if name}
+
+    stale = []
+    for doc in db["media_derivatives"].find({}, {"thumbnails": 1}):
+        if doc["_id"] not in urls:
+            stale.append(doc["_id"])
+            continue
+        for by_format in (doc.get("thumbnails") or {}).values():
+            names.update(name for name in map(_object_name, by_format.values()) if name)
+    if stale and not dry_run:
+        db["media_derivatives"].delete_many({"_id": {"$in": stale}})
+    print(f"{len(stale)} thumbnail records belong to deleted images")
+    return names
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would be removed")
+    parser.add_argument("--min-age-hours", type=float, default=1.0)
+    args = parser.parse_args()
+
+    storage = create_storage()
+    if not isinstance(storage, LocalMediaStorage):
+        sys.exit("MEDIA_STORAGE is not 'local'; nothing to collect")
+
+    referenced = referenced_objects(args.dry_run)
+    cutoff = time.time() - args.min_age_hours * 3600
+    kept = removed = freed = 0
+    for path in list(storage.objects()):
+        if path.name in referenced or path.stat().st_mtime > cutoff:
+            kept += 1
+            continue
+        removed += 1
+        freed += path.stat().st_size
+        if not args.dry_run:
+            path.unlink()
+    verb = "Would remove" if args.dry_run else "Removed"
+    print(f"{verb} {removed} objects ({freed / (1024 * 1024):.1f} MB); kept {kept}")
+
+
+if __name__ == "__main__":
+    main()
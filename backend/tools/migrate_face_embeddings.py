@@ -0,0 +1,39 @@
+"""
+Move face embeddings out of the faces documents into face_embeddings.
+
+Older deployments stored every embedding in a parallel ``embeddings`` array on
+each ``faces`` document. This copies each entry into its own face_embeddings
+document (keeping the matching image URL) and then removes the array. The API
+also runs this on startup; run it by hand before deploying several workers so
+they do not race on the same documents. Re-running is safe.
+
+    python tools/migrate_face_embeddings.py
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import db
+from services import face_embeddings
+from services.change_feed import ChangeFeed
+
+
+def main() -> None:
+    faces = db["faces"]
+    embeddings = db["face_embeddings"]
+
+    pending = faces.count_documents({"embeddings": {"$exists": True}})
+    if not pending:
+        print("✅ No faces with legacy embedding arrays. Nothing to migrate.")
+        return
+
+    print(f"📦 Migrating {pending} faces to per-image embedding documents...")
+    face_embeddings.ensure_indexes(embeddings)
+    migrated = face_embeddings.migrate_legacy_faces(faces, embeddings, ChangeFeed(db))
+    print(f"✅ Migrated {migrated} faces ({embeddings.estimated_document_count()} embedding documents total).")
+    print("Embedding stores written before this layout are rebuilt automatically on the next start.")
+
+
+if __name__ == "__main__":
+    main()
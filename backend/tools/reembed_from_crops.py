@@ -0,0 +1,126 @@
+"""
+Re-embed the gallery from cached aligned crops.
+
+Reads the 160x160 crops referenced by face_embeddings.crop_sha256 from the
+crop store (CROP_STORE_DIR, default backend/data/face_crops), runs FaceNet on
+them in batches and writes the new vectors back. No Cloudinary downloads and
+no MTCNN, so a model upgrade is a pure CPU batch job. Each changed face gets
+an ``upsert`` change-feed record so running replicas patch their index.
+
+    python tools/reembed_from_crops.py --dry-run          # report drift only
+    python tools/reembed_from_crops.py --batch-size 128
+    python tools/reembed_from_crops.py --gc               # drop unreferenced crops
+
+Embeddings enrolled before the crop cache existed have no crop; they are
+counted and left unchanged.
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import torch
+from facenet_pytorch import InceptionResnetV1
+from pymongo import UpdateOne
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from database import db
+from services import face_embeddings
+from services.change_feed import ChangeFeed, OP_UPSERT
+from services.crop_store import CropStore, tensor_from_crops
+
+
+def _flush(batch, model, embeddings, dry_run, stats, touched):
+    crops = np.stack([crop for _, crop in batch])
+    with torch.no_grad():
+        vectors = model(tensor_from_crops(crops)).numpy().astype("float32")
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-10
+
+    updates = []
+    for (doc, _), vector in zip(batch, vectors):
+        stats["cosine"].append(float(np.dot(face_embeddings.decode_vector(doc["embedding"]), vector)))
+        updates.append(UpdateOne(
+            {"_id": doc["_id"], "crop_sha256": doc["crop_sha256"]},
+            {"$set": {"embedding": face_embeddings.encode_vector(vector)}},
+        ))
+        touched.add(str(doc["face_id"]))
+    if not dry_run:
+        embeddings.bulk_write(updates, ordered=False)
+    stats["embedded"] += len(batch)
+
+
+def _collect_garbage(embeddings, crop_store: CropStore) -> int:
+    referenced = set(embeddings.distinct("crop_sha256", {"crop_sha256": {"$exists": True}}))
+    removed = 0
+    for digest in list(crop_store.digests()):
+        if digest not in referenced:
+            crop_store.delete(digest)
+            removed += 1
+    return removed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--pretrained", default="vggface2", help="FaceNet weights (vggface2 or casia-webface)")
+    parser.add_argument("--threads", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--dry-run", action="store_true", help="Compute and compare, but do not write")
+    parser.add_argument("--gc", action="store_true", help="Delete crops no embedding document references")
+    args = parser.parse_args()
+
+    embeddings = db["face_embeddings"]
+    crop_store = CropStore(os.getenv("CROP_STORE_DIR", os.path.join(BACKEND_DIR, "data", "face_crops")))
+
+    if args.gc:
+        removed = _collect_garbage(embeddings, crop_store)
+        print(f"🧹 Removed {removed} unreferenced crops")
+        return
+
+    torch.set_num_threads(max(1, args.threads))
+    print(f"📥 Loading FaceNet ({args.pretrained})...")
+    model = InceptionResnetV1(pretrained=args.pretrained).eval()
+
+    stats = {"embedded": 0, "missing": 0, "legacy": 0, "cosine": []}
+    touched = set()
+    stats["legacy"] = embeddings.count_documents({"crop_sha256": {"$exists": False}})
+    cursor = embeddings.find(
+        {"crop_sha256": {"$exists": True}}, {"face_id": 1, "embedding": 1, "crop_sha256": 1}
+    ).sort("_id", 1).batch_size(args.batch_size * 4)
+
+    started = time.perf_counter()
+    batch = []
+    try:
+        for doc in cursor:
+            crop = crop_store.get(doc["crop_sha256"])
+            if crop is None:
+                stats["missing"] += 1
+                continue
+            batch.append((doc, crop))
+            if len(batch) >= args.batch_size:
+                _flush(batch, model, embeddings, args.dry_run, stats, touched)
+                batch = []
+                print(f"  {stats['embedded']} embedded ({stats['embedded'] / (time.perf_counter() - started):.1f}/s)")
+        if batch:
+            _flush(batch, model, embeddings, args.dry_run, stats, touched)
+    finally:
+        cursor.close()
+
+    elapsed = time.perf_counter() - started
+    if not args.dry_run:
+        feed = ChangeFeed(db)
+        for face_id in touched:
+            feed.record(OP_UPSERT, face_id)
+
+    print(f"\n{'Would re-embed' if args.dry_run else 'Re-embedded'} {stats['embedded']} images "
+          f"of {len(touched)} faces in {elapsed:.1f}s")
+    print(f"Skipped: {stats['legacy']} without a cached crop, {stats['missing']} with a missing crop file")
+    if stats["cosine"]:
+        cosine = np.asarray(stats["cosine"])
+        print(f"Cosine old vs new: mean {cosine.mean():.4f}, min {cosine.min():.4f}")
+
+
+if __name__ == "__main__":
+    main()
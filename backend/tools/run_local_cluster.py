@@ -0,0 +1,77 @@
+"""
+Run a scatter-gather cluster on one Linux box for local testing.
+
+Starts --shards shard nodes (CLUSTER_ROLE=shard) on consecutive ports after
+--base-port, each with its own embedding store directory, plus one coordinator
+(CLUSTER_ROLE=coordinator) on --base-port that fans /recognize_face out to them.
+All nodes share the MongoDB configured in backend/.env. Ctrl+C stops everything.
+
+    python tools/run_local_cluster.py --shards 3 --base-port 8100
+"""
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _start_node(port: int, env: dict) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port)],
+        cwd=BACKEND_DIR,
+        env={**os.environ, **env},
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--shards", type=int, default=3)
+    parser.add_argument("--base-port", type=int, default=8100)
+    parser.add_argument("--timeout", type=float, default=2.0, help="Per-shard timeout in seconds")
+    parser.add_argument("--token", default="local-cluster", help="Shared X-Shard-Token value")
+    args = parser.parse_args()
+
+    processes = []
+    shard_urls = []
+    try:
+        for index in range(args.shards):
+            port = args.base_port + 1 + index
+            shard_urls.append(f"http://127.0.0.1:{port}")
+            processes.append(_start_node(port, {
+                "CLUSTER_ROLE": "shard",
+                "SHARD_INDEX": str(index),
+                "SHARD_COUNT": str(args.shards),
+                "SHARD_TOKEN": args.token,
+                "EMBEDDING_STORE_DIR": os.path.join(BACKEND_DIR, "data", f"shard-{index}"),
+            }))
+            print(f"🚀 Shard {index} on port {port}")
+
+        processes.append(_start_node(args.base_port, {
+            "CLUSTER_ROLE": "coordinator",
+            "SHARD_URLS": ",".join(shard_urls),
+            "SHARD_TIMEOUT_SECONDS": str(args.timeout),
+            "SHARD_TOKEN": args.token,
+        }))
+        print(f"🚀 Coordinator on port {args.base_port} -> {', '.join(shard_urls)}")
+        print("Stop a shard process to see partial results reported by /recognize_face.")
+
+        while all(process.poll() is None for process in processes):
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for process in processes:
+            if process.poll() is None:
+                process.send_signal(signal.SIGINT)
+        for process in processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+if __name__ == "__main__":
+    main()